@@ -0,0 +1 @@
+"""Host-side simulator of the conditioning rig; see README.md."""
@@ -0,0 +1,87 @@
+"""
+Runs the firmware in the simulator.
+
+    python -m sim --seconds 600 --keys "# 25 # #"
+    python -m sim --seconds 600 --pty      # then: python tools/link_client.py PTY
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from .runner import Simulation
+
+
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sim", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60.0, help="virtual run time")
+    parser.add_argument("--keys", default="", help="keys to type, spaces ignored")
+    parser.add_argument("--key-start", type=float, default=1.0, help="virtual time of the first key")
+    parser.add_argument("--key-interval", type=float, default=0.3, help="seconds between keys")
+    parser.add_argument("--mode", help="start main.py in this mode instead of the menu")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="override a main.py global before it starts (JSON value)")
+    parser.add_argument("--noise", type=float, default=0.0, help="level probe noise, volts rms")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--flash", help="directory standing in for the Pico's flash")
+    parser.add_argument("--quiet", action="store_true", help="hide the firmware's prints")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--serial", metavar="FILE",
+                        help="save the firmware's binary serial output (telemetry) to FILE")
+    parser.add_argument("--pty", action="store_true",
+                        help="put the firmware's serial port on a pseudo-terminal and run in "
+                             "real time, for tools/link_client.py")
+    args = parser.parse_args(argv)
+    if args.serial:
+        # The simulation runs in the flash directory
+        args.serial = os.path.abspath(args.serial)
+
+    sim = Simulation(args.seconds, noise_v=args.noise, seed=args.seed, flash_dir=args.flash)
+    if args.mode:
+        sim.overrides["mode"] = args.mode
+    for item in args.set:
+        name, _, value = item.partition("=")
+        sim.overrides[name] = parse_value(value)
+    if args.keys:
+        sim.type_keys(args.keys, args.key_start, args.key_interval)
+    if args.pty:
+        sys.stderr.write("serial port on %s\n" % sim.attach_pty())
+        sys.stderr.flush()
+    sim.install()
+    sim.run_main(quiet=args.quiet or args.json)
+    report = sim.report()
+    if args.serial:
+        with open(args.serial, "wb") as f:
+            f.write(sim.serial)
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print("virtual %.1f s in %.2f s wall (%.0fx)" % (report["virtual_s"], report["wall_s"],
+                                                       report["speedup"] or 0))
+        if report["error"]:
+            print("firmware error:", report["error"])
+        print("+" + "-" * 20 + "+")
+        for line in report["lcd"]:
+            print("|" + line + "|")
+        print("+" + "-" * 20 + "+")
+        for name in ("heater", "cooler", "main"):
+            tank = report["plant"][name]
+            print("%-7s level %5.1f%%  %6.2f C  overflow %.2f L" % (
+                name, tank["level"] * 100, tank["temp_c"], tank["overflow_l"]))
+        for bus, stats in report["i2c"].items():
+            print("i2c%s: %d transactions, %d bytes" % (bus, stats["transactions"], stats["bytes"]))
+    return 1 if report["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""Register model of an ADS1115.
+
+Conversions take their nominal time at the configured data rate (scaled by
+``osc_error`` to model the internal oscillator tolerance), and the OS bit of
+the config register reads 0 while one is running. The conversion register
+latches the input voltage when a conversion completes.
+
+The comparator runs on every completed conversion, with the queue, latch,
+polarity and mode bits of the config register, and drives the ALERT/RDY
+pin if one is wired. In continuous mode conversions go on without bus
+traffic, so the model then follows the clock on its own.
+
+``read_faults`` makes that many following reads fail with EIO, as a
+transfer the chip didn't acknowledge.
+"""
+
+import errno
+
+RATES_SPS = (8, 16, 32, 64, 128, 250, 475, 860)
+FULL_SCALE_V = (6.144, 4.096, 2.048, 1.024, 0.512, 0.256, 0.256, 0.256)
+
+REG_CONVERT = 0
+REG_CONFIG = 1
+REG_LOTHRESH = 2
+REG_HITHRESH = 3
+
+
+class ADS1115:
+    def __init__(self, clock, inputs, osc_error=0.0, alert=None):
+        self.clock = clock
+        # inputs(ain) -> volts on AIN0..AIN3
+        self.inputs = inputs
+        self.osc_error = osc_error
+        self.pointer = 0
+        self.config = 0x0583
+        self.lo_thresh = 0x8000
+        self.hi_thresh = 0x7FFF
+        self.conv = 0
+        self.busy_until = None
+        self.next_conv = None
+        self.conversions = 0
+        self.early_reads = 0
+        self.read_faults = 0
+        self.failed_reads = 0
+        # Comparator: consecutive conversions beyond the thresholds, and
+        # whether ALERT/RDY is asserted
+        self.alert = alert
+        self.exceed = 0
+        self.asserted = False
+        self.alerts = 0
+        if alert is not None:
+            # Open drain with a pull-up: high while not asserted
+            alert.drive(1)
+        clock.steppers.append(self.advance)
+
+    # Config fields
+
+    def _mux(self):
+        return (self.config >> 12) & 7
+
+    def _continuous(self):
+        return not self.config & 0x0100
+
+    def _period_us(self):
+        sps = RATES_SPS[(self.config >> 5) & 7]
+        return 1e6 / sps * (1 + self.osc_error)
+
+    def _sample(self):
+        mux = self._mux()
+        if mux >= 4:
+            volts = self.inputs(mux - 4)
+        else:
+            pos, neg = ((0, 1), (0, 3), (1, 3), (2, 3))[mux]
+            volts = self.inputs(pos) - self.inputs(neg)
+        fsr = FULL_SCALE_V[(self.config >> 9) & 7]
+        code = int(volts / fsr * 32768)
+        return max(-32768, min(32767, code))
+
+    def _complete(self):
+        self.conv = self._sample()
+        self.conversions += 1
+        self._compare()
+
+    def _compare(self):
+        queue = self.config & 3
+        if queue == 3:
+            return
+        conv = self.conv
+        hi = self.hi_thresh - 0x10000 if self.hi_thresh & 0x8000 else self.hi_thresh
+        lo = self.lo_thresh - 0x10000 if self.lo_thresh & 0x8000 else self.lo_thresh
+        window = self.config & 0x0010
+        if conv > hi or (window and conv < lo):
+            self.exceed += 1
+            if self.exceed >= (1, 2, 4)[queue] and not self.asserted:
+                self.asserted = True
+                self.alerts += 1
+        else:
+            self.exceed = 0
+            # Traditional mode releases below the low threshold only;
+            # latching keeps ALERT until the conversion register is read
+            if (window or conv < lo) and not self.config & 0x0004:
+                self.asserted = False
+        self._drive()
+
+    def _drive(self):
+        if self.alert is None:
+            return
+        active_high = self.config & 0x0008
+        self.alert.drive(not self.asserted if not active_high else self.asserted)
+
+    def advance(self, now_us):
+        # Clock stepper: runs due conversions while nobody reads the chip
+        if self.next_conv is not None and now_us >= self.next_conv:
+            self._update()
+
+    def _update(self):
+        now = self.clock.now_us
+        if self.busy_until is not None and now >= self.busy_until:
+            self.busy_until = None
+            self._complete()
+        if self.next_conv is not None:
+            while now >= self.next_conv:
+                self._complete()
+                self.next_conv += self._period_us()
+
+    # Bus side
+
+    def write(self, data, start_us=None, byte_us=None):
+        self._update()
+        if not data:
+            return
+        self.pointer = data[0] & 3
+        if len(data) >= 3:
+            self._write_register(self.pointer, (data[1] << 8) | data[2])
+
+    def read(self, nbytes):
+        self._update()
+        if self.read_faults:
+            self.read_faults -= 1
+            self.failed_reads += 1
+            raise OSError(errno.EIO)
+        if self.pointer == REG_CONVERT:
+            value = self.conv & 0xFFFF
+            if self.busy_until is not None:
+                self.early_reads += 1
+            if self.asserted and self.config & 0x0004:
+                self.asserted = False
+                self._drive()
+        elif self.pointer == REG_CONFIG:
+            value = self.config | (0 if self.busy_until is not None else 0x8000)
+        elif self.pointer == REG_LOTHRESH:
+            value = self.lo_thresh
+        else:
+            value = self.hi_thresh
+        return bytes((value >> 8, value & 0xFF))[:nbytes]
+
+    def _write_register(self, reg, value):
+        if reg == REG_CONFIG:
+            self.config = value & 0x7FFF
+            if (value & 3) == 3:
+                # Comparator off: ALERT/RDY goes high impedance
+                self.exceed = 0
+                self.asserted = False
+                if self.alert is not None:
+                    self.alert.drive(1)
+            else:
+                self._drive()
+            if self._continuous():
+                self.busy_until = None
+                self.next_conv = self.clock.now_us + self._period_us()
+            else:
+                self.next_conv = None
+                if value & 0x8000:
+                    self.busy_until = self.clock.now_us + self._period_us()
+        elif reg == REG_LOTHRESH:
+            self.lo_thresh = value
+        elif reg == REG_HITHRESH:
+            self.hi_thresh = value
@@ -0,0 +1,441 @@
+"""
+Benchmarks the firmware in the simulator.
+
+    python -m sim.bench -o before.json
+    python -m sim.bench -o after.json
+    python -m sim.bench --compare before.json after.json
+
+Each scenario runs src/main.py in a fresh process. Times are virtual (what
+the Pico would see, bus and sleep time included) unless named host_*, which
+is CPython time spent in the firmware function and only meaningful as a
+relative number between two runs on the same machine.
+"""
+
+import argparse
+import json
+import os
+import struct
+import subprocess
+import sys
+from time import perf_counter
+
+from .runner import SRC_DIR, Simulation
+
+# Scenario name -> virtual run time in seconds
+SCENARIOS = {"fuzzy": 300.0, "link": 300.0, "interlock": 120.0,
+             "interlock_fault": 120.0, "keypad": 30.0}
+
+LINK_RATE_HZ = 10
+
+
+def summarize(values, scale=1.0):
+    """Percentiles (nearest rank) of a list of numbers, scaled."""
+    if not values:
+        return {"n": 0}
+    ordered = sorted(values)
+    n = len(ordered)
+
+    def pct(p):
+        return round(ordered[min(n - 1, int(p / 100 * n))] * scale, 3)
+    return {
+        "n": n,
+        "mean": round(sum(ordered) / n * scale, 3),
+        "p50": pct(50),
+        "p90": pct(90),
+        "p99": pct(99),
+        "max": round(ordered[-1] * scale, 3),
+    }
+
+
+def diffs(times):
+    return [b - a for a, b in zip(times, times[1:])]
+
+
+class Probe:
+    """
+    Replaces a firmware function with a wrapper that records, per call, the
+    virtual start time and duration, the I2C transactions it made and the
+    host time it took.
+    """
+
+    def __init__(self, sim, owner, attr):
+        self.clock = sim.clock
+        self.buses = list(sim.board.i2c_buses.values())
+        self.starts = []
+        self.virtual_us = []
+        self.host_us = []
+        self.transactions = []
+        fn = getattr(owner, attr)
+
+        def wrapper(*args, **kwargs):
+            start = self.clock.now_us
+            tx = sum(bus.transactions for bus in self.buses)
+            host = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.host_us.append((perf_counter() - host) * 1e6)
+                self.starts.append(start)
+                self.virtual_us.append(self.clock.now_us - start)
+                self.transactions.append(sum(bus.transactions for bus in self.buses) - tx)
+        setattr(owner, attr, wrapper)
+
+    def stats(self, nominal_s=None):
+        periods = diffs(self.starts)
+        out = {
+            "calls": len(self.starts),
+            "period_ms": summarize(periods, 1e-3),
+            "duration_ms": summarize(self.virtual_us, 1e-3),
+            "i2c_per_call": summarize(self.transactions),
+            "host_us": summarize(self.host_us),
+        }
+        if nominal_s is not None:
+            out["jitter_ms"] = summarize([abs(p - nominal_s * 1e6) for p in periods], 1e-3)
+        return out
+
+
+def install_probes(sim):
+    # Importing the firmware modules here runs their hardware setup against
+    # the simulated board, exactly as main.py's own imports would
+    import fuzzy_control
+    import interlocks
+    import lcd_display
+    import sensors
+    import serial_link
+
+    probes = {
+        "interlock_pass": Probe(sim, interlocks, "apply_interlocks"),
+        "fuzzy_evaluate": Probe(sim, fuzzy_control.FuzzyController, "infer"),
+        "display_flush": Probe(sim, lcd_display, "flush"),
+        "temp_poll": Probe(sim, sensors.sampler, "poll"),
+        "link_poll": Probe(sim, serial_link.SerialLink, "poll"),
+    }
+
+    # control_task() reads the main temperature once per iteration; the
+    # stamps it gets back are the samples its dt is computed from
+    control = {"times": [], "stamps": []}
+    latest = sensors.sampler.latest
+
+    def latest_probe(name):
+        value = latest(name)
+        if name == "main":
+            control["times"].append(sim.clock.now_us)
+            control["stamps"].append(value[1])
+        return value
+    sensors.sampler.latest = latest_probe
+    return probes, control
+
+
+# Scenarios: each scripts the run before the firmware starts
+
+def scenario_fuzzy(sim):
+    """Fuzzy control at 25 C, started from the keypad, for 300 s."""
+    sim.type_keys("# 25 # #", start_s=1.0, interval_s=0.3)
+
+
+def scenario_link(sim):
+    """As fuzzy, with a host streaming every serial link variable at 10 Hz."""
+    scenario_fuzzy(sim)
+    if SRC_DIR not in sys.path:
+        sys.path.append(SRC_DIR)
+    import serial_link
+    period = int(1000 / LINK_RATE_HZ)
+    sim.send_serial(2.0, serial_link.encode(serial_link.SUBSCRIBE, 1,
+                                            struct.pack("<HI", period, 0xFFFFFFFF)))
+    # The firmware imports its own, against the simulated time module
+    del sys.modules["serial_link"]
+
+
+def link_stream(sim):
+    # The STREAM frames in the firmware's serial output
+    import serial_link
+    parser = serial_link.Parser()
+    ticks = []
+    acks = 0
+    for byte in sim.serial:
+        while True:
+            kind = parser.feed(byte)
+            if kind == serial_link.STREAM:
+                ticks.append(struct.unpack_from("<I", parser.buf, serial_link.HEADER_SIZE)[0])
+            elif kind == serial_link.ACK:
+                acks += 1
+            if not parser.pending():
+                break
+            byte = parser.take()
+    return {
+        "frames": len(ticks),
+        "acks": acks,
+        "bad_frames": parser.errors,
+        "period_ms": summarize(diffs(ticks)),
+    }
+
+
+# Level steps of the interlock scenarios: (seconds, tank name, fraction)
+INTERLOCK_STEPS = (
+    (10, "heater", 0.9), (10.5, "cooler", 0.9),
+    (20, "main", 0.9),
+    (30, "heater", 0.1), (30.5, "cooler", 0.1),
+    (40, "main", 0.1),
+    (50, "main", 0.9), (55, "heater", 0.9),
+    (60, "main", 0.5), (65, "cooler", 0.95),
+    (70, "main", 0.1), (75, "heater", 0.05),
+)
+
+
+def scenario_interlock(sim):
+    """Level steps across every probe; time from crossing to relay/servo."""
+    plant = sim.rig.plant
+    for t, tank, fraction in INTERLOCK_STEPS:
+        tank = getattr(plant, tank)
+        sim.at(t, lambda tank=tank, fraction=fraction: plant.set_level(tank, fraction))
+
+
+def scenario_interlock_fault(sim):
+    """As interlock, with the first level read after every step failing."""
+    scenario_interlock(sim)
+    rig = sim.rig
+    chips = {"heater": rig.adc1, "cooler": rig.adc1, "main": rig.adc2}
+    # Queued after the level steps, so each fault hits the scan the
+    # crossing brings on
+    for t, tank, _ in INTERLOCK_STEPS:
+        sim.at(t, lambda chip=chips[tank]: setattr(chip, "read_faults", 1))
+
+
+def scenario_keypad(sim):
+    """Menu navigation; time from key press to the first LCD change."""
+    sim.type_keys("BBBBAAAA" * 6, start_s=2.0, interval_s=0.5)
+
+
+def reaction_latencies(sim, outputs):
+    """
+    Pairs every probe crossing the firmware must react to with the first
+    change of the output it drives.
+    """
+    # (tank, height, rising) -> (output, value it must go to)
+    rules = {
+        ("heater", 0.85, True): ("relay1", 1),
+        ("heater", 0.2, False): ("relay1", 0),
+        ("cooler", 0.85, True): ("relay2", 1),
+        ("cooler", 0.2, False): ("relay2", 0),
+        ("main", 0.85, True): ("servo_utama", "open"),
+        ("main", 0.2, False): ("servo_utama", "closed"),
+    }
+    valve = sim.rig.plant.valves["utama"]
+    latencies = []
+    missed = 0
+    crossings = sim.rig.plant.crossings
+    for i, (t, tank, height, rising) in enumerate(crossings):
+        rule = rules.get((tank, height, rising))
+        if rule is None:
+            continue
+        output, want = rule
+        if want == "open":
+            want = valve.open_duty
+        elif want == "closed":
+            want = valve.closed_duty
+        events = outputs[output]
+        before = [v for et, v in events if et < t]
+        if before and before[-1] == want:
+            continue    # Already there: nothing to react to
+        # The window ends when the water passes this probe again
+        until = next((ct for ct, ctank, cheight, _ in crossings[i + 1:]
+                      if ctank == tank and cheight == height), None)
+        hit = next((et for et, v in events
+                    if et >= t and v == want and (until is None or et < until)), None)
+        if hit is None:
+            missed += 1
+        else:
+            latencies.append(hit - t)
+    return latencies, missed
+
+
+def run_scenario(name, dual_core=False):
+    sim = Simulation(SCENARIOS[name])
+    globals()["scenario_" + name](sim)
+    if dual_core:
+        sim.overrides["DUAL_CORE"] = True
+
+    outputs = {"relay1": [], "relay2": [], "servo_utama": []}
+    for output, pin_id in (("relay1", 11), ("relay2", 10)):
+        sim.board.pin(pin_id).listeners.append(
+            lambda pin, level, events=outputs[output]: events.append((sim.clock.now_us, level)))
+    sim.board.pwm(14).listeners.append(
+        lambda pwm, duty: outputs["servo_utama"].append((sim.clock.now_us, duty)))
+
+    key_latency = []
+    pending = []
+    press = sim.rig.keypad.press
+
+    def press_probe(key, *args):
+        pending[:] = [sim.clock.now_us]
+        press(key, *args)
+
+    def lcd_changed(t):
+        if pending:
+            key_latency.append(t - pending.pop())
+    sim.rig.keypad.press = press_probe
+    sim.rig.lcd.on_change = lcd_changed
+
+    main_globals = {}
+    sim.on_start.append(main_globals.update)
+    sim.install()
+    probes, control = install_probes(sim)
+    sim.run_main(quiet=True)
+
+    metrics = {}
+    interlock_period = main_globals.get("INTERLOCK_PERIOD")
+    control_period = main_globals.get("CONTROL_PERIOD")
+    display_period = main_globals.get("DISPLAY_PERIOD")
+    metrics["interlock_pass"] = probes["interlock_pass"].stats(interlock_period)
+    metrics["display_flush"] = probes["display_flush"].stats(display_period)
+    metrics["temp_poll"] = probes["temp_poll"].stats()
+    # Boot: when the first interlock pass finished, and the end of every
+    # boot phase the firmware recorded, in ms from reset
+    first = probes["interlock_pass"]
+    boot = {}
+    if first.starts:
+        boot["interlocks_live_ms"] = round((first.starts[0] + first.virtual_us[0]) / 1e3, 3)
+    import profiler
+    for phase, start, end, ok in getattr(profiler, "boot_phases", ()):
+        boot[phase + "_end_ms"] = round(end / 1e3, 3)
+    metrics["boot"] = boot
+    total_tx = sum(bus.transactions for bus in sim.board.i2c_buses.values())
+    # Relay and servo writes by the firmware, and how many changed anything
+    actuators = [sim.board.pin(11), sim.board.pin(10)] + [sim.board.pwm(p) for p in (12, 13, 14)]
+    metrics["actuator_writes"] = {
+        "writes": sum(a.writes for a in actuators),
+        "changes": sum(a.changes for a in actuators),
+    }
+
+    if name in ("fuzzy", "link"):
+        times = control["times"]
+        periods = diffs(times)
+        stamps = []
+        for stamp in control["stamps"]:
+            if stamp is not None and (not stamps or stamp != stamps[-1]):
+                stamps.append(stamp)
+        metrics["control_loop"] = {
+            "iterations": len(times),
+            "period_ms": summarize(periods, 1e-3),
+            "jitter_ms": summarize([abs(p - control_period * 1e6) for p in periods], 1e-3),
+            # Time between the samples the derivative is computed from
+            "dt_ms": summarize(diffs(stamps)),
+            "i2c_per_iteration": round(total_tx / len(times), 2) if times else None,
+        }
+        metrics["fuzzy_evaluate"] = probes["fuzzy_evaluate"].stats()
+        main = sim.rig.plant.main
+        metrics["plant"] = {"main_temp_c": round(main.temp, 2),
+                            "servo_travel": sim.rig.plant.state()["valves"]}
+        if name == "link":
+            metrics["link_stream"] = link_stream(sim)
+            metrics["link_poll"] = probes["link_poll"].stats()
+    elif name in ("interlock", "interlock_fault"):
+        latencies, missed = reaction_latencies(sim, outputs)
+        metrics["reaction_ms"] = summarize(latencies, 1e-3)
+        metrics["reaction_missed"] = missed
+        if name == "interlock_fault":
+            metrics["failed_reads"] = sim.rig.adc1.failed_reads + sim.rig.adc2.failed_reads
+    elif name == "keypad":
+        metrics["key_to_lcd_ms"] = summarize(key_latency, 1e-3)
+        metrics["keys_without_change"] = len(sim.rig.keypad.presses) - len(key_latency)
+
+    return {
+        "virtual_s": round(sim.clock.now_us / 1e6, 3),
+        "wall_s": round(sim.wall_s, 3),
+        "error": repr(sim.error) if sim.error is not None else None,
+        "i2c_transactions": total_tx,
+        "metrics": metrics,
+    }
+
+
+def run_all(names, dual_core=False):
+    results = {}
+    for name in names:
+        # A fresh interpreter per scenario: the firmware modules are global
+        proc = subprocess.run(
+            [sys.executable, "-m", "sim.bench", "--scenario", name] +
+            (["--dual-core"] if dual_core else []),
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True, text=True)
+        if proc.returncode:
+            sys.stderr.write(proc.stderr)
+            raise SystemExit("scenario %s failed" % name)
+        results[name] = json.loads(proc.stdout)
+        print("%-10s %6.1f s virtual in %5.2f s" % (name, results[name]["virtual_s"],
+                                                    results[name]["wall_s"]), file=sys.stderr)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"],
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(tree, prefix=""):
+    out = {}
+    for key, value in tree.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            out.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def compare(path_a, path_b):
+    with open(path_a) as f:
+        a = json.load(f)
+    with open(path_b) as f:
+        b = json.load(f)
+    flat_a = flatten(a["scenarios"])
+    flat_b = flatten(b["scenarios"])
+    print("%-58s %12s %12s %8s" % ("metric", a.get("revision") or "A",
+                                    b.get("revision") or "B", "change"))
+    for name in sorted(set(flat_a) | set(flat_b)):
+        va = flat_a.get(name)
+        vb = flat_b.get(name)
+        if va == vb:
+            continue
+        change = ""
+        if va and vb is not None:
+            change = "%+.1f%%" % ((vb - va) / abs(va) * 100)
+        print("%-58s %12s %12s %8s" % (name, "-" if va is None else va,
+                                        "-" if vb is None else vb, change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sim.bench",
+                                     description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--only", action="append", choices=SCENARIOS,
+                        help="run only this scenario (repeatable)")
+    parser.add_argument("--compare", nargs=2, metavar=("A", "B"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--dual-core", action="store_true",
+                        help="run the firmware with DUAL_CORE set")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.scenario:
+        json.dump(run_scenario(args.scenario, args.dual_core), sys.stdout)
+        return 0
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    results = {"revision": git_revision(), "dual_core": args.dual_core,
+               "scenarios": run_all(args.only or SCENARIOS, args.dual_core)}
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""GPIO, PWM and bus state of the simulated Pico.
+
+The drop-in ``machine``, ``onewire`` and ``ds18x20`` modules are thin
+wrappers around the objects here, so several firmware-side ``Pin(n)`` or
+``I2C(n)`` instances share one piece of state, as on the real chip.
+"""
+
+import errno
+
+# IRQ trigger bits, same values as machine.Pin
+IRQ_FALLING = 4
+IRQ_RISING = 8
+
+
+class PinState:
+    def __init__(self, board, pin_id):
+        self.board = board
+        self.id = pin_id
+        self.level = 0
+        self.mode = None
+        self.pull = None
+        # Callable returning the level of an input driven by the rig
+        self.driver = None
+        self.irq_handler = None
+        self.irq_trigger = 0
+        self.irq_pin = None
+        self.listeners = []
+        self.writes = 0
+        self.changes = 0
+
+    def read(self):
+        if self.driver is not None:
+            return self.driver()
+        return self.level
+
+    def write(self, level):
+        # Output written by the firmware
+        self.writes += 1
+        level = 1 if level else 0
+        if level != self.level:
+            self.level = level
+            self.changes += 1
+            for listener in self.listeners:
+                listener(self, level)
+
+    def drive(self, level):
+        # Input changed by the rig; fires the pin IRQ on a matching edge
+        level = 1 if level else 0
+        if level == self.level:
+            return
+        self.level = level
+        self.changes += 1
+        edge = IRQ_RISING if level else IRQ_FALLING
+        if self.irq_handler is not None and self.irq_trigger & edge:
+            self.irq_handler(self.irq_pin)
+
+
+class PWMState:
+    def __init__(self, board, pin_id):
+        self.board = board
+        self.pin_id = pin_id
+        self.freq = 0
+        self.duty = 0
+        self.writes = 0
+        self.changes = 0
+        self.listeners = []
+
+    def write(self, duty):
+        self.writes += 1
+        if duty != self.duty:
+            self.duty = duty
+            self.changes += 1
+            for listener in self.listeners:
+                listener(self, duty)
+
+
+class I2CBus:
+    """Devices by address, plus transfer accounting.
+
+    Every transfer advances the clock by its time on the wire at the bus
+    frequency: start, address byte, data bytes and stop, 9 clocks a byte.
+    """
+
+    def __init__(self, clock, bus_id, freq=400000):
+        self.clock = clock
+        self.id = bus_id
+        self.freq = freq
+        self.devices = {}
+        self.transactions = 0
+        self.bytes = 0
+        self.nacks = 0
+
+    def attach(self, addr, device):
+        self.devices[addr] = device
+
+    def byte_us(self):
+        return 9e6 / self.freq
+
+    def device(self, addr):
+        dev = self.devices.get(addr)
+        if dev is None:
+            self.transactions += 1
+            self.nacks += 1
+            self.clock.advance(2 * self.byte_us())
+            raise OSError(errno.ENODEV)
+        return dev
+
+    def transfer(self, nbytes):
+        self.transactions += 1
+        self.bytes += nbytes
+        self.clock.advance((nbytes + 1) * self.byte_us() + 1)
+
+    def scan(self):
+        # Address byte to each of the 112 valid addresses
+        self.clock.advance((0x78 - 0x08) * 2 * self.byte_us())
+        return sorted(self.devices)
+
+
+class OneWireBus:
+    """Devices on one 1-Wire GPIO, at the byte level with standard-speed timing.
+
+    Reads are wired-AND: a bit reads 1 unless some device pulls it low.
+    """
+
+    RESET_US = 960
+    SLOT_US = 65
+
+    def __init__(self, clock, pin_id):
+        self.clock = clock
+        self.pin_id = pin_id
+        self.devices = []
+        self.resets = 0
+        self.bytes = 0
+        self.searches = 0
+
+    def attach(self, device):
+        self.devices.append(device)
+
+    def reset(self):
+        self.resets += 1
+        self.clock.advance(self.RESET_US)
+        present = False
+        for dev in self.devices:
+            if dev.present:
+                dev.reset()
+                present = True
+        return present
+
+    def write(self, data):
+        self.bytes += len(data)
+        self.clock.advance(len(data) * 8 * self.SLOT_US)
+        for byte in data:
+            for dev in self.devices:
+                if dev.present:
+                    dev.write_byte(byte)
+
+    def read(self, nbytes):
+        self.bytes += nbytes
+        self.clock.advance(nbytes * 8 * self.SLOT_US)
+        out = bytearray(nbytes)
+        for i in range(nbytes):
+            value = 0xFF
+            for dev in self.devices:
+                if dev.present:
+                    value &= dev.read_byte()
+            out[i] = value
+        return out
+
+    def search(self):
+        # Search ROM: one reset, then 64 bits of three slots each per device
+        self.searches += 1
+        found = [dev for dev in self.devices if dev.present]
+        self.clock.advance(max(1, len(found)) * (self.RESET_US + 64 * 3 * self.SLOT_US))
+        self.resets += max(1, len(found))
+        return [bytearray(dev.rom) for dev in found]
+
+
+class Board:
+    def __init__(self, clock):
+        self.clock = clock
+        self.pins = {}
+        self.pwms = {}
+        self.i2c_buses = {}
+        self.onewire_buses = {}
+        self.timers = []
+
+    def pin(self, pin_id):
+        state = self.pins.get(pin_id)
+        if state is None:
+            state = self.pins[pin_id] = PinState(self, pin_id)
+        return state
+
+    def pwm(self, pin_id):
+        state = self.pwms.get(pin_id)
+        if state is None:
+            state = self.pwms[pin_id] = PWMState(self, pin_id)
+        return state
+
+    def i2c(self, bus_id):
+        bus = self.i2c_buses.get(bus_id)
+        if bus is None:
+            bus = self.i2c_buses[bus_id] = I2CBus(self.clock, bus_id)
+        return bus
+
+    def onewire(self, pin_id):
+        bus = self.onewire_buses.get(pin_id)
+        if bus is None:
+            bus = self.onewire_buses[pin_id] = OneWireBus(self.clock, pin_id)
+        return bus
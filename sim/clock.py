@@ -0,0 +1,79 @@
+import heapq
+
+
+class SimulationEnd(SystemExit):
+    """Raised from inside the firmware when the virtual run time is over.
+
+    It derives from SystemExit so neither the firmware's own ``except
+    Exception`` handlers nor asyncio, which keeps other exceptions raised in
+    a task inside the task, stop it from ending the run.
+    """
+
+
+class Clock:
+    """Virtual time in microseconds.
+
+    Time only moves when the firmware sleeps or waits on a (simulated) bus.
+    Scheduled callbacks -- timer IRQs, key presses -- run at their due time
+    while the clock is advanced, and every stepper is told the new time so the
+    plant can integrate up to it.
+    """
+
+    def __init__(self):
+        self.now_us = 0
+        self.end_us = None
+        self.steppers = []
+        self._events = []
+        self._seq = 0
+        self._dispatching = False
+        self.ended = False
+        # Set once the firmware starts a second core
+        self.cores = None
+
+    def call_at(self, due_us, callback):
+        self._seq += 1
+        heapq.heappush(self._events, (int(due_us), self._seq, callback))
+
+    def call_later(self, delay_us, callback):
+        self.call_at(self.now_us + delay_us, callback)
+
+    def _set(self, now_us):
+        self.now_us = now_us
+        for step in self.steppers:
+            step(now_us)
+
+    def advance(self, us):
+        if self.ended:
+            # Time stands still past the end; raise again in case a bare
+            # except in the firmware caught the first one
+            raise SimulationEnd()
+        if self.cores is not None and not self._dispatching:
+            # Two cores: the time is the running core's, see cores.py
+            self.cores.advance(us)
+            return
+        self.advance_to(self.now_us + max(0, int(us)))
+
+    def advance_to(self, target_us):
+        target = target_us
+        end = self.end_us is not None and target >= self.end_us
+        if end:
+            target = self.end_us
+        if self._dispatching:
+            # Time spent inside a callback (e.g. a bus transfer from an IRQ
+            # handler); events are dispatched by the outer advance()
+            self._set(max(target, self.now_us))
+        else:
+            self._dispatching = True
+            try:
+                while self._events and self._events[0][0] <= target:
+                    due, _, callback = heapq.heappop(self._events)
+                    if due > self.now_us:
+                        self._set(due)
+                    callback()
+            finally:
+                self._dispatching = False
+            if target > self.now_us:
+                self._set(target)
+        if end:
+            self.ended = True
+            raise SimulationEnd()
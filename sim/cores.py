@@ -0,0 +1,166 @@
+"""Second RP2040 core, installed as the firmware's ``_thread`` module.
+
+MicroPython on the RP2040 runs a thread started with
+``_thread.start_new_thread()`` on core 1. Here it runs in a host thread in
+lockstep with the first: each core keeps its own virtual time, only the
+core furthest behind runs, and the shared clock follows it. Time one core
+spends sleeping or waiting on a bus therefore does not hold up the other,
+while bus traffic, pin changes and the plant stay in a single timeline.
+"""
+
+import errno
+import threading
+import traceback
+
+from . import runtime
+from .clock import SimulationEnd
+
+SPIN_US = 2              # Clock step while spinning on a held lock
+
+
+class Core:
+    def __init__(self, index, time_us):
+        self.index = index
+        self.time_us = time_us
+        self.done = False
+
+
+class Cores:
+    """
+    Hands the clock between the cores. Installed on the clock by the first
+    start_new_thread(); until then core 0 owns the clock alone.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.cores = [Core(0, clock.now_us)]
+        self.current = self.cores[0]
+        self.cond = threading.Condition()
+
+    def start(self, function, args, kwargs):
+        if len(self.cores) > 1:
+            raise OSError(errno.EBUSY, "core 1 in use")
+        self.cores[0].time_us = self.clock.now_us
+        core = Core(1, self.clock.now_us)
+        self.cores.append(core)
+        self.clock.cores = self
+        thread = threading.Thread(target=self._run, args=(core, function, args, kwargs),
+                                  daemon=True)
+        thread.start()
+
+    def _run(self, core, function, args, kwargs):
+        with self.cond:
+            while self.current is not core:
+                self.cond.wait()
+        try:
+            function(*args, **kwargs)
+        except SimulationEnd:
+            # The run is over: wake core 0, which then ends too
+            core.done = True
+            self._hand_to(self.cores[0])
+            return
+        except SystemExit:
+            pass
+        except BaseException:
+            # MicroPython prints an unhandled exception and ends the thread
+            traceback.print_exc()
+        core.done = True
+        self._switch(core)
+
+    def _hand_to(self, core):
+        with self.cond:
+            self.current = core
+            self.cond.notify_all()
+
+    def advance(self, us):
+        # Called by Clock.advance() in the running core's thread
+        me = self.current
+        me.time_us += max(0, int(us))
+        self._switch(me)
+
+    def _switch(self, me):
+        # Run the core furthest behind, me on a tie
+        nxt = None
+        for core in self.cores:
+            if not core.done and (nxt is None or core.time_us < nxt.time_us or
+                                  (core.time_us == nxt.time_us and core is me)):
+                nxt = core
+        if nxt is None:
+            return
+        self.clock.advance_to(nxt.time_us)
+        if nxt is me:
+            return
+        with self.cond:
+            self.current = nxt
+            self.cond.notify_all()
+            if me.done:
+                return
+            while self.current is not me:
+                self.cond.wait()
+        if self.clock.ended:
+            raise SimulationEnd()
+
+
+class LockType:
+    """A _thread lock. Only one core runs at a time, so a blocked acquire
+    spins on virtual time, which lets the other core run and release it."""
+
+    def __init__(self):
+        self._locked = False
+
+    def acquire(self, waitflag=1, timeout=-1):
+        if self._locked:
+            if not waitflag:
+                return False
+            clock = runtime.clock
+            deadline = None if timeout < 0 else clock.now_us + int(timeout * 1e6)
+            while self._locked:
+                if deadline is not None and clock.now_us >= deadline:
+                    return False
+                clock.advance(SPIN_US)
+        self._locked = True
+        return True
+
+    def release(self):
+        if not self._locked:
+            raise RuntimeError("release unlocked lock")
+        self._locked = False
+
+    def locked(self):
+        return self._locked
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class _ThreadModule:
+    """The ``_thread`` module the firmware sees."""
+
+    LockType = LockType
+
+    def __init__(self, clock):
+        self.cores = Cores(clock)
+
+    def start_new_thread(self, function, args, kwargs=None):
+        self.cores.start(function, args, kwargs or {})
+        return 1
+
+    def allocate_lock(self):
+        return LockType()
+
+    def get_ident(self):
+        return self.cores.current.index + 1
+
+    def stack_size(self, size=None):
+        return 0
+
+    def exit(self):
+        raise SystemExit()
+
+
+def module(clock):
+    return _ThreadModule(clock)
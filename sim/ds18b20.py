@@ -0,0 +1,136 @@
+"""DS18B20 digital thermometer on a simulated 1-Wire bus.
+
+The device answers the ROM and function commands the MicroPython driver
+uses (skip/match ROM, convert, read/write scratchpad). A conversion takes
+93.75 ms at 9 bits up to 750 ms at 12 bits, as set in the config byte, and
+the scratchpad only changes when it completes -- reading early returns the
+previous value, and 85.0 before the first conversion, like the real part.
+"""
+
+SKIP_ROM = 0xCC
+MATCH_ROM = 0x55
+CONVERT_T = 0x44
+READ_SCRATCH = 0xBE
+WRITE_SCRATCH = 0x4E
+COPY_SCRATCH = 0x48
+RECALL_E2 = 0xB8
+
+
+def crc8(data):
+    # Dallas/Maxim 1-Wire CRC; 0 over data that ends in its own CRC
+    crc = 0
+    for byte in data:
+        for _ in range(8):
+            mix = (crc ^ byte) & 1
+            crc >>= 1
+            if mix:
+                crc ^= 0x8C
+            byte >>= 1
+    return crc
+
+
+def make_rom(serial):
+    rom = bytearray(8)
+    rom[0] = 0x28
+    for i in range(6):
+        rom[1 + i] = (serial >> (8 * i)) & 0xFF
+    rom[7] = crc8(rom[:7])
+    return bytes(rom)
+
+
+class DS18B20:
+    def __init__(self, clock, serial, source):
+        self.clock = clock
+        self.rom = make_rom(serial)
+        # source() -> true temperature in degrees C
+        self.source = source
+        self.present = True
+        # Power-on scratchpad: 85.0 C, TH 75, TL 70, 12 bits
+        self.scratch = bytearray((0x50, 0x05, 0x4B, 0x46, 0x7F, 0xFF, 0x0C, 0x10, 0))
+        self.scratch[8] = crc8(self.scratch[:8])
+        self.eeprom = bytearray(self.scratch[2:5])
+        self.state = None
+        self.selected = False
+        self.match_index = 0
+        self.read_index = 0
+        self.write_index = 0
+        self.conv_done_at = None
+        self.conversions = 0
+        self.early_reads = 0
+
+    def resolution(self):
+        return 9 + ((self.scratch[4] >> 5) & 3)
+
+    def conversion_us(self):
+        return 93750 << (self.resolution() - 9)
+
+    def _update(self):
+        if self.conv_done_at is not None and self.clock.now_us >= self.conv_done_at:
+            self.conv_done_at = None
+            self.conversions += 1
+            # Below 12 bits the datasheet leaves the low bits undefined; like
+            # some real parts, this one leaves the 12-bit conversion's there
+            raw = int(round(self.source() * 16))
+            raw &= 0xFFFF
+            self.scratch[0] = raw & 0xFF
+            self.scratch[1] = raw >> 8
+            self.scratch[8] = crc8(self.scratch[:8])
+
+    def reset(self):
+        self._update()
+        self.state = "rom"
+        self.selected = False
+
+    def write_byte(self, byte):
+        self._update()
+        if self.state == "rom":
+            if byte == SKIP_ROM:
+                self.selected = True
+                self.state = "function"
+            elif byte == MATCH_ROM:
+                self.selected = True
+                self.match_index = 0
+                self.state = "match"
+            else:
+                self.state = None
+        elif self.state == "match":
+            if byte != self.rom[self.match_index]:
+                self.selected = False
+            self.match_index += 1
+            if self.match_index == 8:
+                self.state = "function" if self.selected else None
+        elif self.state == "function":
+            if byte == CONVERT_T:
+                self.conv_done_at = self.clock.now_us + self.conversion_us()
+                self.state = None
+            elif byte == READ_SCRATCH:
+                if self.conv_done_at is not None:
+                    self.early_reads += 1
+                self.read_index = 0
+                self.state = "read"
+            elif byte == WRITE_SCRATCH:
+                self.write_index = 0
+                self.state = "write"
+            elif byte == COPY_SCRATCH:
+                self.eeprom[:] = self.scratch[2:5]
+                self.state = None
+            elif byte == RECALL_E2:
+                self.scratch[2:5] = self.eeprom
+                self.scratch[8] = crc8(self.scratch[:8])
+                self.state = None
+            else:
+                self.state = None
+        elif self.state == "write":
+            self.scratch[2 + self.write_index] = byte
+            self.write_index += 1
+            if self.write_index == 3:
+                self.scratch[4] = (byte & 0x60) | 0x1F
+                self.scratch[8] = crc8(self.scratch[:8])
+                self.state = None
+
+    def read_byte(self):
+        if self.state == "read" and self.read_index < 9:
+            value = self.scratch[self.read_index]
+            self.read_index += 1
+            return value
+        return 0xFF
@@ -0,0 +1,116 @@
+"""HD44780 character LCD behind a PCF8574 I2C backpack.
+
+Every byte written to the PCF8574 sets its port; the LCD latches a nibble on
+each falling edge of E (P2), with RS on P0 and the data on P4..P7. The model
+starts in 8-bit mode like the real controller, follows the 4-bit switch of
+the init sequence and keeps DDRAM, so ``lines()`` is what the display shows.
+It also counts writes that arrive while the controller is still busy.
+"""
+
+MASK_RS = 0x01
+MASK_E = 0x04
+
+EXEC_US = 37        # Most commands and data writes
+CLEAR_HOME_US = 1520
+
+
+class HD44780:
+    def __init__(self, clock, num_lines=4, num_columns=20):
+        self.clock = clock
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.port = 0
+        self.four_bit = False
+        self.high_nibble = None
+        self.ddram = bytearray(b' ' * 0x80)
+        self.addr = 0
+        self.cgram = False
+        self.busy_until = 0
+        self.violations = 0
+        self.commands = 0
+        self.chars = 0
+        self.changed_at = None
+        # Called with the time of every change to the visible text
+        self.on_change = None
+
+    def write(self, data, start_us=None, byte_us=0):
+        t = self.clock.now_us if start_us is None else start_us
+        for byte in data:
+            t += byte_us
+            if self.port & MASK_E and not byte & MASK_E:
+                self._strobe(byte, t)
+            self.port = byte
+
+    def read(self, nbytes):
+        return bytes([self.port]) * nbytes
+
+    def _strobe(self, port, t):
+        nibble = port >> 4
+        rs = port & MASK_RS
+        if not self.four_bit:
+            # 8-bit mode: the nibble is the upper half of a whole command
+            self._execute(nibble << 4, rs, t)
+            return
+        if self.high_nibble is None:
+            self.high_nibble = nibble
+            return
+        value = (self.high_nibble << 4) | nibble
+        self.high_nibble = None
+        self._execute(value, rs, t)
+
+    def _execute(self, value, rs, t):
+        if t < self.busy_until:
+            self.violations += 1
+        self.busy_until = t + EXEC_US
+        if rs:
+            self.chars += 1
+            if not self.cgram:
+                if self.ddram[self.addr] != value:
+                    self.ddram[self.addr] = value
+                    self._changed(t)
+                self._advance()
+            return
+        self.commands += 1
+        if value & 0x80:
+            self.addr = value & 0x7F
+            self.cgram = False
+        elif value & 0x40:
+            self.cgram = True
+        elif value & 0x20:
+            if not self.four_bit and not value & 0x10:
+                self.four_bit = True
+        elif value & 0x1C:
+            # Shift, display control and entry mode don't change DDRAM
+            pass
+        elif value & 0x02:
+            # Return home (0x02/0x03)
+            self.addr = 0
+            self.busy_until = t + CLEAR_HOME_US
+        elif value & 0x01:
+            for i in range(len(self.ddram)):
+                if self.ddram[i] != 0x20:
+                    self.ddram[i] = 0x20
+                    self._changed(t)
+            self.addr = 0
+            self.busy_until = t + CLEAR_HOME_US
+
+    def _changed(self, t):
+        self.changed_at = t
+        if self.on_change is not None:
+            self.on_change(t)
+
+    def _advance(self):
+        # DDRAM runs 0x00-0x27 and 0x40-0x67, each wrapping to the other
+        self.addr += 1
+        if self.addr == 0x28:
+            self.addr = 0x40
+        elif self.addr == 0x68:
+            self.addr = 0x00
+
+    def lines(self):
+        out = []
+        for y in range(self.num_lines):
+            base = (0x40 if y & 1 else 0) + (self.num_columns if y & 2 else 0)
+            row = self.ddram[base:base + self.num_columns]
+            out.append(row.decode('latin-1'))
+        return out
@@ -0,0 +1,76 @@
+"""4x4 membrane keypad wired as a matrix.
+
+The firmware drives one row high at a time and reads the columns with
+pull-downs; a column reads high while its row is driven and a key joining
+them is held. Presses can bounce for a few milliseconds.
+"""
+
+KEYMAP = (
+    ('D', 'C', 'B', 'A'),
+    ('#', '9', '6', '3'),
+    ('0', '8', '5', '2'),
+    ('*', '7', '4', '1'),
+)
+
+
+class Keypad:
+    def __init__(self, clock, board, row_pins=(2, 3, 4, 5), col_pins=(6, 7, 8, 9)):
+        self.clock = clock
+        self.rows = [board.pin(p) for p in row_pins]
+        self.cols = [board.pin(p) for p in col_pins]
+        self.held = set()
+        self.any_high = False
+        self.presses = []       # (time_us, key) for every scripted press
+        for row in self.rows:
+            row.listeners.append(self._update)
+
+    def _update(self, pin=None, level=None):
+        # Columns are set whenever a row or a key changes, so the firmware's
+        # reads are plain pin reads
+        if not self.held and not self.any_high:
+            return
+        self.any_high = False
+        for c, col in enumerate(self.cols):
+            high = 0
+            for r, row in enumerate(self.rows):
+                if row.level and (r, c) in self.held:
+                    high = 1
+                    break
+            col.drive(high)
+            self.any_high |= high
+
+    def _hold(self, pos):
+        self.held.add(pos)
+        self._update()
+
+    def _release(self, pos):
+        self.held.discard(pos)
+        self._update()
+
+    @staticmethod
+    def locate(key):
+        for r, row in enumerate(KEYMAP):
+            if key in row:
+                return r, row.index(key)
+        raise ValueError("no key " + repr(key))
+
+    def press(self, key, hold_us=80000, bounce_us=0):
+        pos = self.locate(key)
+        self.presses.append((self.clock.now_us, key))
+        self._hold(pos)
+        if bounce_us:
+            # One open/close chatter in the first bounce_us
+            t = self.clock.now_us
+            self.clock.call_at(t + bounce_us // 2, lambda: self._release(pos))
+            self.clock.call_at(t + bounce_us, lambda: self._hold(pos))
+        self.clock.call_at(self.clock.now_us + hold_us, lambda: self._release(pos))
+
+    def type_at(self, start_us, keys, interval_us=300000, hold_us=80000, bounce_us=0):
+        """Schedules a key sequence; spaces in ``keys`` are skipped."""
+        t = start_us
+        for key in keys:
+            if key == ' ':
+                continue
+            self.clock.call_at(t, lambda k=key: self.press(k, hold_us, bounce_us))
+            t += interval_us
+        return t
@@ -0,0 +1,194 @@
+"""Drop-in ``machine`` for the simulator; state lives in ``runtime.board``."""
+
+from sim import runtime
+
+
+def _board():
+    return runtime.board
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, pin_id, mode=None, pull=None, value=None):
+        self.id = pin_id
+        self.state = _board().pin(pin_id)
+        self.init(mode, pull, value)
+
+    def init(self, mode=None, pull=None, value=None):
+        if mode is not None:
+            self.state.mode = mode
+        if pull is not None:
+            self.state.pull = pull
+        if value is not None:
+            self.state.write(value)
+
+    def value(self, level=None):
+        if level is None:
+            return self.state.read()
+        self.state.write(level)
+
+    def __call__(self, level=None):
+        return self.value(level)
+
+    def on(self):
+        self.state.write(1)
+
+    def off(self):
+        self.state.write(0)
+
+    high = on
+    low = off
+
+    def toggle(self):
+        self.state.write(not self.state.level)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self.state.irq_handler = handler
+        self.state.irq_trigger = trigger
+        self.state.irq_pin = self
+
+    def __repr__(self):
+        return "Pin(%d)" % self.id
+
+
+class PWM:
+    def __init__(self, pin, freq=None, duty_u16=None):
+        pin_id = pin.id if isinstance(pin, Pin) else pin
+        self.state = _board().pwm(pin_id)
+        if freq is not None:
+            self.freq(freq)
+        if duty_u16 is not None:
+            self.duty_u16(duty_u16)
+
+    def freq(self, value=None):
+        if value is None:
+            return self.state.freq
+        self.state.freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self.state.duty
+        self.state.write(int(value) & 0xFFFF)
+
+    def deinit(self):
+        self.state.write(0)
+
+
+class I2C:
+    def __init__(self, bus_id, scl=None, sda=None, freq=400000, timeout=50000):
+        self.bus = _board().i2c(bus_id)
+        self.bus.freq = freq
+
+    def scan(self):
+        return self.bus.scan()
+
+    def writeto(self, addr, buf, stop=True):
+        dev = self.bus.device(addr)
+        start = self.bus.clock.now_us
+        self.bus.transfer(len(buf))
+        dev.write(bytes(buf), start, self.bus.byte_us())
+        return len(buf)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        dev = self.bus.device(addr)
+        self.bus.transfer(len(buf))
+        buf[:] = dev.read(len(buf))
+
+    def readfrom(self, addr, nbytes, stop=True):
+        buf = bytearray(nbytes)
+        self.readfrom_into(addr, buf, stop)
+        return bytes(buf)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self.writeto(addr, bytes((memaddr,)) + bytes(buf))
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        # Pointer write, repeated start, read: one transaction on the wire
+        dev = self.bus.device(addr)
+        start = self.bus.clock.now_us
+        self.bus.transfer(len(buf) + 2)
+        dev.write(bytes((memaddr,)), start, self.bus.byte_us())
+        buf[:] = dev.read(len(buf))
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        buf = bytearray(nbytes)
+        self.readfrom_mem_into(addr, memaddr, buf, addrsize)
+        return bytes(buf)
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, mode=PERIODIC, period=-1, freq=None, callback=None):
+        self.active = False
+        self.generation = 0
+        if callback is not None:
+            self.init(mode=mode, period=period, freq=freq, callback=callback)
+
+    def init(self, mode=PERIODIC, period=-1, freq=None, callback=None):
+        self.deinit()
+        if freq is not None:
+            period_us = int(1e6 / freq)
+        else:
+            period_us = int(period) * 1000
+        self.mode = mode
+        self.period_us = period_us
+        self.callback = callback
+        self.active = True
+        board = _board()
+        if self not in board.timers:
+            board.timers.append(self)
+        self._schedule(board.clock.now_us + period_us, self.generation)
+
+    def _schedule(self, due_us, generation):
+        clock = _board().clock
+
+        def fire():
+            if not self.active or generation != self.generation:
+                return
+            if self.mode == Timer.PERIODIC:
+                self._schedule(due_us + self.period_us, generation)
+            else:
+                self.active = False
+            self.callback(self)
+        clock.call_at(due_us, fire)
+
+    def deinit(self):
+        self.active = False
+        self.generation += 1
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def unique_id():
+    return b'\xe6\x61\x41\x04\x03\x2a\x5b\x2e'
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def soft_reset():
+    raise SystemExit("machine.soft_reset()")
+
+
+def idle():
+    _board().clock.advance(1000)
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
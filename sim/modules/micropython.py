@@ -0,0 +1,28 @@
+"""Drop-in ``micropython`` for the simulator."""
+
+
+def const(value):
+    return value
+
+
+def native(func):
+    return func
+
+
+viper = native
+
+
+def schedule(func, arg):
+    func(arg)
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(verbose=None):
+    pass
+
+
+def kbd_intr(chr):
+    pass
@@ -0,0 +1,47 @@
+"""Drop-in ``onewire`` for the simulator, with the MicroPython API."""
+
+from sim import runtime
+from sim.ds18b20 import crc8 as _crc8
+
+
+class OneWireError(Exception):
+    pass
+
+
+class OneWire:
+    SEARCH_ROM = 0xF0
+    MATCH_ROM = 0x55
+    SKIP_ROM = 0xCC
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.bus = runtime.board.onewire(pin.id)
+
+    def reset(self, required=False):
+        present = self.bus.reset()
+        if required and not present:
+            raise OneWireError
+        return present
+
+    def readbyte(self):
+        return self.bus.read(1)[0]
+
+    def readinto(self, buf):
+        buf[:] = self.bus.read(len(buf))
+
+    def writebyte(self, value):
+        self.bus.write(bytes((value,)))
+
+    def write(self, buf):
+        self.bus.write(bytes(buf))
+
+    def select_rom(self, rom):
+        self.reset()
+        self.writebyte(self.MATCH_ROM)
+        self.write(rom)
+
+    def scan(self):
+        return self.bus.search()
+
+    def crc8(self, data):
+        return _crc8(data)
@@ -0,0 +1,100 @@
+"""Drop-in ``uasyncio``: CPython asyncio on the virtual clock.
+
+The event loop's time is the simulation clock, and where a real loop would
+block in select() waiting for the next timer, this one advances the clock
+instead -- which is also when timer IRQs and scripted key presses fire.
+"""
+
+import asyncio as _asyncio
+import selectors
+from asyncio import *  # noqa: F401,F403
+
+from sim import runtime
+
+IDLE_STEP_US = 1000      # Clock step when no task has a timer pending
+CANCEL_PASSES = 10
+
+
+class _VirtualSelector(selectors.SelectSelector):
+    def select(self, timeout=None):
+        clock = runtime.clock
+        if clock.ended:
+            # Shutting down: let the cancelled tasks finish without time
+            return []
+        if timeout is None:
+            clock.advance(IDLE_STEP_US)
+        elif timeout > 0:
+            # Round up so the loop never wakes just short of a deadline
+            clock.advance(int(timeout * 1e6) + 1)
+        return []
+
+
+class VirtualTimeLoop(_asyncio.SelectorEventLoop):
+    def __init__(self):
+        super().__init__(_VirtualSelector())
+        self._clock_resolution = 1e-6
+
+    def time(self):
+        return runtime.clock.now_us / 1e6
+
+
+def new_event_loop():
+    return VirtualTimeLoop()
+
+
+_loop = None
+
+
+def get_event_loop():
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = new_event_loop()
+        _asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def run(coro):
+    loop = get_event_loop()
+    if runtime.on_run is not None:
+        # Lets the runner adjust the firmware's globals before it starts
+        runtime.on_run(coro.cr_frame.f_globals)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        # Cancel what is left. The clock has stopped, and firmware with a
+        # bare except can swallow the cancellation, so give the tasks a few
+        # loop passes rather than waiting for all of them.
+        loop.set_exception_handler(lambda loop, context: None)
+        for task in _asyncio.all_tasks(loop):
+            task.cancel()
+        for _ in range(CANCEL_PASSES):
+            if not _asyncio.all_tasks(loop):
+                break
+            loop.call_soon(loop.stop)
+            loop.run_forever()
+        loop.close()
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+
+async def wait_for_ms(aw, timeout_ms):
+    return await _asyncio.wait_for(aw, timeout_ms / 1000)
+
+
+class ThreadSafeFlag:
+    """Set from an IRQ (a clock callback here), awaited by one task."""
+
+    def __init__(self):
+        self._event = _asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
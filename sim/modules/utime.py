@@ -0,0 +1,58 @@
+"""Drop-in ``utime``/``time`` on the virtual clock.
+
+Installed as both names, so it also has to serve the host-side code that
+imports ``time`` after the simulation starts; anything not defined here
+falls through to the real module.
+"""
+
+import time as _time
+
+from sim import runtime
+
+TICKS_PERIOD = 1 << 30
+_TICKS_MAX = TICKS_PERIOD - 1
+_TICKS_HALF = TICKS_PERIOD // 2
+
+
+def _clock():
+    return runtime.clock
+
+
+def sleep(seconds):
+    _clock().advance(seconds * 1e6)
+
+
+def sleep_ms(ms):
+    _clock().advance(ms * 1000)
+
+
+def sleep_us(us):
+    _clock().advance(us)
+
+
+def ticks_ms():
+    return (_clock().now_us // 1000) & _TICKS_MAX
+
+
+def ticks_us():
+    return _clock().now_us & _TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(end, start):
+    return ((end - start + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+
+def time_ns():
+    return _clock().now_us * 1000
+
+
+def __getattr__(name):
+    return getattr(_time, name)
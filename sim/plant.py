@@ -0,0 +1,199 @@
+"""Physical model of the three tanks.
+
+The heater and cooler tanks are refilled from the supply through relays 1
+and 2 (active low) and hold their water near a set temperature. Their
+servo valves feed the main tank, which mixes the two and drains through the
+main servo. Levels and temperatures follow simple well-mixed tank balances,
+integrated at a fixed step as virtual time passes.
+"""
+
+import random
+
+AMBIENT_C = 27.0
+SUPPLY_C = 27.0
+FILL_LPS = 0.08          # Supply flow into the heater or cooler tank
+FEED_LPS = 0.05          # Heater/cooler valve flow into the main tank, full open
+DRAIN_LPS = 0.15         # Main tank drain, full open
+SERVO_SLEW = 2.0         # Valve travel per second, in fractions of full stroke
+LOSS_PER_S = 0.0005      # Fraction of the gap to ambient lost per second
+
+# Level probe heights as fractions of the tank, and their output voltages
+LL_FRACTION = 0.2
+LH_FRACTION = 0.85
+WET_V = 4.0
+DRY_V = 0.15
+
+
+class Tank:
+    def __init__(self, name, capacity_l, level_l, temp_c):
+        self.name = name
+        self.capacity = capacity_l
+        self.volume = level_l
+        self.temp = temp_c
+        self.overflow_l = 0.0
+        self.ran_dry_s = 0.0
+        self.last_fraction = self.fraction()
+
+    def fraction(self):
+        return self.volume / self.capacity
+
+    def add(self, litres, temp_c):
+        if litres <= 0:
+            return
+        total = self.volume + litres
+        self.temp = (self.temp * self.volume + temp_c * litres) / total
+        self.volume = total
+        if self.volume > self.capacity:
+            self.overflow_l += self.volume - self.capacity
+            self.volume = self.capacity
+
+    def take(self, litres):
+        # Returns what could actually be drawn
+        litres = min(litres, self.volume)
+        self.volume -= litres
+        return litres
+
+
+class Valve:
+    """A servo valve; its opening follows the PWM duty at a limited slew."""
+
+    def __init__(self, closed_duty, open_duty):
+        self.closed_duty = closed_duty
+        self.open_duty = open_duty
+        self.command = 0.0
+        self.opening = 0.0
+        self.travel = 0.0
+
+    def set_duty(self, duty):
+        span = self.open_duty - self.closed_duty
+        self.command = min(1.0, max(0.0, (duty - self.closed_duty) / span))
+
+    def step(self, dt):
+        gap = self.command - self.opening
+        if not gap:
+            return
+        move = max(-SERVO_SLEW * dt, min(SERVO_SLEW * dt, gap))
+        self.opening += move
+        self.travel += abs(move)
+
+
+class Heat:
+    """Heating element or chiller pulling a tank toward its set temperature."""
+
+    def __init__(self, target_c, rate_per_s):
+        self.target = target_c
+        self.rate = rate_per_s
+
+    def step(self, tank, dt):
+        if tank.volume > 0.1:
+            tank.temp += (self.target - tank.temp) * min(1.0, self.rate * dt)
+
+
+class Plant:
+    def __init__(self, clock, board, step_us=20000, noise_v=0.0, seed=1):
+        self.clock = clock
+        self.step_us = step_us
+        self.noise_v = noise_v
+        self.random = random.Random(seed)
+        self.heater = Tank("heater", 10.0, 5.0, 50.0)
+        self.cooler = Tank("cooler", 10.0, 5.0, 12.0)
+        self.main = Tank("main", 20.0, 8.0, AMBIENT_C)
+        self.tanks = (self.heater, self.cooler, self.main)
+        self.heater_element = Heat(60.0, 0.01)
+        self.chiller = Heat(8.0, 0.01)
+        self.valves = {
+            "heater": Valve(5000, 2900),
+            "cooler": Valve(2900, 5500),
+            "utama": Valve(4600, 1400),
+        }
+        self.relay_pins = (board.pin(11), board.pin(10))
+        self.time_us = clock.now_us
+        # (time_us, tank name, probe height, rising) for every probe the
+        # water surface passes
+        self.crossings = []
+        for name, pin_id in (("heater", 12), ("cooler", 13), ("utama", 14)):
+            board.pwm(pin_id).listeners.append(self._valve_listener(name))
+        clock.steppers.append(self.advance)
+
+    def _valve_listener(self, name):
+        valve = self.valves[name]
+        return lambda pwm, duty: valve.set_duty(duty)
+
+    # Integration
+
+    def advance(self, now_us):
+        while now_us - self.time_us >= self.step_us:
+            self.time_us += self.step_us
+            self.step(self.step_us / 1e6)
+
+    def step(self, dt):
+        for valve in self.valves.values():
+            valve.step(dt)
+        # Relays are active low: the pin reads 0 while a relay is on. At
+        # power-up, before the firmware drives them, they are off.
+        for tank, pin in zip((self.heater, self.cooler), self.relay_pins):
+            if pin.mode is not None and not pin.level:
+                tank.add(FILL_LPS * dt, SUPPLY_C)
+        hot = self.heater.take(FEED_LPS * self.valves["heater"].opening * dt)
+        self.main.add(hot, self.heater.temp)
+        cold = self.cooler.take(FEED_LPS * self.valves["cooler"].opening * dt)
+        self.main.add(cold, self.cooler.temp)
+        self.main.take(DRAIN_LPS * self.valves["utama"].opening * dt)
+        self.heater_element.step(self.heater, dt)
+        self.chiller.step(self.cooler, dt)
+        for tank in self.tanks:
+            tank.temp += (AMBIENT_C - tank.temp) * LOSS_PER_S * dt
+            if tank.volume <= 0:
+                tank.ran_dry_s += dt
+            self._check_crossings(tank, self.time_us - self.step_us, self.step_us)
+
+    def _check_crossings(self, tank, start_us, span_us):
+        # Crossing times are interpolated within the step
+        before = tank.last_fraction
+        after = tank.fraction()
+        tank.last_fraction = after
+        if before == after:
+            return
+        for height in (LL_FRACTION, LH_FRACTION):
+            rising = before < height <= after
+            if rising or after < height <= before:
+                t = start_us + span_us * (height - before) / (after - before)
+                self.crossings.append((int(t), tank.name, height, rising))
+
+    def set_level(self, tank, fraction):
+        """Moves a tank's level at once, as a scripted disturbance."""
+        tank.volume = fraction * tank.capacity
+        self._check_crossings(tank, self.clock.now_us, 0)
+
+    # Sensors
+
+    def probe_v(self, tank, height):
+        volts = WET_V if tank.fraction() >= height else DRY_V
+        if self.noise_v:
+            volts += self.random.gauss(0, self.noise_v)
+        return volts
+
+    def level_inputs(self, probes):
+        """
+        Returns an ADS1115 ``inputs`` function for four (tank, height)
+        probes on AIN0..AIN3; None leaves a channel floating at 0 V.
+        """
+        def inputs(ain):
+            probe = probes[ain] if ain < len(probes) else None
+            if probe is None:
+                return 0.0
+            return self.probe_v(*probe)
+        return inputs
+
+    def state(self):
+        out = {}
+        for tank in self.tanks:
+            out[tank.name] = {
+                "level": round(tank.fraction(), 3),
+                "temp_c": round(tank.temp, 2),
+                "overflow_l": round(tank.overflow_l, 3),
+                "dry_s": round(tank.ran_dry_s, 1),
+            }
+        out["valves"] = {name: {"opening": round(v.opening, 3), "travel": round(v.travel, 2)}
+                         for name, v in self.valves.items()}
+        return out
@@ -0,0 +1,45 @@
+"""Default wiring of the conditioning rig, as in the firmware pin map.
+
+- I2C(0): LCD backpack at 0x27
+- I2C(1): ADS1115 at 0x48 (LH/LL heater, LH/LL cooler on AIN0-3) and
+  0x49 (LH/LL main on AIN0-1), their ALERT/RDY outputs on GP20 and GP21
+- 1-Wire: DS18B20 on GP26 (heater), GP27 (cooler), GP28 (main)
+- Keypad rows GP2-5, columns GP6-9
+- Relays GP11 (heater fill), GP10 (cooler fill); servos GP12-14
+"""
+
+from .ads1115 import ADS1115
+from .ds18b20 import DS18B20
+from .hd44780 import HD44780
+from .keypad import Keypad
+from .plant import Plant, LL_FRACTION, LH_FRACTION
+
+LCD_ADDR = 0x27
+
+
+class Rig:
+    def __init__(self, clock, board, noise_v=0.0, osc_error=0.0, seed=1):
+        self.plant = plant = Plant(clock, board, noise_v=noise_v, seed=seed)
+
+        self.lcd = HD44780(clock)
+        board.i2c(0).attach(LCD_ADDR, self.lcd)
+
+        heater, cooler, main = plant.heater, plant.cooler, plant.main
+        self.adc1 = ADS1115(clock, plant.level_inputs((
+            (heater, LH_FRACTION), (heater, LL_FRACTION),
+            (cooler, LH_FRACTION), (cooler, LL_FRACTION))), osc_error,
+            alert=board.pin(20))
+        self.adc2 = ADS1115(clock, plant.level_inputs((
+            (main, LH_FRACTION), (main, LL_FRACTION))), osc_error,
+            alert=board.pin(21))
+        board.i2c(1).attach(0x48, self.adc1)
+        board.i2c(1).attach(0x49, self.adc2)
+
+        self.thermometers = {}
+        for serial, (name, pin_id, tank) in enumerate(
+                (("heater", 26, heater), ("cooler", 27, cooler), ("main", 28, main)), 1):
+            sensor = DS18B20(clock, 0x1A2B00 + serial, lambda tank=tank: tank.temp)
+            board.onewire(pin_id).attach(sensor)
+            self.thermometers[name] = sensor
+
+        self.keypad = Keypad(clock, board)
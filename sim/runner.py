@@ -0,0 +1,250 @@
+import builtins
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+import tty
+from time import perf_counter
+
+from . import cores, runtime
+from .board import Board
+from .clock import Clock, SimulationEnd
+from .rig import Rig
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULES_DIR = os.path.join(SIM_DIR, "modules")
+SRC_DIR = os.path.join(os.path.dirname(SIM_DIR), "src")
+
+# Firmware modules, dropped from sys.modules between runs
+FIRMWARE_MODULES = (
+    "machine", "utime", "time", "onewire", "ds18x20", "uasyncio", "micropython",
+)
+
+
+class Simulation:
+    """
+    One simulated board with the rig attached, running the firmware from
+    src/ unmodified. Only one simulation can be installed per process, since
+    the firmware modules are imported into sys.modules.
+    """
+
+    def __init__(self, seconds=60.0, noise_v=0.0, osc_error=0.0, seed=1,
+                 flash_dir=None, src_dir=SRC_DIR):
+        self.clock = Clock()
+        self.clock.end_us = int(seconds * 1e6)
+        self.board = Board(self.clock)
+        self.rig = Rig(self.clock, self.board, noise_v, osc_error, seed)
+        self.src_dir = src_dir
+        self.flash_dir = flash_dir
+        self.overrides = {}
+        # Called with main.py's globals just before its main() starts
+        self.on_start = []
+        self.output = []
+        # Binary output of the firmware (sys.stdout.buffer), e.g. telemetry
+        self.serial = bytearray()
+        self.wall_s = None
+        self.error = None
+        self._host_thread = None
+        # The firmware's serial input: the host's stdin unless send_serial()
+        # or attach_pty() gave it a port of its own
+        self._serial_in = None
+        self._serial_out = None
+        self._pty_slave = None
+        self.realtime = False
+        self._start_wall = None
+
+    # Setup
+
+    def install(self):
+        import asyncio  # noqa: F401 -- the real one, before time is replaced
+        runtime.clock = self.clock
+        runtime.board = self.board
+        runtime.on_run = self._on_run
+        for name in FIRMWARE_MODULES:
+            sys.modules.pop(name, None)
+        for path in (self.src_dir, MODULES_DIR):
+            if path in sys.path:
+                sys.path.remove(path)
+            sys.path.insert(0, path)
+        # MicroPython has both names for the same module
+        import utime
+        sys.modules["time"] = utime
+        # _thread is built into CPython, so it can't come from MODULES_DIR;
+        # the host's own threading module keeps the real one
+        self._host_thread = sys.modules.get("_thread")
+        sys.modules["_thread"] = cores.module(self.clock)
+        builtins.const = lambda value: value
+        if self.flash_dir is None:
+            self.flash_dir = tempfile.mkdtemp(prefix="sim-flash-")
+        # Data files are uploaded to the flash with the scripts; files the
+        # firmware already keeps there are left alone
+        for name in os.listdir(self.src_dir):
+            target = os.path.join(self.flash_dir, name)
+            if name.endswith(".json") and not os.path.exists(target):
+                shutil.copyfile(os.path.join(self.src_dir, name), target)
+        os.chdir(self.flash_dir)
+
+    def _on_run(self, main_globals):
+        main_globals.update(self.overrides)
+        for callback in self.on_start:
+            callback(main_globals)
+
+    # Scripting
+
+    def type_keys(self, keys, start_s=1.0, interval_s=0.3, hold_s=0.08, bounce_s=0.0):
+        """Types ``keys`` (spaces ignored) starting at start_s of virtual time."""
+        return self.rig.keypad.type_at(int(start_s * 1e6), keys, int(interval_s * 1e6),
+                                       int(hold_s * 1e6), int(bounce_s * 1e6)) / 1e6
+
+    def at(self, seconds, callback):
+        self.clock.call_at(int(seconds * 1e6), callback)
+
+    def send_serial(self, seconds, data):
+        """Has data arrive on the firmware's serial input at seconds."""
+        if self._serial_in is None:
+            read_fd, self._serial_out = os.pipe()
+            self._serial_in = _ConsoleIn(read_fd)
+        self.at(seconds, lambda: os.write(self._serial_out, data))
+
+    def attach_pty(self):
+        """
+        Puts the firmware's serial port on a pseudo-terminal, as a stand-in
+        for the Pico's USB serial, and paces the run to real time so a host
+        program can talk to it. Returns the path to open.
+        """
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        os.set_blocking(master, False)
+        # Held open, so the port stays up between host connections
+        self._pty_slave = slave
+        self._serial_in = _ConsoleIn(master)
+        self._serial_out = master
+        self.realtime = True
+        self.clock.steppers.append(self._pace)
+        return os.ttyname(slave)
+
+    def _pace(self, now_us):
+        if self._start_wall is None:
+            return
+        ahead = now_us / 1e6 - (perf_counter() - self._start_wall)
+        if ahead > 0.001:
+            time.sleep(ahead)
+
+    # Running
+
+    def run_main(self, quiet=False):
+        """Runs src/main.py until the virtual time is up."""
+        stdout = sys.stdout
+        stdin = sys.stdin
+        pty = self._serial_out if self._pty_slave is not None else None
+        sys.stdout = _Console(self.output, self.serial, None if quiet else stdout, pty)
+        if self._serial_in is not None:
+            sys.stdin = self._serial_in
+        start = self._start_wall = perf_counter()
+        try:
+            runpy.run_path(os.path.join(self.src_dir, "main.py"), run_name="__main__")
+        except SimulationEnd:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            sys.stdout = stdout
+            sys.stdin = stdin
+            if self._host_thread is not None:
+                sys.modules["_thread"] = self._host_thread
+            self.wall_s = perf_counter() - start
+        return self.error is None
+
+    def report(self):
+        clock = self.clock
+        rig = self.rig
+        virtual_s = clock.now_us / 1e6
+        return {
+            "virtual_s": round(virtual_s, 3),
+            "wall_s": round(self.wall_s, 3) if self.wall_s is not None else None,
+            "speedup": round(virtual_s / self.wall_s, 1) if self.wall_s else None,
+            "error": repr(self.error) if self.error is not None else None,
+            "lcd": rig.lcd.lines(),
+            "plant": rig.plant.state(),
+            "relays": {pin_id: self.board.pin(pin_id).level for pin_id in (11, 10)},
+            "i2c": {bus.id: {"transactions": bus.transactions, "bytes": bus.bytes,
+                             "nacks": bus.nacks}
+                    for bus in self.board.i2c_buses.values()},
+            "onewire": {bus.pin_id: {"resets": bus.resets, "bytes": bus.bytes,
+                                     "searches": bus.searches}
+                        for bus in self.board.onewire_buses.values()},
+            "lcd_bus": {"commands": rig.lcd.commands, "chars": rig.lcd.chars,
+                        "busy_violations": rig.lcd.violations},
+            "adc": {"conversions": rig.adc1.conversions + rig.adc2.conversions,
+                    "early_reads": rig.adc1.early_reads + rig.adc2.early_reads,
+                    "alerts": rig.adc1.alerts + rig.adc2.alerts},
+            "ds18b20": {name: {"conversions": s.conversions, "early_reads": s.early_reads}
+                        for name, s in rig.thermometers.items()},
+            "pwm_writes": {pin_id: pwm.writes for pin_id, pwm in self.board.pwms.items()},
+        }
+
+
+class _Console:
+    # The firmware's serial console: text is collected, and echoed unless
+    # quiet; binary writes to .buffer are collected separately. With a pty
+    # both also go out on it.
+    def __init__(self, lines, serial, echo, pty=None):
+        self.lines = lines
+        self.echo = echo
+        self.pty = pty
+        self.buffer = _Binary(serial, pty)
+
+    def write(self, text):
+        if text.strip():
+            self.lines.append(text)
+        if self.echo is not None:
+            self.echo.write(text)
+        if self.pty is not None:
+            _pty_write(self.pty, text.encode())
+
+    def flush(self):
+        if self.echo is not None:
+            self.echo.flush()
+
+
+class _Binary:
+    def __init__(self, data, pty=None):
+        self.data = data
+        self.pty = pty
+
+    def write(self, data):
+        self.data.extend(data)
+        if self.pty is not None:
+            _pty_write(self.pty, bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def _pty_write(fd, data):
+    # Like the USB serial with nobody reading: what doesn't fit is lost
+    try:
+        os.write(fd, data)
+    except (BlockingIOError, OSError):
+        pass
+
+
+class _ConsoleIn:
+    # The firmware's sys.stdin on a file descriptor: select.poll() works on
+    # it as on the Pico's console, and reads never block
+    def __init__(self, fd):
+        self.fd = fd
+        self.buffer = self
+        os.set_blocking(fd, False)
+
+    def fileno(self):
+        return self.fd
+
+    def read(self, n=1):
+        try:
+            return os.read(self.fd, n)
+        except (BlockingIOError, OSError):
+            return b""
@@ -0,0 +1,11 @@
+"""The clock and board of the running simulation.
+
+The drop-in firmware modules look them up here, so they must be set before
+the firmware is imported. See ``Simulation.install()``.
+"""
+
+clock = None
+board = None
+
+# Called by uasyncio.run() with the globals of the firmware's main module
+on_run = None
@@ -1,25 +1,99 @@
 from machine import I2C, Pin
+from array import array
+import ads1x15
 from ads1x15 import ADS1115
+import tanks
 
 ads_i2c_bus = I2C(1, scl=Pin(19), sda=Pin(18), freq=400000)
-adc_level1 = ADS1115(ads_i2c_bus, address=0x48, gain=1)
-adc_level2 = ADS1115(ads_i2c_bus, address=0x49, gain=1)
+chips = [ADS1115(ads_i2c_bus, address=address, gain=1)
+         for address in tanks.ADC_ADDRESSES]
 
-def read_adc_level1():
-    raw_LH_Heater = adc_level1.read(channel1=0, channel2=None)
-    raw_LL_Heater = adc_level1.read(channel1=1, channel2=None)
-    raw_LH_Cooler = adc_level1.read(channel1=2, channel2=None)
-    raw_LL_Cooler = adc_level1.read(channel1=3, channel2=None)
-    return raw_LH_Heater, raw_LL_Heater, raw_LH_Cooler, raw_LL_Cooler
+# Raw value of every level probe, in tanks slot order (LL, LH per tank)
+raw = array('h', [0] * tanks.NUM_SLOTS)
 
-def read_adc_level2():
-    raw_LH_Utama = adc_level2.read(channel1=0, channel2=None)
-    raw_LL_Utama = adc_level2.read(channel1=1, channel2=None)
-    return raw_LL_Utama, raw_LH_Utama
+def _build_scan():
+    # Each chip converts the channels the registry uses, round-robin, and
+    # every slot remembers where in its chip's scan_res its result lands
+    used = [[] for _ in chips]
+    for slot in range(tanks.NUM_SLOTS):
+        chip, channel = tanks.probe(slot)
+        if channel not in used[chip]:
+            used[chip].append(channel)
+    for chip, channels in zip(chips, used):
+        if channels:
+            channels.sort()
+            chip.scan_config(channels)
+    slot_res = []
+    slot_pos = bytearray(tanks.NUM_SLOTS)
+    for slot in range(tanks.NUM_SLOTS):
+        chip, channel = tanks.probe(slot)
+        slot_res.append(chips[chip].scan_res)
+        slot_pos[slot] = used[chip].index(channel)
+    return tuple(c for c, ch in zip(chips, used) if ch), slot_res, slot_pos
 
-def raw_to_voltage_level1(raw):
-    return adc_level1.raw_to_v(raw)
+_scan_chips, _slot_res, _slot_pos = _build_scan()
+_slot_chip = [chips[tanks.probe(slot)[0]] for slot in range(tanks.NUM_SLOTS)]
 
-def raw_to_voltage_level2(raw):
-    return adc_level2.raw_to_v(raw)
+# Chip index of every slot
+slot_chip = bytes(tanks.probe(slot)[0] for slot in range(tanks.NUM_SLOTS))
 
+# ALERT/RDY input of every chip, None where it isn't wired
+alert_pins = [None if pin is None else Pin(pin, Pin.IN, Pin.PULL_UP)
+              for pin in tanks.ADC_ALERT_PINS]
+
+def alerts_wired():
+    # True if every chip in the scan has its ALERT pin
+    for i, chip in enumerate(chips):
+        if chip in _scan_chips and (i >= len(alert_pins) or alert_pins[i] is None):
+            return False
+    return True
+
+def read_levels():
+    """
+    Reads every level probe in one interleaved scan of all chips. Returns
+    the raw array, LL and LH of each tank in registry order.
+    """
+    ads1x15.scan(_scan_chips)
+    for slot in range(len(raw)):
+        raw[slot] = _slot_res[slot][_slot_pos[slot]]
+    return raw
+
+def raw_to_voltage(slot, value):
+    return _slot_chip[slot].raw_to_v(value)
+
+def voltage_to_raw(slot, voltage):
+    return int(voltage / _slot_chip[slot].raw_to_v(1))
+
+def watch_config(high_voltage, low_voltage):
+    """
+    Sets the comparator thresholds every chip uses in watch(). No bus
+    traffic: the chips get them with their next watch().
+    """
+    for chip in _scan_chips:
+        # Same counts as voltage_to_raw(). The filters count a sample at
+        # or below the low threshold as LOW, the comparator releases below
+        # its low threshold, hence the + 1.
+        scale = chip.raw_to_v(1)
+        chip.watch_config(chip.scan_channels, int(high_voltage / scale),
+                          int(low_voltage / scale) + 1)
+
+def watch(slot):
+    """
+    Has the slot's chip convert that probe continuously against the
+    thresholds, so its ALERT pin reads the probe's state. Returns the time
+    in us until the pin is valid.
+    """
+    chip = _slot_chip[slot]
+    chip.watch(_slot_pos[slot])
+    return chip.watch_us
+
+def alert(chip):
+    # True while the comparator of the chip is asserted (pin low): the
+    # watched probe is above the high threshold
+    return not alert_pins[chip].value()
+
+def on_alert(handler):
+    # Calls handler(pin) from the pin IRQ on every edge of an ALERT pin
+    for pin in alert_pins:
+        if pin is not None:
+            pin.irq(handler=handler, trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING)
@@ -22,6 +22,8 @@
 # THE SOFTWARE.
 #
 import utime as time
+from array import array
+import profiler
 
 _REGISTER_MASK = const(0x03)
 _REGISTER_CONVERT = const(0x00)
@@ -103,6 +105,13 @@ _GAINS_V = (
     0.256  # 16x
 )
 
+# Conversion time in us for each _RATES entry of the ADS1115 (8 to 860 SPS),
+# including the 10% tolerance of the internal oscillator
+_CONV_US = (137500, 68750, 34375, 17188, 8594, 4400, 2316, 1280)
+
+# Same for the ADS1015 (128 to 3300 SPS)
+_CONV_US_1015 = (8594, 4400, 2245, 1196, 688, 459, 334, 334)
+
 _CHANNELS = {
     (0, None): _MUX_SINGLE_0,
     (1, None): _MUX_SINGLE_1,
@@ -127,11 +136,22 @@ _RATES = (
 
 
 class ADS1115:
+    _conv_us = _CONV_US
+    _shift = 0
+
     def __init__(self, i2c, address=0x48, gain=1):
         self.i2c = i2c
         self.address = address
         self.gain = gain
         self.temp2 = bytearray(2)
+        self.scan_channels = ()
+        self.scan_words = ()
+        self.scan_res = None
+        self.scan_us = 0
+        self.watch_words = ()
+        self.watch_thresholds = (0x8000, 0x7fff)
+        self.watch_us = 0
+        self.watch_ready = False
 
     def _write_register(self, register, value):
         self.temp2[0] = value >> 8
@@ -172,17 +192,53 @@ class ADS1115:
         self._write_register(_REGISTER_CONFIG, self.mode)
         return res if res < 32768 else res - 65536
 
+    def scan_config(self, channels, rate=4):
+        """Precompute the config words and result buffer for a round-robin
+           scan of single-ended channels with scan()."""
+        mode = (_CQUE_NONE | _CLAT_NONLAT |
+                _CPOL_ACTVLOW | _CMODE_TRAD | _RATES[rate] |
+                _MODE_SINGLE | _OS_SINGLE | _GAINS[self.gain])
+        self.scan_channels = tuple(channels)
+        self.scan_words = tuple(mode | _CHANNELS[(ch, None)] for ch in channels)
+        self.scan_res = array('h', [0] * len(channels))
+        self.scan_us = self._conv_us[rate]
+
     def alert_start(self, rate=4, channel1=0, channel2=None,
                     threshold_high=0x4000, threshold_low=0, latched=False) :
         """Start continuous measurement, set ALERT pin on threshold."""
         self._write_register(_REGISTER_LOWTHRESH, threshold_low)
         self._write_register(_REGISTER_HITHRESH, threshold_high)
         self._write_register(_REGISTER_CONFIG, _CQUE_1CONV |
-                             _CLAT_LATCH if latched else _CLAT_NONLAT |
+                             (_CLAT_LATCH if latched else _CLAT_NONLAT) |
                              _CPOL_ACTVLOW | _CMODE_TRAD | _RATES[rate] |
                              _MODE_CONTIN | _GAINS[self.gain] |
                              _CHANNELS[(channel1, channel2)])
 
+    def watch_config(self, channels, threshold_high, threshold_low, rate=4):
+        """Precompute the config words for watch(): continuous conversions of
+           one single-ended channel, with the comparator pulling ALERT/RDY
+           low above threshold_high until the input drops below
+           threshold_low. Thresholds are in scan_res units."""
+        self.watch_thresholds = ((threshold_low << self._shift) & 0xffff,
+                                 (threshold_high << self._shift) & 0xffff)
+        mode = (_CQUE_1CONV | _CLAT_NONLAT |
+                _CPOL_ACTVLOW | _CMODE_TRAD | _RATES[rate] |
+                _MODE_CONTIN | _GAINS[self.gain])
+        self.watch_words = tuple(mode | _CHANNELS[(ch, None)] for ch in channels)
+        self.watch_us = self._conv_us[rate]
+        self.watch_ready = False
+
+    def watch(self, i):
+        """Have the comparator watch the i-th watch_config() channel. The
+           thresholds survive scans, so they are only written the first
+           time; after that a switch is one config write. The pin is valid
+           once the first conversion is done, watch_us later."""
+        if not self.watch_ready:
+            self._write_register(_REGISTER_LOWTHRESH, self.watch_thresholds[0])
+            self._write_register(_REGISTER_HITHRESH, self.watch_thresholds[1])
+            self.watch_ready = True
+        self._write_register(_REGISTER_CONFIG, self.watch_words[i])
+
     def conversion_start(self, rate=4, channel1=0, channel2=None):
         """Start continuous measurement, trigger on ALERT/RDY pin."""
         self._write_register(_REGISTER_LOWTHRESH, 0)
@@ -198,6 +254,32 @@ class ADS1115:
         return res if res < 32768 else res - 65536
 
 
+@profiler.timed("ads.scan")
+def scan(adcs):
+    """Convert all channels set with scan_config() on several chips at once.
+       The chips run interleaved and each next conversion is started right
+       after the previous result is read, so a round costs one conversion
+       time plus two I2C transfers per chip. Results go to adc.scan_res."""
+    steps = 0
+    wait = 0
+    for adc in adcs:
+        adc._write_register(_REGISTER_CONFIG, adc.scan_words[0])
+        if len(adc.scan_words) > steps:
+            steps = len(adc.scan_words)
+        if adc.scan_us > wait:
+            wait = adc.scan_us
+    for i in range(steps):
+        time.sleep_us(wait)
+        for adc in adcs:
+            words = adc.scan_words
+            if i < len(words):
+                res = adc._read_register(_REGISTER_CONVERT)
+                if i + 1 < len(words):
+                    adc._write_register(_REGISTER_CONFIG, words[i + 1])
+                res = res if res < 32768 else res - 65536
+                adc.scan_res[i] = res >> adc._shift
+
+
 class ADS1113(ADS1115):
     def __init__(self, i2c, address=0x48):
         super().__init__(i2c, address, 1)
@@ -234,6 +316,9 @@ class ADS1114(ADS1115):
 
 
 class ADS1015(ADS1115):
+    _conv_us = _CONV_US_1015
+    _shift = 4
+
     def __init__(self, i2c, address=0x48, gain=1):
         super().__init__(i2c, address, gain)
 
@@ -0,0 +1,80 @@
+import json
+import binascii
+
+# Discovered DS18B20 ROM IDs and I2C addresses, kept on flash so boot and
+# mode entry don't have to search the buses again
+REGISTRY_FILE = "devices.json"
+
+_registry = None
+_dirty = False
+
+def _load():
+    global _registry
+    if _registry is None:
+        try:
+            with open(REGISTRY_FILE) as f:
+                _registry = json.load(f)
+        except (OSError, ValueError):
+            _registry = {}
+        _registry.setdefault("onewire", {})
+        _registry.setdefault("i2c", {})
+    return _registry
+
+def save():
+    # Only touch the flash when something changed
+    global _dirty
+    if not _dirty:
+        return
+    try:
+        with open(REGISTRY_FILE, "w") as f:
+            json.dump(_load(), f)
+        _dirty = False
+    except OSError:
+        pass
+
+def get_rom(name):
+    """
+    Returns the cached ROM ID of a OneWire bus, or None if unknown.
+    """
+    rom = _load()["onewire"].get(name)
+    if rom is None:
+        return None
+    return bytearray(binascii.unhexlify(rom))
+
+def set_rom(name, rom):
+    global _dirty
+    onewire = _load()["onewire"]
+    if rom is None:
+        if name in onewire:
+            del onewire[name]
+            _dirty = True
+        return
+    rom = binascii.hexlify(rom).decode()
+    if onewire.get(name) != rom:
+        onewire[name] = rom
+        _dirty = True
+
+def get_i2c(name):
+    return _load()["i2c"].get(name)
+
+def set_i2c(name, addr):
+    global _dirty
+    i2c_devices = _load()["i2c"]
+    if i2c_devices.get(name) != addr:
+        i2c_devices[name] = addr
+        _dirty = True
+
+def find_i2c(name, i2c, rescan=False):
+    """
+    Returns the I2C address of a device, searching the bus only if it
+    isn't cached or rescan is requested.
+    """
+    addr = None if rescan else get_i2c(name)
+    if addr is None:
+        addrs = i2c.scan()
+        if not addrs:
+            raise OSError("no I2C device found for " + name)
+        addr = addrs[0]
+        set_i2c(name, addr)
+        save()
+    return addr
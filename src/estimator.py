@@ -0,0 +1,77 @@
+import time
+
+# Alpha-beta filter for a slowly changing measurement such as a tank
+# temperature. It keeps an estimate of the value and of its rate of change,
+# corrects both by a fraction of the error of every new sample against the
+# prediction, and in between extrapolates along the rate. The gains follow
+# from a time constant and the gap since the previous sample, so the
+# smoothing stays the same whether samples come every 94 ms or every
+# 750 ms, and beta = alpha^2 / (2 - alpha) keeps the filter critically
+# damped (Benedict-Bordner). A sample that repeats the last timestamp, as
+# the sampler returns after a failed read, changes nothing.
+
+class AlphaBeta:
+    """
+    Value and rate (per second) estimate from timestamped samples. tau_ms
+    is the smoothing time constant; extrapolation stops horizon_ms after
+    the last sample, and a gap longer than that starts the filter afresh.
+    """
+
+    __slots__ = ("tau_ms", "horizon_ms", "value", "rate", "stamp", "samples")
+
+    def __init__(self, tau_ms=1500, horizon_ms=3000):
+        self.tau_ms = tau_ms
+        self.horizon_ms = horizon_ms
+        self.reset()
+
+    def reset(self):
+        self.value = 0.0
+        self.rate = 0.0
+        self.stamp = None    # ticks_ms of the last sample
+        self.samples = 0
+
+    def update(self, value, stamp):
+        """
+        Feeds a sample taken at stamp (ticks_ms). Returns False if it was
+        the same sample as the last one.
+        """
+        if self.stamp is not None:
+            dt_ms = time.ticks_diff(stamp, self.stamp)
+            if dt_ms <= 0:
+                return False
+        if self.stamp is None or dt_ms > self.horizon_ms:
+            self.value = value
+            self.rate = 0.0
+        else:
+            dt = dt_ms / 1000
+            alpha = dt_ms / (dt_ms + self.tau_ms)
+            beta = alpha * alpha / (2 - alpha)
+            predicted = self.value + self.rate * dt
+            residual = value - predicted
+            self.value = predicted + alpha * residual
+            self.rate += beta * residual / dt
+        self.stamp = stamp
+        self.samples += 1
+        return True
+
+    def value_at(self, now):
+        """
+        Estimate at now (ticks_ms), extrapolated from the last sample for
+        at most horizon_ms. None before the first sample.
+        """
+        if self.stamp is None:
+            return None
+        dt_ms = time.ticks_diff(now, self.stamp)
+        if dt_ms > self.horizon_ms:
+            dt_ms = self.horizon_ms
+        elif dt_ms < 0:
+            dt_ms = 0
+        return self.value + self.rate * dt_ms / 1000
+
+    def fresh(self, now):
+        """
+        True if the last sample is at most horizon_ms old at now
+        (ticks_ms). Past that the rate no longer says anything about the
+        value, and neither does the estimate.
+        """
+        return self.stamp is not None and time.ticks_diff(now, self.stamp) <= self.horizon_ms
@@ -1,51 +1,12 @@
 # fuzzy_control.py
 
-# Membership function boundaries (triangle MF)
-error_mf_bounds = {
-    'Very Cold': (-100, -10, -5),
-    'Cold': (-10, -5, 0),
-    'Normal': (-5, 0, 5),
-    'Hot': (0, 5, 10),
-    'Very Hot': (5, 10, 100)
-}
-
-delta_error_mf_bounds = {
-    'Decreasing': (-100, -5, 0),
-    'Stable': (-2, 0, 2),
-    'Increasing': (0, 5, 100)
-}
-
-# Output crisp values for Rasio (%)
-output_values = {
-    'Sangat Tinggi': 0,
-    'Tinggi': 10,
-    'Agak Tinggi': 25,
-    'Sedang Tinggi': 35,
-    'Sedang': 50,
-    'Sedang Rendah': 65,
-    'Rendah': 75,
-    'Sangat Rendah': 90,
-    'Minimum': 100
-}
-
-# Fuzzy rules as per your specification
-rules = {
-    ('Very Cold', 'Decreasing'): 'Sangat Tinggi',
-    ('Very Cold', 'Stable'): 'Sangat Tinggi',
-    ('Very Cold', 'Increasing'): 'Tinggi',
-    ('Cold', 'Decreasing'): 'Tinggi',
-    ('Cold', 'Stable'): 'Agak Tinggi',
-    ('Cold', 'Increasing'): 'Sedang Tinggi',
-    ('Normal', 'Decreasing'): 'Sedang Tinggi',
-    ('Normal', 'Stable'): 'Sedang', 
-    ('Normal', 'Increasing'): 'Sedang Rendah',
-    ('Hot', 'Decreasing'): 'Sedang Rendah',
-    ('Hot', 'Stable'): 'Rendah',
-    ('Hot', 'Increasing'): 'Sangat Rendah',
-    ('Very Hot', 'Decreasing'): 'Sangat Rendah',
-    ('Very Hot', 'Stable'): 'Minimum',
-    ('Very Hot', 'Increasing'): 'Minimum'
-}
+from array import array
+import json
+import struct
+
+# The rule base (MFs, output singletons and rules) lives only in RULES_FILE
+# on flash, in the format FuzzyController documents. fuzzy_sugeno() is the
+# float reference inference on it.
 
 def triangle_mf(x, a, b, c):
     if x <= a or x >= c:
@@ -57,35 +18,23 @@ def triangle_mf(x, a, b, c):
     else:
         return 0.0
 
-def mf_error(x):
-    memberships = {}
-    for label, (a, b, c) in error_mf_bounds.items():
-        memberships[label] = triangle_mf(x, a, b, c)
-    return memberships
-
-def mf_delta_error(x):
-    memberships = {}
-    for label, (a, b, c) in delta_error_mf_bounds.items():
-        memberships[label] = triangle_mf(x, a, b, c)
-    return memberships
-
-def fuzzy_sugeno(error, delta_error):
-    error_memberships = mf_error(error)
-    delta_error_memberships = mf_delta_error(delta_error)
+def fuzzy_sugeno(error, delta_error, spec):
+    outputs = dict(spec["outputs"])
 
     numerator = 0.0
     denominator = 0.0
 
-    for e_label, e_val in error_memberships.items():
+    for e_mf, row in zip(spec["error"], spec["rules"]):
+        e_val = triangle_mf(error, *e_mf[1:])
         if e_val == 0:
             continue
-        for d_label, d_val in delta_error_memberships.items():
+        for d_mf, output_label in zip(spec["delta_error"], row):
+            d_val = triangle_mf(delta_error, *d_mf[1:])
             if d_val == 0:
                 continue
             weight = min(e_val, d_val)
-            output_label = rules.get((e_label, d_label))
             if output_label:
-                z = output_values[output_label]
+                z = outputs[output_label]
                 numerator += weight * z
                 denominator += weight
 
@@ -93,3 +42,289 @@ def fuzzy_sugeno(error, delta_error):
         # No rule fired, return 0 or some default safe value
         return 0
     return numerator / denominator
+
+
+# Fixed-point inference. Inputs are degrees C (error) and degrees C per
+# second (delta_error) times FX_IN, memberships run from 0 to FX_ONE, and
+# the output is in hundredths of a percent (0-10000). A FuzzyController
+# compiles a rule base into integer arrays once, so an inference is a few
+# loops over small ints: no dicts, no label lookups, no floats and no heap
+# allocation. All intermediate values stay below 2**30, inside MicroPython's
+# small ints.
+
+FX_IN = 256
+FX_ONE = 4096
+FX_OUT = 100
+FX_CLAMP = 32767         # Inputs are clamped to +/-128 C (+/-128 C/s)
+
+# Rule base file on flash
+RULES_FILE = "fuzzy_rules.json"
+
+def to_fx(x):
+    # Float input to FX_IN units, rounded to nearest
+    x *= FX_IN
+    return int(x + 0.5) if x >= 0 else -int(0.5 - x)
+
+def _fx_bounds(mfs):
+    # Breakpoints (a, b, c) of each MF, flattened
+    out = array('i')
+    for mf in mfs:
+        if len(mf) != 4 or not mf[1] <= mf[2] <= mf[3]:
+            raise ValueError("bad MF {}".format(mf))
+        for v in mf[1:]:
+            out.append(to_fx(v))
+    return out
+
+def _fx_memberships(x, bounds, mu):
+    if x > FX_CLAMP:
+        x = FX_CLAMP
+    elif x < -FX_CLAMP:
+        x = -FX_CLAMP
+    for i in range(len(mu)):
+        a = bounds[3 * i]
+        b = bounds[3 * i + 1]
+        c = bounds[3 * i + 2]
+        if x <= a or x >= c:
+            mu[i] = 0
+        elif x < b:
+            mu[i] = (x - a) * FX_ONE // (b - a)
+        else:
+            mu[i] = (c - x) * FX_ONE // (c - b)
+
+class FuzzyController:
+    """
+    A rule base compiled to integer arrays: MF breakpoints, an (error MF,
+    delta_error MF) to output index matrix (-1 where no rule exists) and the
+    output singletons. spec has MFs as [label, a, b, c] under "error" and
+    "delta_error", outputs as [label, percent], and one rule row per error
+    MF giving the output label for each delta_error MF, null where there is
+    no rule. Instances share no state, so each tank or season can have its
+    own:
+
+        winter = load_controller("winter.json")
+        value = winter.infer(to_fx(error), to_fx(delta_error))
+    """
+
+    def __init__(self, spec):
+        self.name = spec.get("name", "")
+        self.e_bounds = _fx_bounds(spec["error"])
+        self.de_bounds = _fx_bounds(spec["delta_error"])
+        out_labels = [o[0] for o in spec["outputs"]]
+        self.out = array('i', [int(round(o[1] * FX_OUT)) for o in spec["outputs"]])
+        n_e = len(spec["error"])
+        n_de = len(spec["delta_error"])
+        if len(spec["rules"]) != n_e:
+            raise ValueError("need one rule row per error MF")
+        self.rules = array('b', [-1] * (n_e * n_de))
+        for i, row in enumerate(spec["rules"]):
+            if len(row) != n_de:
+                raise ValueError("need one rule per delta_error MF")
+            for j, label in enumerate(row):
+                if label is not None:
+                    self.rules[i * n_de + j] = out_labels.index(label)
+        self.mu_e = array('i', [0] * n_e)
+        self.mu_de = array('i', [0] * n_de)
+
+    def infer(self, error, delta_error):
+        """
+        fuzzy_sugeno() on scaled integers: error and delta_error times FX_IN
+        in, output in hundredths of a percent out.
+        """
+        mu_e = self.mu_e
+        mu_de = self.mu_de
+        rule = self.rules
+        out = self.out
+        _fx_memberships(error, self.e_bounds, mu_e)
+        _fx_memberships(delta_error, self.de_bounds, mu_de)
+        n_de = len(mu_de)
+        numerator = 0
+        denominator = 0
+        for i in range(len(mu_e)):
+            w_e = mu_e[i]
+            if not w_e:
+                continue
+            for j in range(n_de):
+                w = mu_de[j]
+                if not w:
+                    continue
+                k = rule[i * n_de + j]
+                if k < 0:
+                    continue
+                if w_e < w:
+                    w = w_e
+                numerator += w * out[k]
+                denominator += w
+        if not denominator:
+            return 0
+        return (numerator + denominator // 2) // denominator
+
+    def evaluate(self, error, delta_error):
+        # infer() with float arguments and result in percent, for comparisons
+        return self.infer(to_fx(error), to_fx(delta_error)) / FX_OUT
+
+def load_rule_base(path=RULES_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+def load_controller(path=RULES_FILE):
+    """
+    Compiles the rule base in path. Raises OSError if the file is missing
+    and ValueError, KeyError or TypeError if it is not a valid rule base.
+    """
+    return FuzzyController(load_rule_base(path))
+
+def verify_fixed(spec, step=0.5, limit=105, fine_step=0.05, fine_limit=12):
+    """
+    Compares the controller compiled from spec with fuzzy_sugeno() on spec
+    over the whole input domain (every MF out to +/-100, at step) and more
+    finely over the range the controller works in. Returns (max deviation
+    in percent, error, delta_error) of the worst point.
+    """
+    controller = FuzzyController(spec)
+    worst = (0.0, 0.0, 0.0)
+    for st, lim in ((step, limit), (fine_step, fine_limit)):
+        n = int(round(2 * lim / st))
+        for i in range(n + 1):
+            error = -lim + i * st
+            for j in range(n + 1):
+                delta_error = -lim + j * st
+                dev = abs(controller.evaluate(error, delta_error) -
+                          fuzzy_sugeno(error, delta_error, spec))
+                if dev > worst[0]:
+                    worst = (dev, error, delta_error)
+    return worst
+
+
+# Precomputed control surface: an optional engine in front of a compiled
+# FuzzyController. It samples the controller's infer() on a regular
+# (error, delta_error) grid once and evaluates it by bilinear interpolation
+# in integers, in infer()'s units, so the control loop can use either.
+# Intermediate values stay below 2**30 for output singletons up to 100 %
+# and grid steps up to 1 C.
+
+SURFACE_FILE = "fuzzy_surface.bin"
+
+def _signature(controller):
+    # FNV-1a hash of the compiled rule base, to tell if a saved surface is stale
+    h = 0x811c9dc5
+    for part in (controller.e_bounds, controller.de_bounds, controller.out, controller.rules):
+        for v in part:
+            h = ((h ^ (v & 0xffffffff)) * 0x01000193) & 0xffffffff
+    return h
+
+class FuzzySurface:
+    """
+    controller.infer() sampled on a grid (bounds and steps in C and C/s)
+    and evaluated in constant time. Inputs outside the grid fall back to
+    the controller.
+    """
+
+    def __init__(self, controller, e_min=-20, e_max=20, e_step=0.5,
+                 de_min=-10, de_max=10, de_step=0.5, build=True):
+        self.controller = controller
+        self.e_min = to_fx(e_min)
+        self.e_step = to_fx(e_step)
+        self.e_n = int(round((e_max - e_min) / e_step)) + 1
+        self.de_min = to_fx(de_min)
+        self.de_step = to_fx(de_step)
+        self.de_n = int(round((de_max - de_min) / de_step)) + 1
+        self.table = array('h', [0] * (self.e_n * self.de_n))
+        if build:
+            self.build()
+
+    def build(self):
+        infer = self.controller.infer
+        k = 0
+        for i in range(self.e_n):
+            error = self.e_min + i * self.e_step
+            for j in range(self.de_n):
+                self.table[k] = infer(error, self.de_min + j * self.de_step)
+                k += 1
+
+    def infer(self, error, delta_error):
+        """
+        As FuzzyController.infer(): inputs times FX_IN, output in
+        hundredths of a percent.
+        """
+        fe = error - self.e_min
+        fd = delta_error - self.de_min
+        e_step = self.e_step
+        de_step = self.de_step
+        i = fe // e_step
+        j = fd // de_step
+        if fe < 0 or fd < 0 or i >= self.e_n or j >= self.de_n:
+            return self.controller.infer(error, delta_error)
+        if i > self.e_n - 2:
+            i = self.e_n - 2
+        if j > self.de_n - 2:
+            j = self.de_n - 2
+        fe -= i * e_step
+        fd -= j * de_step
+        t = self.table
+        k = i * self.de_n + j
+        low = t[k] * (de_step - fd) + t[k + 1] * fd
+        k += self.de_n
+        high = t[k] * (de_step - fd) + t[k + 1] * fd
+        scale = e_step * de_step
+        return (low * (e_step - fe) + high * fe + scale // 2) // scale
+
+    def evaluate(self, error, delta_error):
+        # infer() with float arguments and result in percent, for comparisons
+        return self.infer(to_fx(error), to_fx(delta_error)) / FX_OUT
+
+    def verify(self, substeps=4):
+        """
+        Compares the surface with its controller at substeps points per
+        grid cell in each direction. Returns (max deviation in percent,
+        error, delta_error) of the worst point.
+        """
+        controller = self.controller
+        worst = (0.0, self.e_min / FX_IN, self.de_min / FX_IN)
+        for i in range((self.e_n - 1) * substeps + 1):
+            error = self.e_min + i * self.e_step // substeps
+            for j in range((self.de_n - 1) * substeps + 1):
+                delta_error = self.de_min + j * self.de_step // substeps
+                dev = abs(self.infer(error, delta_error) -
+                          controller.infer(error, delta_error)) / FX_OUT
+                if dev > worst[0]:
+                    worst = (dev, error / FX_IN, delta_error / FX_IN)
+        return worst
+
+    def _header(self):
+        return struct.pack('<IiiHiiH', _signature(self.controller),
+                           self.e_min, self.e_step, self.e_n,
+                           self.de_min, self.de_step, self.de_n)
+
+    def save(self, path=SURFACE_FILE):
+        with open(path, 'wb') as f:
+            f.write(self._header())
+            f.write(self.table)
+
+    def load(self, path=SURFACE_FILE):
+        """
+        Loads a saved table. Returns False if the file is missing or was
+        built from another rule base or grid.
+        """
+        header = self._header()
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(header)) != header:
+                    return False
+                return f.readinto(self.table) == len(self.table) * 2
+        except OSError:
+            return False
+
+def get_surface(controller, path=SURFACE_FILE):
+    """
+    Returns the surface of controller, loading it from path or building it
+    (and saving it for the next boot) if path holds no surface of this
+    rule base.
+    """
+    surface = FuzzySurface(controller, build=False)
+    if not surface.load(path):
+        surface.build()
+        try:
+            surface.save(path)
+        except OSError:
+            pass
+    return surface
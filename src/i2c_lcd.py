@@ -1,5 +1,6 @@
 import utime
 import gc
+import profiler
 
 from lcd_api import LcdApi
 from machine import I2C
@@ -16,21 +17,36 @@ class I2cLcd(LcdApi):
     
     #Implements a HD44780 character LCD connected via PCF8574 on I2C
 
-    def __init__(self, i2c, i2c_addr, num_lines, num_columns):
+    def __init__(self, i2c, i2c_addr, num_lines, num_columns, init=True):
         self.i2c = i2c
         self.i2c_addr = i2c_addr
+        # Preallocated nibble/strobe buffers: one byte, and one full line
+        self.buf = bytearray(4)
+        self.bulk = bytearray(4 * num_columns)
+        # Views of the first 1..num_columns characters of bulk, made once:
+        # slicing a memoryview allocates a new one on every call
+        bulk = memoryview(self.bulk)
+        self.bulk_views = [bulk[:4 * n] for n in range(1, num_columns + 1)]
+        if init:
+            for delay_ms in self.init_steps(num_lines, num_columns):
+                utime.sleep_ms(delay_ms)
+
+    def init_steps(self, num_lines, num_columns):
+        # The power-up sequence as a generator yielding the delay (msec) to
+        # wait before the next step, so a caller can wait without blocking.
+        # The clear and home commands at the end still wait inline.
         self.i2c.writeto(self.i2c_addr, bytes([0]))
-        utime.sleep_ms(20)   # Allow LCD time to powerup
+        yield 20             # Allow LCD time to powerup
         # Send reset 3 times
         self.hal_write_init_nibble(self.LCD_FUNCTION_RESET)
-        utime.sleep_ms(5)    # Need to delay at least 4.1 msec
+        yield 5              # Need to delay at least 4.1 msec
         self.hal_write_init_nibble(self.LCD_FUNCTION_RESET)
-        utime.sleep_ms(1)
+        yield 1
         self.hal_write_init_nibble(self.LCD_FUNCTION_RESET)
-        utime.sleep_ms(1)
+        yield 1
         # Put LCD into 4-bit mode
         self.hal_write_init_nibble(self.LCD_FUNCTION)
-        utime.sleep_ms(1)
+        yield 1
         LcdApi.__init__(self, num_lines, num_columns)
         cmd = self.LCD_FUNCTION
         if num_lines > 1:
@@ -44,43 +60,54 @@ class I2cLcd(LcdApi):
         byte = ((nibble >> 4) & 0x0f) << SHIFT_DATA
         self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
         self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
         
     def hal_backlight_on(self):
         # Allows the hal layer to turn the backlight on
         self.i2c.writeto(self.i2c_addr, bytes([1 << SHIFT_BACKLIGHT]))
-        gc.collect()
         
     def hal_backlight_off(self):
         #Allows the hal layer to turn the backlight off
         self.i2c.writeto(self.i2c_addr, bytes([0]))
-        gc.collect()
+
+    def _encode(self, buf, i, rs, value):
+        # Puts the four PCF8574 bytes for one byte into buf at index i: high
+        # nibble with E set then cleared, then the same for the low nibble
+        byte = (rs |
+                (self.backlight << SHIFT_BACKLIGHT) |
+                (((value >> 4) & 0x0f) << SHIFT_DATA))
+        buf[i] = byte | MASK_E
+        buf[i + 1] = byte
+        byte = (rs |
+                (self.backlight << SHIFT_BACKLIGHT) |
+                ((value & 0x0f) << SHIFT_DATA))
+        buf[i + 2] = byte | MASK_E
+        buf[i + 3] = byte
         
+    @profiler.timed("lcd.command")
     def hal_write_command(self, cmd):
         # Write a command to the LCD. Data is latched on the falling edge of E.
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                (((cmd >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                ((cmd & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+        self._encode(self.buf, 0, 0, cmd)
+        self.i2c.writeto(self.i2c_addr, self.buf)
         if cmd <= 3:
             # The home and clear commands require a worst case delay of 4.1 msec
             utime.sleep_ms(5)
-        gc.collect()
 
     def hal_write_data(self, data):
         # Write data to the LCD. Data is latched on the falling edge of E.
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                (((data >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                ((data & 0x0f) << SHIFT_DATA))      
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
\ No newline at end of file
+        self._encode(self.buf, 0, MASK_RS, data)
+        self.i2c.writeto(self.i2c_addr, self.buf)
+
+    @profiler.timed("lcd.bulk")
+    def hal_write_data_bulk(self, data, start, end):
+        # Write data[start:end] to the LCD with one I2C transfer per line
+        # length. At 400 kHz the two bytes between one character's last
+        # strobe and the next one's take longer than the 37 usec the LCD
+        # needs per character, so no extra delay is needed.
+        bulk = self.bulk
+        while start < end:
+            n = 0
+            while start < end and n < len(bulk):
+                self._encode(bulk, n, MASK_RS, data[start])
+                n += 4
+                start += 1
+            self.i2c.writeto(self.i2c_addr, self.bulk_views[n // 4 - 1])
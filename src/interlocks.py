@@ -1,145 +1,319 @@
+import time
 import adc_levels
 import relays
-from servo_control import servo_heater, servo_cooler, servo_utama, percentage_to_duty
+import servo_control
+import tanks
+from mailbox import allocate_lock
 
-# Initialize lock flags
+NUM_TANKS = len(tanks.TANKS)
+
+# Lock flags of each tank: its fill relay is held off, or the valves around
+# it are held in the overflow position
+relay_locks = bytearray(NUM_TANKS)
+servo_locks = bytearray(NUM_TANKS)
+
+# Summary flags, as main.py uses them
 relay1_locked = False
 relay2_locked = False
 servo_locked = False
 
-# Initialize sensor states for interlock sensors
-sensor_states = {
-    "LH_Heater": False,
-    "LL_Heater": False,
-    "LH_Cooler": False,
-    "LL_Cooler": False,
-    "LH_Utama": False,
-    "LL_Utama": False,
-}
-
-def check_sensor_state(name, voltage, threshold=3.5):
+# Raw ADC values of the last pass, in tanks slot order
+raw_levels = adc_levels.raw
+
+# Filtered state of every level probe, in tanks slot order
+sensor_states = bytearray(tanks.NUM_SLOTS)
+
+# Level switch filtering. A channel turns HIGH above threshold + hysteresis and
+# LOW at or below threshold - hysteresis; samples in between repeat the previous
+# one. The filtered state follows the majority of the last filter_window samples
+# once that majority has held for filter_dwell_ms.
+high_voltage_threshold = 3.3
+hysteresis_voltage = 0.1
+filter_window = 5
+filter_dwell_ms = 0
+
+class LevelFilter:
     """
-    Track sensor HIGH/LOW state and print on state changes.
-    Returns True if HIGH, False if LOW.
+    Majority filter over a fixed window of samples of one level channel.
+    Samples are kept as bits of an int, so an update is a few integer
+    operations regardless of the window size.
     """
-    global sensor_states
-    if voltage > threshold and not sensor_states[name]:
-        sensor_states[name] = True
-        #print(f"{name} sensor is HIGH")
-    elif voltage <= threshold and sensor_states[name]:
-        sensor_states[name] = False
-        #print(f"{name} sensor is LOW")
-    return sensor_states[name]
-
-def verify_sensor(read_voltage_func, *args, threshold=3.5, max_attempts=3):
+
+    def __init__(self, raw_high, raw_low, window=5, dwell_ms=0):
+        self.raw_high = raw_high
+        self.raw_low = raw_low
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.dwell_ms = dwell_ms
+        self.reset(None)
+
+    def reset(self, state):
+        # Fill the window with samples agreeing with state. None leaves it
+        # to the first sample, so nothing acts on a state never measured.
+        self.seeded = state is not None
+        state = bool(state)
+        self.bits = self.mask if state else 0
+        self.count = self.window if state else 0
+        self.state = state
+        self.pending_since = None
+
+    def settled(self):
+        # True when every sample in the window agrees with the state
+        return (self.pending_since is None and
+                self.bits == (self.mask if self.state else 0))
+
+    def update(self, raw, now):
+        if not self.seeded:
+            self.reset(raw > self.raw_high)
+        # Classify the sample with hysteresis
+        if raw > self.raw_high:
+            sample = 1
+        elif raw <= self.raw_low:
+            sample = 0
+        else:
+            sample = self.bits & 1
+        oldest = (self.bits >> (self.window - 1)) & 1
+        self.bits = ((self.bits << 1) | sample) & self.mask
+        self.count += sample - oldest
+
+        majority = self.count * 2 > self.window
+        if majority == self.state:
+            self.pending_since = None
+        elif self.pending_since is None:
+            self.pending_since = now
+        if (self.pending_since is not None and
+                time.ticks_diff(now, self.pending_since) >= self.dwell_ms):
+            self.state = majority
+            self.pending_since = None
+        return self.state
+
+filters = []
+
+# Event-driven level mode, used when every ADS1115 has its ALERT pin wired
+# (tanks.ADC_ALERT_PINS). A chip has one comparator, so it watches one probe
+# at a time, converting it continuously against the filter thresholds, and
+# its ALERT pin then reads that probe's state with no bus traffic. Only the
+# probes whose crossing would change a tank's action are watched: LH of a
+# refilling tank, LL of a full one, both before the first action. A chip
+# with several takes them in turn, one config write per pass. A pass only
+# reads the pins; the full scan runs when a watched pin disagrees with the
+# filtered state, until every filter has settled again, after invalidate()
+# and every rescan_ms for the probes nobody watches.
+level_events = True
+rescan_ms = 2000
+
+# Set while the filters are still settling after a crossing: every pass
+# scans then, and the caller should come back sooner than usual
+settling = False
+
+_UNWATCHED = 0xFF
+_events_wired = adc_levels.alerts_wired()
+_slot_chip = adc_levels.slot_chip
+_num_chips = len(adc_levels.chips)
+_watching = bytearray([_UNWATCHED] * _num_chips)    # Slot each chip watches
+_valid_at = [0] * _num_chips                       # ticks_ms its pin is valid
+_turn = bytearray(_num_chips)
+_last_scan = 0
+_scan_due = True
+
+def configure_filters(threshold=None, hysteresis=None, window=None, dwell_ms=None):
     """
-    Verify the sensor reading by checking it multiple times.
-    Returns the voltage if readings agree, else None.
+    (Re)build the level filters. Thresholds are converted to raw ADC counts
+    once here, so the interlock pass never converts samples to volts.
     """
-    readings = []
-    for _ in range(max_attempts):
-        voltage = read_voltage_func(*args)
-        readings.append(voltage)
-    # Check if all readings are consistent (all above or all below threshold)
-    all_high = all(v > threshold for v in readings)
-    all_low = all(v <= threshold for v in readings)
-
-    if all_high:
-        return readings[-1]  # return last reading if all high
-    elif all_low:
-        return readings[-1]  # return last reading if all low
-    else:
-        # Inconsistent readings, return None to avoid state change
-        return None
+    global high_voltage_threshold, hysteresis_voltage, filter_window, filter_dwell_ms
+    global _scan_due
+    if threshold is not None:
+        high_voltage_threshold = threshold
+    if hysteresis is not None:
+        hysteresis_voltage = hysteresis
+    if window is not None:
+        filter_window = window
+    if dwell_ms is not None:
+        filter_dwell_ms = dwell_ms
+    old = filters[:]
+    filters[:] = []
+    for slot in range(tanks.NUM_SLOTS):
+        level_filter = LevelFilter(
+            adc_levels.voltage_to_raw(slot, high_voltage_threshold + hysteresis_voltage),
+            adc_levels.voltage_to_raw(slot, high_voltage_threshold - hysteresis_voltage),
+            filter_window, filter_dwell_ms)
+        # Carry over a measured state; before the first pass there is none
+        if old and old[slot].seeded:
+            level_filter.reset(sensor_states[slot])
+        filters.append(level_filter)
+    adc_levels.watch_config(high_voltage_threshold + hysteresis_voltage,
+                            high_voltage_threshold - hysteresis_voltage)
+    _scan_due = True
 
+configure_filters()
 
-def apply_interlocks():
-    global relay1_locked, relay2_locked, servo_locked
 
-    high_voltage_threshold = 3.3
+# Interlock truth table, indexed by a tank's two filtered probe bits
+# (LL | LH << 1). The LL/LH consistency rules are folded in: if LL is LOW,
+# LH must be LOW (regardless of voltage), and if LH is HIGH, LL must be HIGH.
+HOLD = 0                 # Between the probes: leave the outputs as they are
+EMPTY = 1                # Refill and unlock
+FULL = 2                 # Stop filling and lock
+ACTIONS = bytes((EMPTY, HOLD, EMPTY, FULL))
 
-    # Read raw ADC values once for each sensor group
-    raw_LH_Heater, raw_LL_Heater, raw_LH_Cooler, raw_LL_Cooler = adc_levels.read_adc_level1()
-    raw_LL_Utama, raw_LH_Utama = adc_levels.read_adc_level2()
+# Per tank: its fill relay (None if it has none), the outlet valves feeding
+# it, and its own outlet valve
+_relay_pins = relays.pins
+_inlets = [tanks.inlets(i) for i in range(NUM_TANKS)]
+_servos = servo_control.servos
 
-    # Verify and convert voltages with double check
+# Last action applied to each tank, and the packed probe bits (bit slot per
+# probe) and result of the last pass
+_applied = bytearray(NUM_TANKS)
+_packed = -1
+_result = (False, False, False)
 
-    val_LH_Heater = verify_sensor(adc_levels.raw_to_voltage_level1, raw_LH_Heater, threshold=high_voltage_threshold)
-    val_LL_Heater = verify_sensor(adc_levels.raw_to_voltage_level1, raw_LL_Heater, threshold=high_voltage_threshold)
-    val_LH_Cooler = verify_sensor(adc_levels.raw_to_voltage_level1, raw_LH_Cooler, threshold=high_voltage_threshold)
-    val_LL_Cooler = verify_sensor(adc_levels.raw_to_voltage_level1, raw_LL_Cooler, threshold=high_voltage_threshold)
-    val_LH_Utama = verify_sensor(adc_levels.raw_to_voltage_level2, raw_LH_Utama, threshold=high_voltage_threshold)
-    val_LL_Utama = verify_sensor(adc_levels.raw_to_voltage_level2, raw_LL_Utama, threshold=high_voltage_threshold)
+# Held while the interlocks drive outputs. Anything else driving relays or
+# servos from the other core (the manual screen) takes it too.
+output_lock = allocate_lock()
 
-    # If verification failed (None), keep previous states to avoid false triggering
-    def safe_check(name, val):
-        if val is None:
-            # Return previous state without change
-            return sensor_states[name]
+def invalidate():
+    """
+    Makes the next pass apply every tank's action again, even if nothing
+    changed, e.g. after outputs were driven by hand.
+    """
+    global _packed, _scan_due
+    _packed = -1
+    _scan_due = True
+    for i in range(NUM_TANKS):
+        _applied[i] = HOLD
+
+def _apply(i, action):
+    if _relay_pins[i] is not None:
+        # Relay interlock: stop filling a full tank, refill an empty one
+        if action == FULL:
+            relay_locks[i] = 1
+            relays.relay_off(i)
+        else:
+            relay_locks[i] = 0
+            relays.relay_on(i)
+    inlets = _inlets[i]
+    if inlets:
+        # Servo interlock on tanks fed by other tanks' valves: when full,
+        # close the feeds and open the outlet; when empty, close the outlet
+        if action == FULL:
+            servo_locks[i] = 1
+            for j in inlets:
+                _servos[j].close()
+            if _servos[i] is not None:
+                _servos[i].open()
         else:
-            return check_sensor_state(name, val, high_voltage_threshold)
-
-    # Check sensors and track states with printouts
-        # Check sensors and track states with printouts
-    LH_Heater_high = safe_check("LH_Heater", val_LH_Heater)
-    LL_Heater_high = safe_check("LL_Heater", val_LL_Heater)
-    LH_Cooler_high = safe_check("LH_Cooler", val_LH_Cooler)
-    LL_Cooler_high = safe_check("LL_Cooler", val_LL_Cooler)
-    LH_Utama_high = safe_check("LH_Utama", val_LH_Utama)
-    LL_Utama_high = safe_check("LL_Utama", val_LL_Utama)
-
-    # Enforce rule: If LL is LOW, then LH must be LOW (regardless of voltage)
-    if not LL_Heater_high:
-        if LH_Heater_high:
-            #print("LL_Heater LOW forces LH_Heater LOW")
-            LH_Heater_high = False
-
-    if not LL_Cooler_high:
-        if LH_Cooler_high:
-            #print("LL_Cooler LOW forces LH_Cooler LOW")
-            LH_Cooler_high = False
-
-    if not LL_Utama_high:
-        if LH_Utama_high:
-            #print("LL_Utama LOW forces LH_Utama LOW")
-            LH_Utama_high = False
-            
-    # Enforce rule: If LH is HIGH, then LL must be HIGH (force LL HIGH if LH HIGH)
-    if LH_Heater_high and not LL_Heater_high:
-        LL_Heater_high = True
-
-    if LH_Cooler_high and not LL_Cooler_high:
-        LL_Cooler_high = True
-
-    if LH_Utama_high and not LL_Utama_high:
-        LL_Utama_high = True
-
-    # Relay 1 interlock
-    if LH_Heater_high:
-        relay1_locked = True
-        relays.relay_1_off()
-    elif not LL_Heater_high:
-        relay1_locked = False
-        relays.relay_1_on()
-
-    # Relay 2 interlock
-    if LH_Cooler_high:
-        relay2_locked = True
-        relays.relay_2_off()
-    elif not LL_Cooler_high:
-        relay2_locked = False
-        relays.relay_2_on()
-
-    # Servo interlock
-    if LH_Utama_high:
-        servo_locked = True
-        servo_heater.duty_u16(percentage_to_duty(0, "heater"))   # Servo Heater OFF
-        servo_cooler.duty_u16(percentage_to_duty(0, "cooler"))   # Servo Cooler OFF
-        servo_utama.duty_u16(percentage_to_duty(100, "utama"))   # Servo Utama ON
-    elif not LL_Utama_high:
-        servo_locked = False
-        servo_utama.duty_u16(percentage_to_duty(0, "utama"))     # Servo Utama OFF
-
-    return relay1_locked, relay2_locked, servo_locked
+            servo_locks[i] = 0
+            if _servos[i] is not None:
+                _servos[i].close()
+
+def _watched(slot):
+    # True if the probe's crossing would change its tank's action
+    return _applied[slot >> 1] != (FULL if slot & 1 else EMPTY)
+
+def _next_watch(chip, now):
+    # Moves the chip's comparator on to its next probe worth watching
+    count = 0
+    for slot in range(tanks.NUM_SLOTS):
+        if _slot_chip[slot] == chip and _watched(slot):
+            count += 1
+    if not count:
+        _watching[chip] = _UNWATCHED
+        return
+    turn = (_turn[chip] + 1) % count
+    _turn[chip] = turn
+    for slot in range(tanks.NUM_SLOTS):
+        if _slot_chip[slot] == chip and _watched(slot):
+            if not turn:
+                break
+            turn -= 1
+    if slot != _watching[chip]:
+        us = adc_levels.watch(slot)
+        _watching[chip] = slot
+        # Two conversions, so the pin has followed the new probe
+        _valid_at[chip] = time.ticks_add(now, 2 * us // 1000 + 1)
+
+def _watches_agree(now):
+    # Checks every watched probe's ALERT pin against its filtered state and
+    # moves the comparators on. False as soon as one disagrees.
+    for chip in range(_num_chips):
+        slot = _watching[chip]
+        if slot == _UNWATCHED or time.ticks_diff(now, _valid_at[chip]) < 0:
+            continue
+        if adc_levels.alert(chip) != bool(sensor_states[slot]):
+            return False
+        _next_watch(chip, now)
+    return True
+
+def on_alert(handler):
+    """
+    In event mode, has handler(pin) called from the pin IRQ on every ALERT
+    edge, so the caller can run the next pass right away.
+    """
+    if level_events and _events_wired:
+        adc_levels.on_alert(handler)
+
+def apply_interlocks():
+    """
+    One interlock pass. Outputs are only written when a tank's action
+    changes; while the filtered probe states stay the same the last result
+    is returned as is. In event mode a pass with no crossing makes at most
+    a comparator switch on the bus.
+    """
+    global relay1_locked, relay2_locked, servo_locked, _packed, _result
+    global settling, _scan_due, _last_scan
+
+    events = level_events and _events_wired
+    if events:
+        now = time.ticks_ms()
+        if (not _scan_due and not settling and
+                time.ticks_diff(now, _last_scan) < rescan_ms and
+                _watches_agree(now)):
+            return _result
+        # The scan puts the chips back into single-shot mode. Until it
+        # succeeds every pass scans, or a failed scan would leave the
+        # interlocks blind with no chip watched
+        _scan_due = True
+        for chip in range(_num_chips):
+            _watching[chip] = _UNWATCHED
+
+    # Read raw ADC values of every chip in one scan
+    raw = adc_levels.read_levels()
+    now = time.ticks_ms()
+
+    # Filter the samples and pack the states, one bit per probe slot
+    states = sensor_states
+    packed = 0
+    settled = True
+    for slot in range(len(states)):
+        level_filter = filters[slot]
+        state = level_filter.update(raw[slot], now)
+        states[slot] = state
+        if state:
+            packed |= 1 << slot
+        if not level_filter.settled():
+            settled = False
+
+    if packed != _packed:
+        _packed = packed
+        for i in range(NUM_TANKS):
+            action = ACTIONS[(packed >> (2 * i)) & 3]
+            if action != HOLD and action != _applied[i]:
+                _applied[i] = action
+                with output_lock:
+                    _apply(i, action)
 
+        relay1_locked = relays.RELAY_1 is not None and bool(relay_locks[relays.RELAY_1])
+        relay2_locked = relays.RELAY_2 is not None and bool(relay_locks[relays.RELAY_2])
+        servo_locked = any(servo_locks)
+        _result = (relay1_locked, relay2_locked, servo_locked)
 
+    if events:
+        _scan_due = False
+        _last_scan = now
+        settling = not settled
+        if settled:
+            for chip in range(_num_chips):
+                _next_watch(chip, now)
+    return _result
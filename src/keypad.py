@@ -1,5 +1,4 @@
-from machine import Pin
-import time
+from machine import Pin, Timer
 
 rows = [Pin(2, Pin.OUT), Pin(3, Pin.OUT), Pin(4, Pin.OUT), Pin(5, Pin.OUT)]
 cols = [Pin(6, Pin.IN, Pin.PULL_DOWN), Pin(7, Pin.IN, Pin.PULL_DOWN),
@@ -12,15 +11,77 @@ keymap = [
     ['*', '7', '4', '1']
 ]
 
-def scan_keypad():
+# The matrix is scanned from a timer. Debounced presses and releases go into
+# a preallocated ring buffer as one byte each: the key index (row * 4 + col),
+# with RELEASE set for a release.
+RELEASE = 0x80
+SCAN_PERIOD_MS = 5
+DEBOUNCE_SCANS = 4       # Scans a key must be stable for (20 ms)
+QUEUE_SIZE = 16
+
+events = bytearray(QUEUE_SIZE)
+head = 0                 # Next slot to write, only moved by poll()
+tail = 0                 # Next slot to read, only moved by get_event()
+pressed = bytearray(16)  # Debounced state of each key
+counts = bytearray(16)   # Scans each key's raw state has differed from it
+timer = None
+
+def push_event(event):
+    global head
+    nxt = (head + 1) % QUEUE_SIZE
+    if nxt != tail:      # Drop the event if the queue is full
+        events[head] = event
+        head = nxt
+
+def poll(t=None):
+    # One pass over the matrix, run by the timer
     for r in range(4):
         rows[r].on()
         for c in range(4):
-            if cols[c].value() == 1:
-                while cols[c].value() == 1:
-                    time.sleep_ms(10)
-                rows[r].off()
-                return keymap[r][c]
+            k = r * 4 + c
+            raw = cols[c].value()
+            if raw != pressed[k]:
+                counts[k] += 1
+                if counts[k] >= DEBOUNCE_SCANS:
+                    pressed[k] = raw
+                    counts[k] = 0
+                    push_event(k if raw else k | RELEASE)
+            else:
+                counts[k] = 0
         rows[r].off()
-    return None
 
+def start(period_ms=SCAN_PERIOD_MS):
+    global timer
+    if timer is None:
+        timer = Timer(mode=Timer.PERIODIC, period=period_ms, callback=poll)
+
+def stop():
+    global timer
+    if timer is not None:
+        timer.deinit()
+        timer = None
+
+def get_event():
+    """
+    Pops the next key event, or returns None if there is none.
+    """
+    global tail
+    if tail == head:
+        return None
+    event = events[tail]
+    tail = (tail + 1) % QUEUE_SIZE
+    return event
+
+def scan_keypad():
+    """
+    Returns the next pressed key, or None. Never blocks; without the timer
+    each call does one scan.
+    """
+    if timer is None:
+        poll()
+    while True:
+        event = get_event()
+        if event is None:
+            return None
+        if not event & RELEASE:
+            return keymap[event >> 2][event & 3]
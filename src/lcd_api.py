@@ -181,6 +181,12 @@ class LcdApi:
         # It is expected that a derived HAL class will implement this function.
         raise NotImplementedError
 
+    def hal_write_data_bulk(self, data, start, end):
+        # Write the bytes data[start:end] to the LCD.
+        # A derived HAL class can override this with a faster bulk transfer.
+        for i in range(start, end):
+            self.hal_write_data(data[i])
+
     def hal_sleep_us(self, usecs):
         # Sleep for some time (given in microseconds)
         time.sleep_us(usecs)
\ No newline at end of file
@@ -1,17 +1,70 @@
 from machine import I2C, Pin
 from lcd_api import LcdApi
 from i2c_lcd import I2cLcd
+from lcd_framebuffer import LcdFrameBuffer
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+import devices
 
-i2c = I2C(0, scl=Pin(1), sda=Pin(0), freq=400000)
-lcd_addr = i2c.scan()[0]
-lcd = I2cLcd(i2c, lcd_addr, 4, 20)
+NUM_LINES = 4
+NUM_COLUMNS = 20
+
+# The bus and the LCD are only set up by init(), so importing this module
+# touches no hardware and a missing LCD can't stop the rest from booting
+i2c = None
+lcd_addr = None
+lcd = None
+
+# Screens are drawn into the frame buffer; flush() sends the changes. It
+# exists from the start, so screens can be drawn before the LCD is up.
+fb = LcdFrameBuffer(None, NUM_LINES, NUM_COLUMNS)
+
+async def _start(addr):
+    # Runs the LCD's power-up sequence, awaiting its delays
+    device = I2cLcd(i2c, addr, NUM_LINES, NUM_COLUMNS, init=False)
+    for delay_ms in device.init_steps(NUM_LINES, NUM_COLUMNS):
+        await asyncio.sleep(delay_ms / 1000)
+    return device
+
+async def init():
+    """
+    Brings up the LCD without holding up other tasks while it waits.
+    Returns False, leaving the display off, if no LCD answers.
+    """
+    global i2c, lcd_addr, lcd
+    if lcd is not None:
+        return True
+    if i2c is None:
+        i2c = I2C(0, scl=Pin(1), sda=Pin(0), freq=400000)
+    try:
+        lcd_addr = devices.find_i2c("lcd", i2c)
+        try:
+            device = await _start(lcd_addr)
+        except OSError:
+            # Cached address didn't answer, search the bus again
+            lcd_addr = devices.find_i2c("lcd", i2c, rescan=True)
+            device = await _start(lcd_addr)
+    except OSError:
+        return False
+    # LcdApi clears the display during its init, which is what fb assumes
+    fb.lcd = device
+    lcd = device
+    return True
+
+def ready():
+    return lcd is not None
 
 def clear():
-    lcd.clear()
+    fb.clear()
 
 def putstr(text):
-    lcd.putstr(text)
+    fb.putstr(text)
 
 def move_to(x, y):
-    lcd.move_to(x, y)
+    fb.move_to(x, y)
 
+def flush():
+    if lcd is not None:
+        fb.flush()
@@ -0,0 +1,80 @@
+class LcdFrameBuffer:
+
+    # Shadow copy of the LCD contents. Screens are drawn into buf with the
+    # same clear/move_to/putstr calls as LcdApi, and flush() sends only the
+    # cells that differ from what is on the display, one cursor move per run
+    # of changed cells. Nothing is sent until flush() is called.
+
+    def __init__(self, lcd, num_lines, num_columns):
+        self.lcd = lcd
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.buf = bytearray(b' ' * (num_lines * num_columns))
+        # LcdApi clears the display during its init
+        self.shown = bytearray(self.buf)
+        self.cursor_x = 0
+        self.cursor_y = 0
+        self.implied_newline = False
+
+    def clear(self):
+        # Blanks the buffer and moves the cursor to the top left corner
+        for i in range(len(self.buf)):
+            self.buf[i] = 0x20
+        self.cursor_x = 0
+        self.cursor_y = 0
+
+    def move_to(self, cursor_x, cursor_y):
+        self.cursor_x = cursor_x
+        self.cursor_y = cursor_y
+
+    def putchar(self, char):
+        # Same cursor and wraparound behaviour as LcdApi.putchar()
+        if char == '\n':
+            if not self.implied_newline:
+                self.cursor_x = self.num_columns
+        else:
+            self.buf[self.cursor_y * self.num_columns + self.cursor_x] = ord(char) & 0xff
+            self.cursor_x += 1
+        if self.cursor_x >= self.num_columns:
+            self.cursor_x = 0
+            self.cursor_y += 1
+            self.implied_newline = (char != '\n')
+        if self.cursor_y >= self.num_lines:
+            self.cursor_y = 0
+
+    def putstr(self, string):
+        for char in string:
+            self.putchar(char)
+
+    def invalidate(self):
+        # Forces the next flush() to redraw every cell
+        for i in range(len(self.shown)):
+            self.shown[i] = 0
+
+    def flush(self):
+        # Writes the changed runs of each line to the LCD. A single unchanged
+        # cell between two changes costs the same as a cursor move, so it is
+        # rewritten as part of the run.
+        buf = self.buf
+        shown = self.shown
+        cols = self.num_columns
+        for y in range(self.num_lines):
+            row = y * cols
+            x = 0
+            while x < cols:
+                if buf[row + x] == shown[row + x]:
+                    x += 1
+                    continue
+                end = x + 1
+                while end < cols:
+                    if buf[row + end] != shown[row + end]:
+                        end += 1
+                    elif end + 1 < cols and buf[row + end + 1] != shown[row + end + 1]:
+                        end += 2
+                    else:
+                        break
+                self.lcd.move_to(x, y)
+                self.lcd.hal_write_data_bulk(buf, row + x, row + end)
+                for i in range(row + x, row + end):
+                    shown[i] = buf[i]
+                x = end
@@ -0,0 +1,64 @@
+from array import array
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+# Latest-value mailboxes for passing state between the two cores. A snapshot
+# is a fixed-size array of floats; the writer fills the back slot and swaps
+# it to the front under a lock, the reader copies the front slot out under
+# the same lock. Both slots are allocated up front and the lock is only held
+# for the swap or the copy, so neither core allocates or waits long.
+
+_SEQ_MAX = 0x3FFFFFFF    # Sequence numbers wrap before leaving the small ints
+
+class _NoLock:
+    # Stands in for a lock where there is no _thread module
+    def acquire(self, *args):
+        return True
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+def allocate_lock():
+    if _thread is None:
+        return _NoLock()
+    return _thread.allocate_lock()
+
+class Mailbox:
+    """
+    Snapshots of size floats from one writer to one reader. The writer
+    fills in every field of slot() and then calls publish(); read() copies
+    the newest published snapshot into the reader's own array.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._slots = (array('f', [0.0] * size), array('f', [0.0] * size))
+        self._front = 0
+        self._lock = allocate_lock()
+        self.seq = 0
+
+    def slot(self):
+        # The back snapshot, which only the writer touches
+        return self._slots[self._front ^ 1]
+
+    def publish(self):
+        with self._lock:
+            self._front ^= 1
+            self.seq = self.seq % _SEQ_MAX + 1
+
+    def read(self, out):
+        """
+        Copies the newest snapshot into out. Returns its sequence number,
+        0 if nothing has been published yet.
+        """
+        with self._lock:
+            out[:] = self._slots[self._front]
+            return self.seq
@@ -1,18 +1,113 @@
+# Safety first: the actuators go to their safe state and the interlocks make
+# their first pass before the rest of the firmware is even imported, which
+# compiling and initialising takes a while on the Pico. These modules only set
+# up the relay and servo pins and the level ADCs.
 import time
-from servo_control import initialize_servos, percentage_to_duty, servo_heater, servo_cooler, servo_utama, servo_states
+import profiler
+import servo_control
+import interlocks
+profiler.boot_record("imports", 0)
+with profiler.BootPhase("servos"):
+    servo_control.initialize_servos()
+try:
+    with profiler.BootPhase("interlocks"):
+        interlocks.apply_interlocks()
+except Exception:
+    pass                 # The interlock pass retries and counts failures
+
+_modules_start = time.ticks_us()
+from array import array
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+from servo_control import servo_heater, servo_cooler, servo_utama, servo_states
+import keypad
 from keypad import scan_keypad
 import lcd_display
 import sensors
-import interlocks
 import relays
 import adc_levels
-import permissive
+import tanks
+import telemetry
+import serial_link
+from mailbox import Mailbox
+from estimator import AlphaBeta
+
+from fuzzy_control import load_controller, get_surface, to_fx, FX_OUT
+
+# Task periods (seconds). Every task runs at its own rate, independent of
+# which menu screen is open.
+KEYPAD_PERIOD = 0.02
+TEMP_PERIOD = 0.05
+INTERLOCK_PERIOD = 0.05
+CONTROL_PERIOD = 0.1
+DISPLAY_PERIOD = 0.1
+CONSOLE_PERIOD = 0.05   # Serial link requests and console keys
+STATUS_PERIOD = 0.05
+LCD_RETRY_PERIOD = 5     # Seconds between looks for a missing LCD
+
+# The serial link turns Ctrl-C off on the console, since a 0x03 byte inside
+# a frame would otherwise stop the firmware (see serial_link.py). Set False
+# during development to keep Ctrl-C, and with it the REPL, at hand.
+LINK_RAW = True
+
+# While the level filters settle after a probe crossing (interlocks.settling)
+# the interlock pass runs every SETTLE_PERIOD instead. With the ADS1115 ALERT
+# pins wired, the passes in between crossings only read those pins, and on
+# core 0 an ALERT edge runs the next pass at once.
+SETTLE_PERIOD = 0.01
+
+# While fuzzy control runs, the main tank sensor's resolution follows the
+# control error (sensors.resolution_for()): coarser and up to 8x faster far
+# from setpoint, 12 bits near it.
+ADAPTIVE_RESOLUTION = True
+
+# Fuzzy control runs every CONTROL_PERIOD on the main tank temperature and
+# rate from an alpha-beta filter (estimator.py) fed with the sensor's
+# timestamped samples, not on raw samples: a failed read or a change of
+# resolution doesn't jolt the derivative. ESTIMATOR_TAU_MS is the filter's
+# smoothing time constant; past ESTIMATOR_HORIZON_MS without a sample the
+# estimate is stale and the valves close, as with no reading at all.
+ESTIMATOR_TAU_MS = 1500
+ESTIMATOR_HORIZON_MS = 3000
+
+# With FUZZY_SURFACE set, control evaluates a precomputed surface of the
+# controller (fuzzy_control.FuzzySurface) instead of running the inference:
+# constant time, within about 3 % of the controller (its verify()). The
+# first start builds it and saves it to flash, holding the control loop
+# for some seconds; to avoid that, copy the fuzzy_surface.bin that
+# python -m sim --flash DIR --set FUZZY_SURFACE=true leaves in DIR.
+FUZZY_SURFACE = False
+
+# Dual-core mode: sensing, interlocks, fuzzy control and telemetry logging
+# run on core 1 (control_core()) while the keypad, menus, LCD and console
+# keep core 0, so a slow screen or menu can't delay them. Off, the same steps
+# run as tasks on core 0. Either way only core 0 writes to the serial port:
+# telemetry blocks, link frames and prints would interleave otherwise.
+DUAL_CORE = False
+
+# Stage timing (see profiler.py). Send 'e' on the serial console to toggle
+# it, 'p' to print the summary and 'r' to clear it; the driver calls
+# (ds.*, ads.scan, lcd.*) are only timed with profiler.TIME_CALLS set. The
+# boot phase timing is printed once the LCD is up if BOOT_REPORT is set,
+# and on 'b'.
+PROFILE = False
+BOOT_REPORT = True
 
-from fuzzy_control import fuzzy_sugeno
+_keypad_stage = profiler.Stage("keypad")
+_interlock_stage = profiler.Stage("interlocks")
+_fuzzy_stage = profiler.Stage("fuzzy")
+_servo_stage = profiler.Stage("servo")
+_display_stage = profiler.Stage("display")
 
-# Variables for fuzzy control error tracking
-last_error = 0
-last_time = time.ticks_ms()
+# Control telemetry: one binary record per control iteration, written out in
+# blocks every TELEMETRY_PERIOD to the serial port or a flash file (see
+# telemetry.py and tools/telemetry_decode.py)
+TELEMETRY_SINK = telemetry.SINK_SERIAL
+TELEMETRY_PERIOD = 1.0
+TELEMETRY_RECORDS = 256
+telem = telemetry.Telemetry(TELEMETRY_RECORDS, TELEMETRY_SINK)
 
 # Menu and mode variables
 menu_items = [
@@ -26,6 +121,545 @@ current_selection = 0
 mode = "menu"
 setpoint = ""
 
+# Rule base compiled from fuzzy_rules.json on flash, when fuzzy control
+# first starts, and what control evaluates: the controller or its surface
+controller = None
+engine = None
+
+NUM_TANKS = len(tanks.TANKS)
+MAIN_TANK = tanks.find("main")
+_NAN = float('nan')
+
+# The control side and the UI only share state through two mailboxes (see
+# mailbox.py) of float snapshots; NaN stands for None.
+#
+# Status, control side -> UI
+ST_RELAY1 = 0
+ST_RELAY2 = 1
+ST_SERVO = 2
+ST_INTERLOCK_ERRORS = 3
+ST_RUN = 4               # Fuzzy run the control values below belong to
+ST_CONTROL_ERROR = 5
+ST_TEMP = 6
+ST_TARGET = 7
+ST_OUTPUT = 8
+ST_ROMS = 9              # Bit i set if tank i has a known sensor
+ST_TANK_TEMPS = 10       # One per tank
+ST_LEVELS = ST_TANK_TEMPS + NUM_TANKS    # Raw level, one per probe slot
+# The control error's message as ASCII codes, cut to ERROR_TEXT_LEN and
+# padded with 0: the UI prints it, and strings can't cross the mailbox
+ST_ERROR_TEXT = ST_LEVELS + tanks.NUM_SLOTS
+ERROR_TEXT_LEN = 64
+STATUS_SIZE = ST_ERROR_TEXT + ERROR_TEXT_LEN
+
+# Commands, UI -> control side
+CMD_RUN = 0              # Bumped by every start of fuzzy control
+CMD_ACTIVE = 1
+CMD_SETPOINT = 2
+CMD_SCAN = 3             # Bumped to request a sensor scan
+CMD_REASSERT = 4         # Bumped to have the interlocks reassert their outputs
+COMMAND_SIZE = 5
+
+status_box = Mailbox(STATUS_SIZE)
+command_box = Mailbox(COMMAND_SIZE)
+
+# UI copies of the interlock locks, from the status mailbox
+relay1_locked = False
+relay2_locked = False
+servo_locked = False
+interlock_errors = 0     # Consecutive failed interlock passes
+
+# Fuzzy control state as the fuzzy screen sees it
+fuzzy_active = False
+fuzzy_run = 0
+control_error = False
+current_temp = None
+target_temp = None
+percentage_value = 0
+
+scan_requests = 0
+reassert_requests = 0
+
+# Last key pressed, handed from keypad_task() to get_key()
+pending_key = None
+key_event = asyncio.Event()
+
+
+async def keypad_task():
+    global pending_key
+    while True:
+        # The keypad timer debounces and queues the keys; this only pops them
+        with _keypad_stage:
+            key = scan_keypad()
+        if key:
+            pending_key = key
+            key_event.set()
+        await asyncio.sleep(KEYPAD_PERIOD)
+
+async def get_key(timeout=None):
+    """
+    Waits for the next key press. Returns None if timeout (seconds) passes
+    first.
+    """
+    global pending_key
+    if pending_key is None:
+        key_event.clear()
+        if timeout is None:
+            await key_event.wait()
+        else:
+            try:
+                await asyncio.wait_for(key_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+    key = pending_key
+    pending_key = None
+    return key
+
+async def display_task():
+    # The LCD is brought up here, after the interlocks are already running.
+    # Without one everything else runs headless, and it is looked for again
+    # every LCD_RETRY_PERIOD.
+    failed = False
+    while not lcd_display.ready():
+        t0 = time.ticks_us()
+        if await lcd_display.init():
+            profiler.boot_record("lcd", t0)
+        else:
+            if not failed:
+                profiler.boot_record("lcd", t0, ok=False)
+                failed = True
+            await asyncio.sleep(LCD_RETRY_PERIOD)
+    if BOOT_REPORT:
+        profiler.boot_report()
+    while True:
+        with _display_stage:
+            lcd_display.flush()
+        await asyncio.sleep(DISPLAY_PERIOD)
+
+def console_key(byte):
+    # Single-character profiler commands from the serial console
+    ch = chr(byte)
+    if ch == 'e':
+        profiler.enabled = not profiler.enabled
+        print("profiler", "on" if profiler.enabled else "off")
+    elif ch == 'p':
+        profiler.dump()
+    elif ch == 'r':
+        profiler.reset()
+    elif ch == 'b':
+        profiler.boot_report()
+
+async def console_task():
+    # Serves the serial link; bytes outside its frames are console keys.
+    # Between requests the task wakes for the subscribed stream frames.
+    link = serial_link.SerialLink(LINK_NAMES, link_values, link_command, console_key,
+                                  raw=LINK_RAW)
+    while True:
+        update_link_values()
+        wait = link.poll()
+        period = CONSOLE_PERIOD
+        if wait is not None and wait < period * 1000:
+            period = wait / 1000
+        await asyncio.sleep(period)
+
+class ControlSide:
+    """
+    Sensing, interlocks, fuzzy control and telemetry: everything that must
+    keep its timing whatever the UI is doing. Its state is only shared with
+    the UI through status_box and command_box, so the same steps can run as
+    tasks on core 0 or in control_core() on core 1.
+    """
+
+    def __init__(self):
+        self.commands = array('f', [0.0] * COMMAND_SIZE)
+        self.commands[CMD_SETPOINT] = _NAN
+        self.relay1_locked = False
+        self.relay2_locked = False
+        self.servo_locked = False
+        self.interlock_errors = 0
+        self.run = 0
+        self.failed_run = -1
+        self.scan_request = 0
+        self.reassert_request = 0
+        self.control_error = False
+        self.error_text = bytearray(ERROR_TEXT_LEN)
+        self.current_temp = None
+        self.target_temp = None
+        self.output = 0
+        self.sensors_found = False
+        # Fuzzy loop state between iterations
+        self.was_active = False
+        self.last_error = 0
+        self.delta_error = 0
+        self.estimate = AlphaBeta(ESTIMATOR_TAU_MS, ESTIMATOR_HORIZON_MS)
+        self.value = 0
+
+    def read_commands(self):
+        commands = self.commands
+        command_box.read(commands)
+        run = int(commands[CMD_RUN])
+        if run != self.run:
+            # A new fuzzy run starts from a clean state
+            self.run = run
+            self.control_error = False
+            self.current_temp = None
+            self.target_temp = None
+            self.was_active = False
+        request = int(commands[CMD_SCAN])
+        if request != self.scan_request:
+            self.scan_request = request
+            sensors.sampler.scan()
+        request = int(commands[CMD_REASSERT])
+        if request != self.reassert_request:
+            self.reassert_request = request
+            interlocks.invalidate()
+
+    def interlock_step(self):
+        try:
+            with _interlock_stage:
+                self.relay1_locked, self.relay2_locked, self.servo_locked = \
+                    interlocks.apply_interlocks()
+            self.interlock_errors = 0
+        except Exception:
+            self.interlock_errors += 1
+
+    def temp_step(self):
+        if not self.sensors_found:
+            # The sensor ROMs are looked up on the first step, not before
+            # the interlocks start
+            with profiler.BootPhase("sensors"):
+                sensors.sampler.scan()
+            self.sensors_found = True
+        sensors.sampler.poll()
+
+    def control_step(self):
+        global controller, engine
+        active = self.commands[CMD_ACTIVE] != 0 and self.run != self.failed_run
+        if not active:
+            if self.was_active:
+                # Turn off servo when exiting fuzzy control
+                servo_heater.close()
+                servo_cooler.close()
+                sensors.sampler.set_resolution(MAIN_TANK, sensors.DEFAULT_BITS)
+                self.was_active = False
+            return
+
+        try:
+            if not self.was_active:
+                if MAIN_TANK is None or servo_heater is None or servo_cooler is None:
+                    raise ValueError("fuzzy control needs a main tank and heater and cooler valves")
+                if controller is None:
+                    # A missing or broken rule file fails the run
+                    controller = load_controller()
+                    engine = get_surface(controller) if FUZZY_SURFACE else controller
+                self.last_error = 0
+                self.delta_error = 0
+                self.estimate.reset()
+                self.value = 0           # Fuzzy output, hundredths of a percent
+                self.was_active = True
+
+            temp_main, stamp = sensors.sampler.latest("main")
+            setpoint_c = self.commands[CMD_SETPOINT]
+            output = 0               # Output applied to the servos this iteration
+
+            if self.servo_locked:
+                # Interlock active: pause fuzzy control
+                servo_heater.close()
+                servo_cooler.close()
+
+            elif temp_main is not None and setpoint_c == setpoint_c:
+                self.target_temp = setpoint_c
+                self.current_temp = temp_main
+
+                estimate = self.estimate
+                if estimate.update(temp_main, stamp) and ADAPTIVE_RESOLUTION:
+                    sampler = sensors.sampler
+                    sampler.set_resolution(MAIN_TANK, sensors.resolution_for(
+                        setpoint_c - temp_main, sampler.wanted[MAIN_TANK]))
+
+                now = time.ticks_ms()
+                if estimate.fresh(now):
+                    # Every step infers from the estimate at this moment; with a
+                    # fixed setpoint the error changes at minus the temperature's rate
+                    error = self.target_temp - estimate.value_at(now)
+                    self.last_error = error
+                    self.delta_error = -estimate.rate
+                    # Fixed-point inference, output in hundredths of a percent
+                    with _fuzzy_stage:
+                        self.value = engine.infer(to_fx(error), to_fx(self.delta_error))
+                    self.output = self.value / (100 * FX_OUT)
+
+                    # Control heater servo with fuzzy output; unchanged and
+                    # sub-deadband moves are not written
+                    with _servo_stage:
+                        servo_heater.set(self.value)
+                        servo_cooler.set(10000 - self.value)
+                    output = self.output
+                else:
+                    # No sample for ESTIMATOR_HORIZON_MS: the last reading and
+                    # its rate are stale, so close the valves as without one
+                    self.delta_error = 0
+                    servo_heater.close()
+                    servo_cooler.close()
+            else:
+                # No valid temp or setpoint - turn off heater
+                servo_heater.close()
+                servo_cooler.close()
+
+            if self.current_temp is not None and self.target_temp is not None:
+                telem.log(time.ticks_ms(), self.target_temp, self.current_temp,
+                          self.last_error, self.delta_error, output,
+                          telemetry.lock_flags(self.relay1_locked, self.relay2_locked,
+                                               self.servo_locked))
+
+        except Exception as e:
+            # read_status() prints it: only core 0 writes to the serial port
+            text = self.error_text
+            message = str(e).encode()
+            for i in range(ERROR_TEXT_LEN):
+                c = message[i] if i < len(message) else 0
+                text[i] = c if c < 128 else 63     # '?' for non-ASCII bytes
+            self.control_error = True
+            self.failed_run = self.run
+
+    def publish(self):
+        s = status_box.slot()
+        s[ST_RELAY1] = self.relay1_locked
+        s[ST_RELAY2] = self.relay2_locked
+        s[ST_SERVO] = self.servo_locked
+        s[ST_INTERLOCK_ERRORS] = self.interlock_errors
+        s[ST_RUN] = self.run
+        s[ST_CONTROL_ERROR] = self.control_error
+        s[ST_TEMP] = _NAN if self.current_temp is None else self.current_temp
+        s[ST_TARGET] = _NAN if self.target_temp is None else self.target_temp
+        s[ST_OUTPUT] = self.output
+        sampler = sensors.sampler
+        roms = 0
+        for i in range(NUM_TANKS):
+            if sampler.roms[i] is not None:
+                roms |= 1 << i
+            temp = sampler.temps[i]
+            s[ST_TANK_TEMPS + i] = _NAN if temp is None else temp
+        s[ST_ROMS] = roms
+        raw = interlocks.raw_levels
+        for slot in range(tanks.NUM_SLOTS):
+            s[ST_LEVELS + slot] = raw[slot]
+        text = self.error_text
+        for i in range(ERROR_TEXT_LEN):
+            s[ST_ERROR_TEXT + i] = text[i]
+        status_box.publish()
+
+control_side = ControlSide()
+
+# Control side as tasks on core 0
+
+level_alert = asyncio.ThreadSafeFlag()
+
+async def interlock_task():
+    side = control_side
+    while True:
+        side.read_commands()
+        side.interlock_step()
+        side.publish()
+        if interlocks.settling:
+            await asyncio.sleep(SETTLE_PERIOD)
+            continue
+        try:
+            await asyncio.wait_for(level_alert.wait(), INTERLOCK_PERIOD)
+        except asyncio.TimeoutError:
+            pass
+
+async def temp_task():
+    side = control_side
+    while True:
+        side.read_commands()
+        side.temp_step()
+        side.publish()
+        await asyncio.sleep(TEMP_PERIOD)
+
+async def control_task():
+    side = control_side
+    while True:
+        side.read_commands()
+        side.control_step()
+        side.publish()
+        await asyncio.sleep(CONTROL_PERIOD)
+
+async def telemetry_task():
+    while True:
+        telem.flush()
+        await asyncio.sleep(TELEMETRY_PERIOD)
+
+# Control side on core 1
+
+def control_core():
+    """
+    Runs the control side steps at their periods from one deadline loop,
+    sleeping until the next one is due. Deadlines advance by whole periods,
+    so the rates hold whatever core 0 is doing; a step that has fallen more
+    than a period behind is rescheduled from now.
+    """
+    side = control_side
+    periods = (int(INTERLOCK_PERIOD * 1000), int(TEMP_PERIOD * 1000),
+               int(CONTROL_PERIOD * 1000))
+    steps = (side.interlock_step, side.temp_step, side.control_step)
+    settle = int(SETTLE_PERIOD * 1000)
+    now = time.ticks_ms()
+    due = [now, now, now]
+    while True:
+        side.read_commands()
+        for i in range(3):
+            now = time.ticks_ms()
+            late = time.ticks_diff(now, due[i])
+            if late >= 0:
+                steps[i]()
+                period = periods[i]
+                if i == 0 and interlocks.settling:
+                    period = settle
+                due[i] = time.ticks_add(now if late >= period else due[i], period)
+        side.publish()
+        now = time.ticks_ms()
+        wait = periods[0]
+        for i in range(3):
+            left = time.ticks_diff(due[i], now)
+            if left < wait:
+                wait = left
+        if wait > 0:
+            time.sleep_ms(wait)
+
+# UI side of the mailboxes
+
+status = array('f', [0.0] * STATUS_SIZE)
+
+def _float_or_none(value):
+    return None if value != value else value
+
+def _error_text():
+    # The control error message in status, as published by the control side
+    text = bytearray()
+    for i in range(ERROR_TEXT_LEN):
+        c = int(status[ST_ERROR_TEXT + i])
+        if not c:
+            break
+        text.append(c)
+    return text.decode()
+
+def send_commands():
+    # Publishes the UI's requests to the control side
+    c = command_box.slot()
+    c[CMD_RUN] = fuzzy_run
+    c[CMD_ACTIVE] = fuzzy_active
+    try:
+        c[CMD_SETPOINT] = float(setpoint)
+    except ValueError:
+        c[CMD_SETPOINT] = _NAN
+    c[CMD_SCAN] = scan_requests
+    c[CMD_REASSERT] = reassert_requests
+    command_box.publish()
+
+def request_scan():
+    global scan_requests
+    scan_requests += 1
+    send_commands()
+
+def read_status():
+    global relay1_locked, relay2_locked, servo_locked, interlock_errors
+    global control_error, current_temp, target_temp, percentage_value
+    if not status_box.read(status):
+        return
+    relay1_locked = status[ST_RELAY1] != 0
+    relay2_locked = status[ST_RELAY2] != 0
+    servo_locked = status[ST_SERVO] != 0
+    interlock_errors = int(status[ST_INTERLOCK_ERRORS])
+    if int(status[ST_RUN]) == fuzzy_run:
+        # Control values of an earlier run are stale
+        error = status[ST_CONTROL_ERROR] != 0
+        if error and not control_error:
+            print("Exception occurred:", _error_text())
+        control_error = error
+        current_temp = _float_or_none(status[ST_TEMP])
+        target_temp = _float_or_none(status[ST_TARGET])
+        percentage_value = status[ST_OUTPUT]
+
+def tank_temp(name):
+    i = tanks.find(name)
+    return None if i is None else _float_or_none(status[ST_TANK_TEMPS + i])
+
+def tank_has_sensor(name):
+    i = tanks.find(name)
+    return 0 if i is None else int(status[ST_ROMS]) >> i & 1
+
+def level_raw(slot):
+    return int(status[ST_LEVELS + slot])
+
+# Variables served over the serial link (serial_link.py), by index: the
+# status fields below, then the UI's copies of the fuzzy control state
+def _level_name(slot):
+    return "level.%s.%s" % (tanks.TANKS[slot >> 1].name, "lh" if slot & 1 else "ll")
+
+LINK_STATUS = ([
+    ("relay1_locked", ST_RELAY1),
+    ("relay2_locked", ST_RELAY2),
+    ("servo_locked", ST_SERVO),
+    ("interlock_errors", ST_INTERLOCK_ERRORS),
+] + [("temp." + tank.name, ST_TANK_TEMPS + i) for i, tank in enumerate(tanks.TANKS)]
+  + [(_level_name(slot), ST_LEVELS + slot) for slot in range(tanks.NUM_SLOTS)])
+LINK_NAMES = tuple(name for name, _ in LINK_STATUS) + (
+    "control_error", "temp", "target", "output", "setpoint", "active")
+_link_status = bytes(index for _, index in LINK_STATUS)
+link_values = array('f', [0.0] * len(LINK_NAMES))
+
+def _float_or_nan(value):
+    return _NAN if value is None else value
+
+def update_link_values():
+    v = link_values
+    n = len(_link_status)
+    for i in range(n):
+        v[i] = status[_link_status[i]]
+    v[n] = control_error
+    v[n + 1] = _float_or_nan(current_temp)
+    v[n + 2] = _float_or_nan(target_temp)
+    v[n + 3] = percentage_value
+    try:
+        v[n + 4] = float(setpoint)
+    except ValueError:
+        v[n + 4] = _NAN
+    v[n + 5] = fuzzy_active
+
+def link_command(kind, value):
+    """
+    Setpoint and mode requests from the serial link, checked as the keypad
+    screens check them. Fuzzy control only starts from the menu: the other
+    screens would run alongside it, the manual one writing the same outputs.
+    Returns the status for the link's ACK.
+    """
+    global setpoint, fuzzy_active, fuzzy_run, control_error, current_temp
+    if kind == serial_link.SETPOINT:
+        if not 20 <= value <= 40:
+            return serial_link.OUT_OF_RANGE
+        setpoint = "%g" % value
+    elif value:
+        if not fuzzy_active:
+            if mode != "menu" or not setpoint:
+                return serial_link.REFUSED
+            if not tank_has_sensor("main"):
+                request_scan()
+                return serial_link.REFUSED
+            fuzzy_run += 1
+            current_temp = None
+            control_error = False
+            fuzzy_active = True
+    else:
+        fuzzy_active = False
+    send_commands()
+    return serial_link.OK
+
+async def status_task():
+    while True:
+        read_status()
+        await asyncio.sleep(STATUS_PERIOD)
+
 def show_menu(selected):
     lcd_display.clear()
     for i, item in enumerate(menu_items):
@@ -36,229 +670,139 @@ def show_menu(selected):
             lcd_display.putstr(" ")
         lcd_display.putstr(item[:19])
 
-def handle_menu():
+async def handle_menu():
     global current_selection, mode, setpoint
     show_menu(current_selection)
 
     while True:
-        key = scan_keypad()
-        if key:
-            if mode == "menu":
-                if key == 'A':
-                    current_selection = (current_selection - 1) % len(menu_items)
-                    show_menu(current_selection)
-                elif key == 'B':
-                    current_selection = (current_selection + 1) % len(menu_items)
-                    show_menu(current_selection)
-                elif key == '#':
-                    selected_item = menu_items[current_selection]
-                    if selected_item == "Setpoint Utama":
-                        mode = "input_setpoint"
-                    elif selected_item == "Sensor Suhu":
-                        mode = "baca_suhu"
-                    elif selected_item == "Sensor Level":
-                        mode = "baca_level"
-                    elif selected_item == "Kontrol Manual":
-                        mode = "kontrol_manual"
-                    break
-            time.sleep(0.1)
+        key = await get_key()
+        if mode == "menu":
+            if key == 'A':
+                current_selection = (current_selection - 1) % len(menu_items)
+                show_menu(current_selection)
+            elif key == 'B':
+                current_selection = (current_selection + 1) % len(menu_items)
+                show_menu(current_selection)
+            elif key == '#':
+                selected_item = menu_items[current_selection]
+                if selected_item == "Setpoint Utama":
+                    mode = "input_setpoint"
+                elif selected_item == "Sensor Suhu":
+                    mode = "baca_suhu"
+                elif selected_item == "Sensor Level":
+                    mode = "baca_level"
+                elif selected_item == "Kontrol Manual":
+                    mode = "kontrol_manual"
+                break
     lcd_display.clear()
 
-def run_fuzzy_control():
-    global mode, setpoint
-    inputting_setpoint = False
-    new_setpoint = None
-    last_error = 0
-    last_time = time.ticks_ms()
-    last_valid_temp = None  # Store last valid temperature here
-    start_time = time.ticks_ms()  # Start time recorded here!
-
-    sensor_detected = False  # Flag to track if sensor has been detected
-    main_rom_id = None       # Store main ROM ID when detected
-    target_temp = float(setpoint)
-
-    while True:
-        relay1_locked, relay2_locked, servo_locked = interlocks.apply_interlocks()
-        if servo_locked:
-            # Interlock active: pause PID control
-            servo_heater.duty_u16(percentage_to_duty(0, "heater"))
-            servo_cooler.duty_u16(percentage_to_duty(0, "cooler"))
-
-            # Just wait and keep checking, don't proceed further
-            time.sleep(0.5)
-            continue
+def show_fuzzy_screen():
+    lcd_display.clear()
+    lcd_display.putstr("Temp: {:.2f} C".format(current_temp))
+    lcd_display.move_to(0, 1)
+    lcd_display.putstr("Setpoint: {:.2f} C".format(target_temp))
+    lcd_display.move_to(0, 2)
+    lcd_display.putstr("Output: {:.2f}%".format(percentage_value))
+    lcd_display.move_to(0, 3)
+    lcd_display.putstr("*:EXIT #:Set New SP")
 
-        temp_main = None
-
-        if not sensor_detected:
-            # Retry loop for detecting main_roms only if not detected yet
-            retry_count = 0
-            while retry_count < 10:
-                heater_roms, cooler_roms, main_roms = sensors.scan_sensors()
-                if main_roms:
-                    main_rom_id = main_roms[0]
-                    sensor_detected = True
-                    temp_main = sensors.read_temp(sensors.ds_main, main_rom_id)
-                    break  # Exit retry loop
-                else:
-                    retry_count += 1
-                    time.sleep(0.2)  # Small delay between retries
+async def run_fuzzy_control():
+    global mode, setpoint, fuzzy_active, fuzzy_run, control_error, current_temp
 
-            if not sensor_detected:
-                lcd_display.clear()
-                lcd_display.move_to(0, 0)
-                lcd_display.putstr("Sensor Error")
-                mode = "menu"
-                time.sleep(2)
-                break  # Exit run_fuzzy_control loop
-        else:
-            # Sensor already detected, just try to read temp directly
-            try:
-                temp_main = sensors.read_temp(sensors.ds_main, main_rom_id)
-            except Exception:
-                # Reading failed, keep temp_main as None to use last valid temp
-                temp_main = None
-
-        try:
-            if temp_main is not None:
-                last_valid_temp = temp_main  # Update last valid temp
-            else:
-                temp_main = last_valid_temp  # Use last valid temp if no new reading
-                time.sleep(0.1)
+    # Retry loop for detecting the main sensor only if not detected yet; the
+    # control side runs the scans
+    retry_count = 0
+    while not tank_has_sensor("main") and retry_count < 10:
+        request_scan()
+        await asyncio.sleep(0.2)  # Small delay between retries
+        read_status()
+        if not tank_has_sensor("main"):
+            retry_count += 1
 
-            if temp_main is not None and setpoint:
-                target_temp = float(setpoint)
-                current_temp = temp_main
-
-                error = target_temp - current_temp
-                now = time.ticks_ms()
-                dt = time.ticks_diff(now, last_time) / 1000
-                delta_error = 0
-                if dt > 0:
-                    delta_error = (error - last_error) / dt
-
-                last_error = error
-                last_time = now
-
-                value = fuzzy_sugeno(error, delta_error)
-                percentage_value = value / 100
-
-                elapsed_time = time.ticks_diff(now, start_time)
-
-                # PRINT TO TERMINAL:
-                print(f"Time: {elapsed_time / 1000:.2f}s, Setpoint: {float(setpoint):.2f}C, Temp: {current_temp:.2f}C, Output : {percentage_value:.2f}%")
-
-                # Control heater servo with fuzzy output
-                duty_heater = percentage_to_duty(percentage_value * 100, "heater")
-                duty_cooler = percentage_to_duty((1 - percentage_value) * 100, "cooler")
-
-                servo_heater.duty_u16(duty_heater)
-                servo_cooler.duty_u16(duty_cooler)
-                
-                # If we're inputting new setpoint, show that UI and capture input
-
-                key = scan_keypad()
-                if key == '*':
-                    mode = "menu"
-                    # Turn off servo when exiting fuzzy control
-                    servo_heater.duty_u16(percentage_to_duty(0, "heater"))
-                    servo_cooler.duty_u16(percentage_to_duty(0, "cooler"))
-                    break
-                elif key == '#' and not inputting_setpoint:
-                    inputting_setpoint = True
-                    new_setpoint = None
-                    lcd_display.clear()
-                    
-                if inputting_setpoint:
-                    result = input_new_setpoint(new_setpoint or setpoint)
-                    if result == "cancel":
-                        inputting_setpoint = False
-                        lcd_display.clear()
-                    elif result is not None:  # New setpoint confirmed
-                        setpoint = result
-                        inputting_setpoint = False
-                        lcd_display.clear()
-                    else:
-                        # Still entering, just continue showing input
-                        pass
+    if not tank_has_sensor("main"):
+        lcd_display.clear()
+        lcd_display.move_to(0, 0)
+        lcd_display.putstr("Sensor Error")
+        mode = "menu"
+        await asyncio.sleep(2)
+        return
 
-                if not inputting_setpoint:
-                    lcd_display.clear()
-                    lcd_display.putstr("Temp: {:.2f} C".format(current_temp))
-                    lcd_display.move_to(0, 1)
-                    lcd_display.putstr("Setpoint: {:.2f} C".format(target_temp))
-                    lcd_display.move_to(0, 2)
-                    lcd_display.putstr("Output: {:.2f}%".format(percentage_value))
-                    lcd_display.move_to(0, 3)
-                    lcd_display.putstr("*:EXIT #:Set New SP")
-            else:
-                # No valid temp or setpoint - turn off heater
-                servo_heater.duty_u16(percentage_to_duty(0, "heater"))
-                servo_cooler.duty_u16(percentage_to_duty(0, "cooler"))
+    # The control side runs the fuzzy loop; this screen only shows it
+    fuzzy_run += 1
+    current_temp = None
+    control_error = False
+    fuzzy_active = True
+    send_commands()
+    lcd_display.clear()
 
-        except Exception as e:
-            print("Exception occurred:", e)
-            import sys
-            import traceback
-            traceback.print_exc()
+    while True:
+        if control_error:
             lcd_display.clear()
             lcd_display.putstr("Error")
-            time.sleep(2)
+            await asyncio.sleep(2)
             break
 
-        time.sleep(0.1)
+        if current_temp is not None:
+            show_fuzzy_screen()
+
+        key = await get_key(CONTROL_PERIOD)
+        if key == '*' or not fuzzy_active:
+            # Left from the keypad or stopped over the serial link
+            mode = "menu"
+            break
+        elif key == '#':
+            lcd_display.clear()
+            result = await input_new_setpoint(setpoint)
+            if result != "cancel":  # New setpoint confirmed
+                setpoint = result
+                send_commands()
+            lcd_display.clear()
+
+    fuzzy_active = False
+    send_commands()
 
-def input_new_setpoint(current_setpoint):
+async def input_new_setpoint(current_setpoint):
 
     lcd_display.move_to(0, 0)
     lcd_display.putstr("Setpoint (20-40 C):")
     lcd_display.move_to(0, 1)
 
     entered = ""
-    # Use a loop that runs for a short time, collecting input, but returns quickly.
-    start_time = time.ticks_ms()
 
     while True:
-        key = scan_keypad()
-        if key:
-            if key.isdigit():
-                if len(entered) < 2:  # limit input length to 2 digits
-                    entered += key
-                    lcd_display.clear()
-                    lcd_display.putstr("Setpoint (20-40 C):")
-                    lcd_display.move_to(0, 1)
-                    lcd_display.putstr(entered + " C")
-                time.sleep(0.2)  # debounce
-            elif key == '#':  # Confirm
-                try:
-                    val = int(entered)
-                    if 20 <= val <= 40:
-                        return str(val)  # valid new setpoint
-                    else:
-                        lcd_display.clear()
-                        lcd_display.putstr("Out of range")
-                        time.sleep(1)
-                        lcd_display.clear()
-                        lcd_display.putstr("Setpoint (20-40 C):")
-                        lcd_display.move_to(0, 1)
-                        entered = ""
-                except:
+        key = await get_key()
+        if key.isdigit():
+            if len(entered) < 2:  # limit input length to 2 digits
+                entered += key
+                lcd_display.clear()
+                lcd_display.putstr("Setpoint (20-40 C):")
+                lcd_display.move_to(0, 1)
+                lcd_display.putstr(entered + " C")
+        elif key == '#':  # Confirm
+            try:
+                val = int(entered)
+                if 20 <= val <= 40:
+                    return str(val)  # valid new setpoint
+                else:
                     lcd_display.clear()
-                    lcd_display.putstr("Invalid input")
-                    time.sleep(1)
+                    lcd_display.putstr("Out of range")
+                    await asyncio.sleep(1)
                     lcd_display.clear()
                     lcd_display.putstr("Setpoint (20-40 C):")
                     lcd_display.move_to(0, 1)
                     entered = ""
-            elif key == '*':  # Cancel
-                return "cancel"
-        # Return None to indicate still entering or no key
-        # But add a timeout so this doesn't hang too long
-        if time.ticks_diff(time.ticks_ms(), start_time) > 5000:  # 5 sec timeout
-            return None
-        time.sleep(0.1)
-        
-def input_setpoint_mode():
+            except:
+                lcd_display.clear()
+                lcd_display.putstr("Invalid input")
+                await asyncio.sleep(1)
+                lcd_display.clear()
+                lcd_display.putstr("Setpoint (20-40 C):")
+                lcd_display.move_to(0, 1)
+                entered = ""
+        elif key == '*':  # Cancel
+            return "cancel"
+
+async def input_setpoint_mode():
     global mode, setpoint
     lcd_display.clear()
     lcd_display.putstr("Setpoint (20-40 C):")  # changed here
@@ -266,92 +810,69 @@ def input_setpoint_mode():
     lcd_display.move_to(0, 1)
 
     while True:
-        interlocks.apply_interlocks()
-        key = scan_keypad()
-        if key:
-            if key.isdigit():
-                setpoint += key
-                lcd_display.clear()
-                lcd_display.putstr("Setpoint (20-40 C):")  # changed here
-                lcd_display.move_to(0, 1)
-                lcd_display.putstr(setpoint + " C")
-            elif key == '#':  # Confirm
-                try:
-                    val = int(setpoint)
-                    if 20 <= val <= 40:  # changed range here
-                        lcd_display.clear()
-                        lcd_display.putstr("SP saved: {} C".format(val))
-                        setpoint = str(val)
-                        time.sleep(2)
-
-                        # Option after saving setpoint
-                        lcd_display.clear()
-                        lcd_display.putstr("#: Mulai Fuzzy")
-                        lcd_display.move_to(0, 1)
-                        lcd_display.putstr("*: Kembali")
-
-                        while True:
-                            key2 = scan_keypad()
-                            if key2 == "#":
-                                run_fuzzy_control()
-                                break
-                            elif key2 == "*":
-                                mode = "menu"
-                                break
-                            time.sleep(0.1)
-                        break  # exit input_setpoint_mode()
-                    else:
-                        lcd_display.clear()
-                        lcd_display.putstr("Out of range")
-                        time.sleep(2)
-                        lcd_display.clear()
-                        lcd_display.putstr("Setpoint (20-40 C):")  # changed here
-                        setpoint = ""
-                except:
+        key = await get_key()
+        if key.isdigit():
+            setpoint += key
+            lcd_display.clear()
+            lcd_display.putstr("Setpoint (20-40 C):")  # changed here
+            lcd_display.move_to(0, 1)
+            lcd_display.putstr(setpoint + " C")
+        elif key == '#':  # Confirm
+            try:
+                val = int(setpoint)
+                if 20 <= val <= 40:  # changed range here
                     lcd_display.clear()
-                    lcd_display.putstr("Invalid input")
-                    time.sleep(2)
+                    lcd_display.putstr("SP saved: {} C".format(val))
+                    setpoint = str(val)
+                    await asyncio.sleep(2)
+
+                    # Option after saving setpoint
+                    lcd_display.clear()
+                    lcd_display.putstr("#: Mulai Fuzzy")
+                    lcd_display.move_to(0, 1)
+                    lcd_display.putstr("*: Kembali")
+
+                    while True:
+                        key2 = await get_key()
+                        if key2 == "#":
+                            await run_fuzzy_control()
+                            break
+                        elif key2 == "*":
+                            mode = "menu"
+                            break
+                    break  # exit input_setpoint_mode()
+                else:
+                    lcd_display.clear()
+                    lcd_display.putstr("Out of range")
+                    await asyncio.sleep(2)
                     lcd_display.clear()
                     lcd_display.putstr("Setpoint (20-40 C):")  # changed here
                     setpoint = ""
-            elif key == '*':  # Cancel
-                mode = "menu"
-                break
-        time.sleep(0.1)
+            except:
+                lcd_display.clear()
+                lcd_display.putstr("Invalid input")
+                await asyncio.sleep(2)
+                lcd_display.clear()
+                lcd_display.putstr("Setpoint (20-40 C):")  # changed here
+                setpoint = ""
+        elif key == '*':  # Cancel
+            mode = "menu"
+            break
 
 
-def baca_suhu_mode():
+async def baca_suhu_mode():
     global mode
     lcd_display.clear()
     lcd_display.putstr("Baca Sensor Suhu")
-    time.sleep(1)
+    request_scan()
+    await asyncio.sleep(1)
 
     while True:
-        interlocks.apply_interlocks()
         try:
-            heater_roms, cooler_roms, main_roms = sensors.scan_sensors()
-
-            temp_heater = None
-            temp_cooler = None
-            temp_main = None
-
-            if heater_roms:
-                try:
-                    temp_heater = sensors.read_temp(sensors.ds_heater, heater_roms[0])
-                except Exception:
-                    temp_heater = None
-
-            if cooler_roms:
-                try:
-                    temp_cooler = sensors.read_temp(sensors.ds_cooler, cooler_roms[0])
-                except Exception:
-                    temp_cooler = None
-
-            if main_roms:
-                try:
-                    temp_main = sensors.read_temp(sensors.ds_main, main_roms[0])
-                except Exception:
-                    temp_main = None
+            # The control side runs the conversions; show the latest readings
+            temp_heater = tank_temp("heater")
+            temp_cooler = tank_temp("cooler")
+            temp_main = tank_temp("main")
 
             lcd_display.clear()
             lcd_display.putstr("Heater: {} C".format(f"{temp_heater:.2f}" if temp_heater is not None else "N/A"))
@@ -362,71 +883,71 @@ def baca_suhu_mode():
             lcd_display.move_to(0, 3)
             lcd_display.putstr("Press '*' to exit")
 
-            key = scan_keypad()
+            key = await get_key(0.5)
             if key == '*':
                 mode = "menu"
                 break
 
-            time.sleep(0.5)
-
-        except Exception as e:
+        except Exception:
             lcd_display.clear()
             lcd_display.putstr("Sensor error")
-            time.sleep(2)
+            await asyncio.sleep(2)
             break
-            
-def print_level_readings():
-    raw_LH_Heater, raw_LL_Heater, raw_LH_Cooler, raw_LL_Cooler = adc_levels.read_adc_level1()
-    raw_LL_Utama, raw_LH_Utama = adc_levels.read_adc_level2()
 
-    val_LL_Heater = adc_levels.raw_to_voltage_level1(raw_LL_Heater)
-    val_LH_Heater = adc_levels.raw_to_voltage_level1(raw_LH_Heater)
-    val_LL_Cooler = adc_levels.raw_to_voltage_level1(raw_LL_Cooler)
-    val_LH_Cooler = adc_levels.raw_to_voltage_level1(raw_LH_Cooler)
-    val_LL_Utama = adc_levels.raw_to_voltage_level2(raw_LL_Utama)
-    val_LH_Utama = adc_levels.raw_to_voltage_level2(raw_LH_Utama)
+def print_level_readings():
+    for i, tank in enumerate(tanks.TANKS):
+        ll = tanks.ll_slot(i)
+        lh = tanks.lh_slot(i)
+        print("{} LL:{:.2f} LH:{:.2f}".format(
+            tank.name,
+            adc_levels.raw_to_voltage(ll, level_raw(ll)),
+            adc_levels.raw_to_voltage(lh, level_raw(lh))))
 
-def baca_level_mode():
+async def baca_level_mode():
     global mode
     lcd_display.clear()
     lcd_display.putstr("Baca Sensor Level")
-    time.sleep(1)
+    await asyncio.sleep(1)
+    page = 0
+    pages = (len(tanks.TANKS) + 2) // 3
 
     while True:
-        # Read all raw ADC values at once
-        interlocks.apply_interlocks()
-        raw_LH_Heater, raw_LL_Heater, raw_LH_Cooler, raw_LL_Cooler = adc_levels.read_adc_level1()
-        raw_LL_Utama, raw_LH_Utama = adc_levels.read_adc_level2()
-
-        # Convert raw to voltage
-        val_LL_Heater = adc_levels.raw_to_voltage_level1(raw_LL_Heater)
-        val_LH_Heater = adc_levels.raw_to_voltage_level1(raw_LH_Heater)
-        val_LL_Cooler = adc_levels.raw_to_voltage_level1(raw_LL_Cooler)
-        val_LH_Cooler = adc_levels.raw_to_voltage_level1(raw_LH_Cooler)
-        val_LL_Utama = adc_levels.raw_to_voltage_level2(raw_LL_Utama)
-        val_LH_Utama = adc_levels.raw_to_voltage_level2(raw_LH_Utama)
-
-        # Update LCD with readings
-        lcd_display.move_to(0, 0)
-        lcd_display.putstr("Htr L:{:.2f} H:{:.2f}  ".format(val_LL_Heater, val_LH_Heater))
-        lcd_display.move_to(0, 1)
-        lcd_display.putstr("Clr L:{:.2f} H:{:.2f}  ".format(val_LL_Cooler, val_LH_Cooler))
-        lcd_display.move_to(0, 2)
-        lcd_display.putstr("UtmaL:{:.2f} H:{:.2f}  ".format(val_LL_Utama, val_LH_Utama))
+        # Raw ADC values of the last interlock pass, three tanks per page
+        for row in range(3):
+            i = page * 3 + row
+            lcd_display.move_to(0, row)
+            if i >= len(tanks.TANKS):
+                lcd_display.putstr(" " * 20)
+                continue
+            ll = tanks.ll_slot(i)
+            lh = tanks.lh_slot(i)
+            lcd_display.putstr("{}L:{:.2f} H:{:.2f}  ".format(
+                tanks.TANKS[i].label,
+                adc_levels.raw_to_voltage(ll, level_raw(ll)),
+                adc_levels.raw_to_voltage(lh, level_raw(lh))))
         lcd_display.move_to(0, 3)
         lcd_display.putstr("(*) Kembali      ")
 
-        # Check for exit key
-        key = scan_keypad()
+        # Check for exit key; B shows the next page of tanks
+        key = await get_key(0.5)
         if key == "*":
             mode = "menu"
             break
+        elif key == "B":
+            page = (page + 1) % pages
+
 
-        time.sleep(0.5)
+async def kontrol_manual_mode():
+    global mode, relay_1_status, relay_2_status, reassert_requests
 
-        
-def kontrol_manual_mode():
-    global mode, relay_1_status, relay_2_status
+    # Fuzzy control started over the serial link drives the same outputs;
+    # it has to be stopped first
+    if fuzzy_active:
+        lcd_display.clear()
+        lcd_display.putstr("Fuzzy Aktif!")
+        await asyncio.sleep(2)
+        mode = "menu"
+        return
 
     relay_1_status = False
     relay_2_status = False
@@ -435,120 +956,160 @@ def kontrol_manual_mode():
     lcd_display.move_to(0, 3)
     lcd_display.putstr("(*) Kembali")
     max_retries = 3
-    retry_delay = 0.5  # seconds
 
     while True:
-        # Try to read interlocks with retries
-        for attempt in range(max_retries):
-            try:
-                relay1_locked, relay2_locked, servo_locked = interlocks.apply_interlocks()
-                break  # success, exit retry loop
-            except Exception as e:
-                time.sleep(retry_delay)
-        else:
-            time.sleep(2)
+        # Leave if the interlocks keep failing
+        if interlock_errors >= max_retries:
+            await asyncio.sleep(2)
             mode = "menu"
             break
-        
-        key = scan_keypad()
+
+        key = await get_key(0.1)
         if key:
             if key == "*":
                 mode = "menu"
                 break
-            elif key == "1":
+            # Keys of outputs the tank registry doesn't have are ignored
+            elif key == "1" and servo_heater is not None:
                 if servo_locked:
                     lcd_display.move_to(0, 1)
                     lcd_display.putstr("Servo Heater Locked!")
                 else:
-                    servo_states["heater"] = not servo_states["heater"]
-                    pos = 100 if servo_states["heater"] else 0
-                    servo_heater.duty_u16(percentage_to_duty(pos, "heater"))
-                    
+                    name = servo_heater.name
+                    servo_states[name] = not servo_states[name]
+                    pos = 100 if servo_states[name] else 0
+                    with interlocks.output_lock:
+                        servo_heater.set_percent(pos)
+
                     lcd_display.move_to(0, 1)
-                    if servo_states["utama"]:
+                    if servo_states[name]:
                         lcd_display.putstr("Servo Heater Opened  ")
                     else:
                         lcd_display.putstr("Servo Heater Closed  ")
-                        
-            elif key == "2":
+
+            elif key == "2" and servo_cooler is not None:
                 if servo_locked:
                     lcd_display.move_to(0, 1)
                     lcd_display.putstr("Servo Cooler Locked!")
                 else:
-                    servo_states["cooler"] = not servo_states["cooler"]
-                    pos = 100 if servo_states["cooler"] else 0
-                    servo_cooler.duty_u16(percentage_to_duty(pos, "cooler"))
-                    
+                    name = servo_cooler.name
+                    servo_states[name] = not servo_states[name]
+                    pos = 100 if servo_states[name] else 0
+                    with interlocks.output_lock:
+                        servo_cooler.set_percent(pos)
+
                     lcd_display.move_to(0, 1)
-                    if servo_states["utama"]:
+                    if servo_states[name]:
                         lcd_display.putstr("Servo Cooler Opened  ")
                     else:
                         lcd_display.putstr("Servo Cooler Closed  ")
 
-            elif key == "3":
+            elif key == "3" and servo_utama is not None and servo_locked:
+                lcd_display.move_to(0, 1)
+                lcd_display.putstr("Servo Utama Locked! ")
+
+            elif key == "3" and servo_utama is not None:
                 lcd_display.move_to(0, 1)
                 lcd_display.putstr("               ")
-                servo_states["utama"] = not servo_states["utama"]
-                pos = 100 if servo_states["utama"] else 0
-                servo_utama.duty_u16(percentage_to_duty(pos, "utama"))
-                
+                name = servo_utama.name
+                servo_states[name] = not servo_states[name]
+                pos = 100 if servo_states[name] else 0
+                with interlocks.output_lock:
+                    servo_utama.set_percent(pos)
+
                 lcd_display.move_to(0, 1)
-                if servo_states["utama"]:
+                if servo_states[name]:
                     lcd_display.putstr("Servo Utama Opened  ")
                 else:
                     lcd_display.putstr("Servo Utama Closed  ")
-                    
 
-            elif key == "C":
+
+            elif key == "C" and relays.RELAY_1 is not None:
                 if relay1_locked:
                     lcd_display.move_to(0, 1)
                     lcd_display.putstr("Relay Heater Locked!")
                 else:
                     if relay_1_status:
-                        relays.relay_1_off()
+                        with interlocks.output_lock:
+                            relays.relay_1_off()
                         relay_1_status = False
                         lcd_display.move_to(0, 1)
                         lcd_display.putstr("Relay Heater OFF   ")
                     else:
-                        relays.relay_1_on()
+                        with interlocks.output_lock:
+                            relays.relay_1_on()
                         relay_1_status = True
                         lcd_display.move_to(0, 1)
                         lcd_display.putstr("Relay Heater ON    ")
 
-            elif key == "D":
+            elif key == "D" and relays.RELAY_2 is not None:
                 if relay2_locked:
                     lcd_display.move_to(0, 1)
                     lcd_display.putstr("Relay Cooler Locked!")
                 else:
                     if relay_2_status:
-                        relays.relay_2_off()
+                        with interlocks.output_lock:
+                            relays.relay_2_off()
                         relay_2_status = False
                         lcd_display.move_to(0, 1)
                         lcd_display.putstr("Relay Cooler OFF   ")
                     else:
-                        relays.relay_2_on()
+                        with interlocks.output_lock:
+                            relays.relay_2_on()
                         relay_2_status = True
                         lcd_display.move_to(0, 1)
                         lcd_display.putstr("Relay Cooler ON    ")
-                    
-
-        time.sleep(0.1)
-
-initialize_servos()
-
-while True:
-    interlocks.apply_interlocks()
-    if mode == "menu":
-        handle_menu()
-    elif mode == "input_setpoint":
-        input_setpoint_mode()
-    elif mode == "baca_suhu":
-        baca_suhu_mode()
-    elif mode == "baca_level":
-        baca_level_mode()
-    elif mode == "kontrol_manual":
-        kontrol_manual_mode()
+
+    # The interlocks only write on changes: have them reassert their
+    # outputs over whatever was set by hand
+    reassert_requests += 1
+    send_commands()
+
+async def ui_task():
+    global mode
+    while True:
+        if mode == "menu":
+            await handle_menu()
+        elif mode == "input_setpoint":
+            await input_setpoint_mode()
+        elif mode == "baca_suhu":
+            await baca_suhu_mode()
+        elif mode == "baca_level":
+            await baca_level_mode()
+        elif mode == "kontrol_manual":
+            await kontrol_manual_mode()
+        else:
+            mode = "menu"
+
+        await asyncio.sleep(0.1)
+
+async def main():
+    # The rest of this file has been imported and set up since the first
+    # interlock pass at the top
+    profiler.boot_record("modules", _modules_start)
+    profiler.enabled = PROFILE
+
+    # The sensor ROM lookup and the LCD come up in their own tasks (or on
+    # core 1), concurrently; the UI starts from the interlocks' state
+    control_side.interlock_step()
+    control_side.publish()
+    read_status()
+    keypad.start()
+    if DUAL_CORE:
+        import _thread
+        _thread.start_new_thread(control_core, ())
     else:
-        mode = "menu"
+        interlocks.on_alert(lambda pin: level_alert.set())
+        asyncio.create_task(interlock_task())
+        asyncio.create_task(temp_task())
+        asyncio.create_task(control_task())
+    # Telemetry goes out from core 0 in both modes, with the rest of the
+    # serial output
+    asyncio.create_task(telemetry_task())
+    asyncio.create_task(status_task())
+    asyncio.create_task(keypad_task())
+    asyncio.create_task(display_task())
+    asyncio.create_task(console_task())
+    await ui_task()
 
-    time.sleep(0.1)
\ No newline at end of file
+asyncio.run(main())
@@ -0,0 +1,179 @@
+import time
+from array import array
+
+# Per-stage timing with time.ticks_us(). Every stage gets a slot in
+# preallocated arrays when it is created, so recording a sample never
+# allocates. With enabled False a timed section costs one flag test.
+#
+# Histogram bucket b counts samples of 2**b to 2**(b+1) - 1 usec (bucket 0
+# also takes 0 and 1 usec); the last bucket takes everything longer.
+#
+# Stage timers only measure synchronous code: an await inside a timed
+# section would add the time spent in other tasks.
+#
+# A wrapper forwarding any arguments builds an argument tuple and dict on
+# every call, enabled or not, so timed() only wraps functions while
+# TIME_CALLS is set. It is read when the decorated module is imported:
+# change it here, not at run time.
+
+MAX_STAGES = 24
+NUM_BUCKETS = 20         # Last bucket starts at 2**19 usec (~0.5 s)
+_NO_MIN = 0x3FFFFFFF     # Kept below 2**30 so it stays a small int
+
+enabled = False
+TIME_CALLS = False
+
+names = []
+counts = array('L', [0] * MAX_STAGES)
+mins = array('L', [_NO_MIN] * MAX_STAGES)
+maxs = array('L', [0] * MAX_STAGES)
+# Totals are split in whole seconds and the usec remainder, so neither
+# grows past a small int
+sum_s = array('L', [0] * MAX_STAGES)
+sum_us = array('L', [0] * MAX_STAGES)
+hist = array('L', [0] * (MAX_STAGES * NUM_BUCKETS))
+
+def register(name):
+    """
+    Returns the slot of a stage, creating it if needed.
+    """
+    if name in names:
+        return names.index(name)
+    if len(names) >= MAX_STAGES:
+        raise ValueError("too many profiler stages")
+    names.append(name)
+    return len(names) - 1
+
+def record(i, dt):
+    # Adds one sample of dt usec to stage slot i
+    counts[i] += 1
+    if dt < mins[i]:
+        mins[i] = dt
+    if dt > maxs[i]:
+        maxs[i] = dt
+    total = sum_us[i] + dt
+    if total >= 1000000:
+        sum_s[i] += total // 1000000
+        total %= 1000000
+    sum_us[i] = total
+    b = 0
+    while dt > 1 and b < NUM_BUCKETS - 1:
+        dt >>= 1
+        b += 1
+    hist[i * NUM_BUCKETS + b] += 1
+
+class Stage:
+    """
+    Context manager timing one stage:
+
+        _lcd_stage = profiler.Stage("lcd.flush")
+        with _lcd_stage:
+            ...
+
+    Create it once, at module level, and reuse it.
+    """
+
+    def __init__(self, name):
+        self.index = register(name)
+        self.t0 = 0
+
+    def __enter__(self):
+        if enabled:
+            self.t0 = time.ticks_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if enabled and self.t0:
+            record(self.index, time.ticks_diff(time.ticks_us(), self.t0))
+        self.t0 = 0
+
+def timed(name):
+    """
+    Decorator timing every call of a function as one stage. Leaves the
+    function as it is unless TIME_CALLS is set.
+    """
+    index = register(name)
+
+    def decorate(func):
+        if not TIME_CALLS:
+            return func
+
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            t0 = time.ticks_us()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(index, time.ticks_diff(time.ticks_us(), t0))
+        return wrapper
+    return decorate
+
+def reset():
+    for i in range(MAX_STAGES):
+        counts[i] = 0
+        mins[i] = _NO_MIN
+        maxs[i] = 0
+        sum_s[i] = 0
+        sum_us[i] = 0
+    for i in range(len(hist)):
+        hist[i] = 0
+
+def dump(out=print):
+    """
+    Prints one line per stage that has samples: count, min/mean/max in usec
+    and the non-empty histogram buckets as bucket:count.
+    """
+    out("stage              n      min     mean      max  log2(us):n")
+    for i, name in enumerate(names):
+        n = counts[i]
+        if not n:
+            continue
+        mean = (sum_s[i] * 1000000 + sum_us[i]) // n
+        buckets = " ".join("{}:{}".format(b, hist[i * NUM_BUCKETS + b])
+                           for b in range(NUM_BUCKETS) if hist[i * NUM_BUCKETS + b])
+        out("{:<14} {:>6} {:>8} {:>8} {:>8}  {}".format(
+            name[:14], n, mins[i], mean, maxs[i], buckets))
+
+
+# Boot phases. Unlike stages they are always recorded, once each, as start
+# and end in usec since reset (ticks_us() starts at 0 on power-up), so
+# phases that overlap, like the LCD coming up while the interlocks already
+# run, show as such. A phase that raised is kept and marked failed.
+
+boot_phases = []         # (name, start_us, end_us, ok)
+
+def boot_record(name, start_us, end_us=None, ok=True):
+    if end_us is None:
+        end_us = time.ticks_us()
+    boot_phases.append((name, start_us, end_us, ok))
+
+class BootPhase:
+    """
+    Context manager timing one boot phase:
+
+        with profiler.BootPhase("lcd"):
+            ...
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.t0 = 0
+
+    def __enter__(self):
+        self.t0 = time.ticks_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        boot_record(self.name, self.t0, ok=exc_type is None)
+
+def boot_report(out=print):
+    """
+    Prints every boot phase with its start, end and duration in msec since
+    reset, in the order they finished.
+    """
+    out("boot phase        start      end   duration")
+    for name, start, end, ok in boot_phases:
+        out("{:<14} {:>8.1f} {:>8.1f} {:>8.1f}{}".format(
+            name[:14], start / 1000, end / 1000, time.ticks_diff(end, start) / 1000,
+            "" if ok else "  failed"))
@@ -1,32 +1,44 @@
 from machine import Pin
+import tanks
 
-relay_1 = Pin(11, Pin.OUT)
-relay_2 = Pin(10, Pin.OUT)
+# Fill relay of every tank in the registry, None where a tank has none
+pins = [Pin(tank.relay_pin, Pin.OUT) if tank.relay_pin is not None else None
+        for tank in tanks.TANKS]
 
 # True = OFF, False = ON (inverted logic)
-relay_1_status = True
-relay_2_status = True
+status = [True] * len(pins)
 
-relay_1.high()
-relay_2.high()
+for pin in pins:
+    if pin is not None:
+        pin.high()
+
+def relay_on(i):
+    pins[i].low()
+    status[i] = False
+
+def relay_off(i):
+    pins[i].high()
+    status[i] = True
+
+# Relays 1 and 2 of the manual control screen are the first two tanks with
+# a relay, None if the registry has fewer; switching a missing one does
+# nothing
+_numbered = [i for i, pin in enumerate(pins) if pin is not None]
+RELAY_1 = _numbered[0] if len(_numbered) > 0 else None
+RELAY_2 = _numbered[1] if len(_numbered) > 1 else None
 
 def relay_1_on():
-    global relay_1_status
-    relay_1.low()
-    relay_1_status = False
+    if RELAY_1 is not None:
+        relay_on(RELAY_1)
 
 def relay_1_off():
-    global relay_1_status
-    relay_1.high()
-    relay_1_status = True
+    if RELAY_1 is not None:
+        relay_off(RELAY_1)
 
 def relay_2_on():
-    global relay_2_status
-    relay_2.low()
-    relay_2_status = False
+    if RELAY_2 is not None:
+        relay_on(RELAY_2)
 
 def relay_2_off():
-    global relay_2_status
-    relay_2.high()
-    relay_2_status = True
-
+    if RELAY_2 is not None:
+        relay_off(RELAY_2)
@@ -1,23 +1,188 @@
 import onewire, ds18x20
 from machine import Pin
 import time
+import devices
+import profiler
+import tanks
 
-ds_heater = ds18x20.DS18X20(onewire.OneWire(Pin(26)))
-ds_cooler = ds18x20.DS18X20(onewire.OneWire(Pin(27)))
-ds_main = ds18x20.DS18X20(onewire.OneWire(Pin(28)))
-
-def scan_sensors():
-    heater_roms = ds_heater.scan()
-    cooler_roms = ds_cooler.scan()
-    main_roms = ds_main.scan()
-    return heater_roms, cooler_roms, main_roms
-
-def read_temp(ds_sensor, rom):
-    try:
-        ds_sensor.convert_temp()
-        time.sleep(0.75)
-        temp = ds_sensor.read_temp(rom)
-    except Exception as e:
-        temp = None
-    return temp
+# One DS18B20 bus per tank in the registry
+buses = [ds18x20.DS18X20(onewire.OneWire(Pin(tank.sensor_pin))) for tank in tanks.TANKS]
 
+# Conversion time of the DS18B20 at 9, 10, 11 and 12 bits (datasheet
+# maximum, rounded up). 12 bits is the power-on default.
+CONVERSION_MS = (94, 188, 375, 750)
+DEFAULT_BITS = 12
+
+# Scratchpad bytes written to set the resolution: TH and TL (the alarm
+# thresholds, unused here, at their power-on values) and the config byte
+_TH = 75
+_TL = 70
+
+def conversion_ms(bits):
+    return CONVERSION_MS[bits - 9]
+
+def config_byte(bits):
+    return ((bits - 9) << 5) | 0x1F
+
+def at_resolution(temp, bits):
+    # At 9, 10 and 11 bits the low 3, 2 or 1 bits of the temperature register
+    # are undefined, and ds18x20.read_temp() passes them on: clear them, i.e.
+    # round down to the resolution's step. bits 0 (unknown) leaves temp as is.
+    if temp is None or not bits or bits >= 12:
+        return temp
+    drop = 12 - bits
+    return (int(round(temp * 16)) >> drop << drop) / 16
+
+# Adaptive resolution: far from setpoint a coarse reading is as useful as a
+# fine one and arrives up to 8x sooner. (abs error in C from which, bits),
+# coarsest first; every step's resolution (0.5 C at 9 bits) stays well
+# below the error it is used at.
+RESOLUTION_STEPS = ((4.0, 9), (2.0, 10), (1.0, 11))
+RESOLUTION_HYSTERESIS = 0.25
+
+def _bits_for(error):
+    if error < 0:
+        error = -error
+    for limit, bits in RESOLUTION_STEPS:
+        if error >= limit:
+            return bits
+    return DEFAULT_BITS
+
+def resolution_for(error, bits=DEFAULT_BITS):
+    """
+    Resolution for a control error, given the current one. Coarser as soon
+    as the error calls for it; finer only once the error is
+    RESOLUTION_HYSTERESIS inside the finer band, so it doesn't flap at a
+    step.
+    """
+    want = _bits_for(error)
+    if want < bits:
+        return want
+    error = error + RESOLUTION_HYSTERESIS if error >= 0 else error - RESOLUTION_HYSTERESIS
+    want = _bits_for(error)
+    return want if want > bits else bits
+
+_read_stage = profiler.Stage("ds.read")
+
+
+class TempSampler:
+    """
+    Runs the DS18B20 conversions of all buses side by side without blocking.
+    Call poll() often; it collects each bus's result once the conversion
+    time of that sensor's resolution has passed and immediately starts its
+    next conversion. latest() returns the last good reading and the
+    ticks_ms() timestamp it was taken at. set_resolution() takes effect
+    from the next conversion of that bus.
+
+    Per-bus state is kept in lists indexed like names and buses.
+    """
+
+    def __init__(self, names, buses):
+        self.names = tuple(names)
+        self.buses = buses
+        n = len(buses)
+        self.roms = [None] * n
+        self.temps = [None] * n
+        self.stamps = [None] * n
+        self.errors = [0] * n
+        self.started = [None] * n
+        # Resolution each sensor is set to (0 until written, as its EEPROM
+        # may hold another one than the default) and the one asked for
+        self.bits = bytearray(n)
+        self.wanted = bytearray([DEFAULT_BITS] * n)
+        self.scratch = bytearray((_TH, _TL, 0))
+
+    def scan(self):
+        """
+        Fill in the ROM of every bus that has none yet, from the device
+        registry if possible and by a bus search otherwise.
+        """
+        for i in range(len(self.buses)):
+            if self.roms[i] is None:
+                rom = devices.get_rom(self.names[i])
+                if rom is None:
+                    rom = self.search(i)
+                self.roms[i] = rom
+        devices.save()
+        return self.roms
+
+    @profiler.timed("ds.search")
+    def search(self, i):
+        # Full OneWire search of one bus; the result goes into the registry
+        try:
+            roms = self.buses[i].scan()
+        except Exception:
+            roms = None
+        rom = roms[0] if roms else None
+        devices.set_rom(self.names[i], rom)
+        return rom
+
+    def set_resolution(self, i, bits):
+        self.wanted[i] = bits
+
+    @profiler.timed("ds.convert")
+    def start(self, i):
+        # Start a conversion on bus i, first writing the resolution if it
+        # has to change
+        ds = self.buses[i]
+        try:
+            bits = self.wanted[i]
+            if bits != self.bits[i]:
+                self.bits[i] = 0
+                self.scratch[2] = config_byte(bits)
+                ds.write_scratch(self.roms[i], self.scratch)
+                self.bits[i] = bits
+            ds.convert_temp()
+        except Exception:
+            self.errors[i] += 1
+        self.started[i] = time.ticks_ms()
+
+    def poll(self):
+        """
+        Collect finished conversions. Returns True if new readings arrived.
+        """
+        now = time.ticks_ms()
+        fresh = False
+        roms = self.roms
+        for i, ds in enumerate(self.buses):
+            rom = roms[i]
+            if rom is None:
+                continue
+            started = self.started[i]
+            if started is None:
+                self.start(i)
+                continue
+            # A sensor whose resolution is unknown gets the longest wait
+            if time.ticks_diff(now, started) < conversion_ms(self.bits[i] or DEFAULT_BITS):
+                continue
+            with _read_stage:
+                try:
+                    temp = at_resolution(ds.read_temp(rom), self.bits[i])
+                except Exception:
+                    temp = None
+            if temp is None:
+                # The cached ROM may be stale (sensor swapped or unplugged)
+                self.errors[i] += 1
+                roms[i] = self.search(i)
+                devices.save()
+                self.bits[i] = 0
+                if roms[i] is None:
+                    self.started[i] = None
+                    continue
+            else:
+                self.temps[i] = temp
+                self.stamps[i] = now
+                fresh = True
+            self.start(i)
+        return fresh
+
+    def rom(self, name):
+        return self.roms[self.names.index(name)]
+
+    def latest(self, name):
+        # Last good reading of a bus and its ticks_ms() timestamp
+        i = self.names.index(name)
+        return self.temps[i], self.stamps[i]
+
+
+sampler = TempSampler(tanks.NAMES, buses)
@@ -0,0 +1,341 @@
+import struct
+import sys
+import time
+import select
+from array import array
+
+# Framed binary protocol on the USB serial console, for a supervisory PC:
+# snapshots and subscriptions of named variables, setpoint and mode
+# commands. Frames share the port with print() text and telemetry blocks;
+# bytes outside a frame go to the console handler, and the host skips
+# whatever isn't a frame. tools/link_client.py is the host side.
+#
+#   frame: sync 0xAA 0x55, payload length, type, sequence number, payload,
+#          CRC-16/CCITT-FALSE of length..payload, little endian
+#
+# A reply echoes the sequence number of its request. STREAM frames number
+# themselves, so the host can count the ones it lost. A 0xAA 0x55 in other
+# output starts a false frame that can swallow up to FRAME_SIZE bytes, real
+# frames among them: when its CRC fails or it times out, the parser rescans
+# what it took in from the byte after the false sync on.
+#
+# Any byte can turn up in a frame, 0x03 included, which the REPL takes for
+# Ctrl-C: it would raise KeyboardInterrupt and stop the firmware. On the
+# console the link therefore turns Ctrl-C off with micropython.kbd_intr(-1)
+# when it starts, unless created with raw=False, which keeps the REPL
+# reachable during development at the price of that risk.
+
+SYNC = b'\xaa\x55'
+HEADER_SIZE = 5
+CRC_SIZE = 2
+MAX_PAYLOAD = 255
+FRAME_SIZE = HEADER_SIZE + MAX_PAYLOAD + CRC_SIZE
+MAX_VARIABLES = 32
+
+# Requests, host -> Pico
+PING = 0x01              # -> ACK
+LIST = 0x02              # first index (u8) -> NAMES
+SNAPSHOT = 0x03          # variable mask (u32), 0 for all -> DATA
+SUBSCRIBE = 0x04         # period ms (u16), variable mask (u32) -> ACK; 0 ms stops
+SETPOINT = 0x05          # setpoint in C (f32) -> ACK
+MODE = 0x06              # 1 starts fuzzy control, 0 stops it (u8) -> ACK
+
+# Replies and the stream, Pico -> host
+ACK = 0x81               # request type (u8), status (u8)
+NAMES = 0x82             # first index (u8), total (u8), names, NUL terminated
+DATA = 0x83              # ticks_ms (u32), mask (u32), f32 per set mask bit
+STREAM = 0x84            # as DATA, every subscribed period
+
+# ACK status
+OK = 0
+BAD_REQUEST = 1          # Unknown type or wrong payload length
+OUT_OF_RANGE = 2
+REFUSED = 3              # Valid, but not possible now (e.g. no sensor)
+
+MIN_PERIOD_MS = 20       # Fastest subscription
+FRAME_TIMEOUT_MS = 200   # A frame that stalls this long is dropped
+MAX_READ = 64            # Bytes read per poll()
+
+def _crc_table():
+    table = array('H', [0] * 256)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = (crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1
+        table[i] = crc & 0xFFFF
+    return table
+
+_CRC_TABLE = _crc_table()
+
+def crc16(data, start=0, end=None, crc=0xFFFF):
+    # CRC-16/CCITT-FALSE of data[start:end]
+    table = _CRC_TABLE
+    if end is None:
+        end = len(data)
+    for i in range(start, end):
+        crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ data[i]]
+    return crc
+
+def encode(kind, seq, payload=b''):
+    """
+    Returns a whole frame as bytes. For the host side and tests; the Pico
+    builds its frames in place.
+    """
+    frame = bytearray(HEADER_SIZE + len(payload) + CRC_SIZE)
+    frame[0:2] = SYNC
+    frame[2] = len(payload)
+    frame[3] = kind
+    frame[4] = seq & 0xFF
+    frame[HEADER_SIZE:HEADER_SIZE + len(payload)] = payload
+    crc = crc16(frame, 2, HEADER_SIZE + len(payload))
+    frame[-2] = crc & 0xFF
+    frame[-1] = crc >> 8
+    return bytes(frame)
+
+class Parser:
+    """
+    Finds frames in a byte stream, one byte at a time. feed() returns the
+    frame's type once a frame with a good CRC is complete (its payload is
+    buf[HEADER_SIZE:HEADER_SIZE + length()]), -1 for a byte that isn't
+    part of a frame, and 0 otherwise.
+
+    A dropped frame's bytes after its sync are held back to be scanned
+    again: while pending(), feed take() before the next new byte.
+    """
+
+    def __init__(self):
+        self.buf = bytearray(FRAME_SIZE)
+        self.pos = 0
+        self.held = 0        # Bytes held back by a resync: buf[held:held_end]
+        self.held_end = 0
+        self.errors = 0      # Frames dropped for a bad CRC or a timeout
+
+    def length(self):
+        return self.buf[2]
+
+    def seq(self):
+        return self.buf[4]
+
+    def pending(self):
+        return self.held_end - self.held
+
+    def take(self):
+        # The next held back byte
+        held = self.held
+        self.held = held + 1
+        return self.buf[held]
+
+    def drop(self):
+        # Gives up on a frame that stopped arriving part way through
+        if self.pos:
+            self.errors += 1
+            self._resync()
+
+    def _resync(self):
+        # Holds back buf[1:pos] with any bytes still held from an earlier
+        # resync behind it. Frame bytes are written at pos, which never
+        # passes the held bytes still to be read.
+        buf = self.buf
+        pos = self.pos
+        held = self.held_end - self.held
+        if held:
+            buf[pos:pos + held] = buf[self.held:self.held_end]
+        self.held = 1
+        self.held_end = pos + held
+        self.pos = 0
+
+    def feed(self, byte):
+        buf = self.buf
+        pos = self.pos
+        if pos == 0:
+            if byte != 0xAA:
+                return -1
+        elif pos == 1 and byte != 0x55:
+            self.pos = 1 if byte == 0xAA else 0
+            return -1
+        buf[pos] = byte
+        pos += 1
+        self.pos = pos
+        if pos < HEADER_SIZE:
+            return 0
+        end = HEADER_SIZE + buf[2]
+        if pos < end + CRC_SIZE:
+            return 0
+        if crc16(buf, 2, end) != buf[end] | (buf[end + 1] << 8):
+            self.errors += 1
+            self._resync()
+            return 0
+        self.pos = 0
+        return buf[3]
+
+class _Console:
+    # The USB serial console as the link's port
+    def __init__(self, raw):
+        if raw:
+            import micropython
+            micropython.kbd_intr(-1)
+        self.poll_obj = sys.stdin
+        self.reader = sys.stdin.buffer
+        self.writer = sys.stdout.buffer
+
+class SerialLink:
+    """
+    Serves the protocol from poll(), which its task calls regularly. names
+    are the variables in index order, and values an array('f') of them the
+    owner keeps current. handler(kind, value) carries out a SETPOINT (float)
+    or MODE (int) request and returns the ACK status. Bytes outside frames
+    go to on_byte(byte). port defaults to the serial console, with Ctrl-C
+    turned off unless raw is False; anything with poll_obj, reader.read(1)
+    and writer.write() will do.
+    """
+
+    def __init__(self, names, values, handler, on_byte=None, port=None, raw=True):
+        if len(names) > MAX_VARIABLES:
+            raise ValueError("too many variables")
+        self.names = names
+        self.values = values
+        self.all = (1 << len(names)) - 1
+        self.handler = handler
+        self.on_byte = on_byte
+        self.port = port if port is not None else _Console(raw)
+        self.poller = select.poll()
+        self.poller.register(self.port.poll_obj, select.POLLIN)
+        self.parser = Parser()
+        self.partial_since = None
+        self.tx = bytearray(FRAME_SIZE)
+        self.tx_view = memoryview(self.tx)
+        self.period_ms = 0
+        self.mask = 0
+        self.due = 0
+        self.stream_seq = 0
+        self.requests = 0
+        self.streamed = 0
+
+    def poll(self):
+        """
+        Serves the requests that have arrived and sends the stream frame
+        if it is due. Reads at most MAX_READ bytes, so a flood of input
+        can't hold the caller up. Returns the ms until the next stream
+        frame, None if there is no subscription.
+        """
+        parser = self.parser
+        reader = self.port.reader
+        for _ in range(MAX_READ):
+            if not self.poller.poll(0):
+                break
+            data = reader.read(1)
+            if not data:
+                break
+            self._feed(data[0])
+        now = time.ticks_ms()
+        if not parser.pos:
+            self.partial_since = None
+        elif self.partial_since is None:
+            self.partial_since = now
+        elif time.ticks_diff(now, self.partial_since) >= FRAME_TIMEOUT_MS:
+            parser.drop()
+            self.partial_since = None
+            if parser.pending():
+                self._feed(parser.take())
+        if not self.period_ms:
+            return None
+        left = time.ticks_diff(self.due, now)
+        if left <= 0:
+            self.stream_seq = (self.stream_seq + 1) & 0xFF
+            self._send_data(STREAM, self.stream_seq, self.mask)
+            self.streamed += 1
+            # Keep the period; restart from now after falling a period behind
+            base = now if -left >= self.period_ms else self.due
+            self.due = time.ticks_add(base, self.period_ms)
+            left = time.ticks_diff(self.due, now)
+        return left
+
+    def _feed(self, byte):
+        # Parses byte, then whatever a resync holds back
+        parser = self.parser
+        while True:
+            kind = parser.feed(byte)
+            if kind > 0:
+                self.requests += 1
+                self._dispatch(kind, parser.seq(), parser.length())
+            elif kind < 0 and self.on_byte is not None:
+                self.on_byte(byte)
+            if not parser.pending():
+                return
+            byte = parser.take()
+
+    def _dispatch(self, kind, seq, length):
+        buf = self.parser.buf
+        if kind == PING and length == 0:
+            self._ack(kind, seq, OK)
+        elif kind == LIST and length == 1:
+            self._send_names(seq, buf[HEADER_SIZE])
+        elif kind == SNAPSHOT and length == 4:
+            mask = struct.unpack_from("<I", buf, HEADER_SIZE)[0] & self.all
+            self._send_data(DATA, seq, mask or self.all)
+        elif kind == SUBSCRIBE and length == 6:
+            period, mask = struct.unpack_from("<HI", buf, HEADER_SIZE)
+            mask &= self.all
+            if period and not mask:
+                self._ack(kind, seq, OUT_OF_RANGE)
+                return
+            self.period_ms = max(period, MIN_PERIOD_MS) if period else 0
+            self.mask = mask
+            self.due = time.ticks_ms()
+            self._ack(kind, seq, OK)
+        elif kind == SETPOINT and length == 4:
+            value = struct.unpack_from("<f", buf, HEADER_SIZE)[0]
+            self._ack(kind, seq, self.handler(kind, value))
+        elif kind == MODE and length == 1:
+            self._ack(kind, seq, self.handler(kind, buf[HEADER_SIZE]))
+        else:
+            self._ack(kind, seq, BAD_REQUEST)
+
+    def _send(self, kind, seq, length):
+        tx = self.tx
+        tx[0] = 0xAA
+        tx[1] = 0x55
+        tx[2] = length
+        tx[3] = kind
+        tx[4] = seq
+        end = HEADER_SIZE + length
+        crc = crc16(tx, 2, end)
+        tx[end] = crc & 0xFF
+        tx[end + 1] = crc >> 8
+        self.port.writer.write(self.tx_view[:end + CRC_SIZE])
+
+    def _ack(self, kind, seq, status):
+        self.tx[HEADER_SIZE] = kind
+        self.tx[HEADER_SIZE + 1] = status
+        self._send(ACK, seq, 2)
+
+    def _send_data(self, kind, seq, mask):
+        tx = self.tx
+        struct.pack_into("<II", tx, HEADER_SIZE, time.ticks_ms(), mask)
+        pos = HEADER_SIZE + 8
+        values = self.values
+        for i in range(len(self.names)):
+            if mask >> i & 1:
+                struct.pack_into("<f", tx, pos, values[i])
+                pos += 4
+        self._send(kind, seq, pos - HEADER_SIZE)
+
+    def _send_names(self, seq, first):
+        # As many names from first on as fit; the host asks again for the rest
+        tx = self.tx
+        names = self.names
+        limit = HEADER_SIZE + MAX_PAYLOAD
+        pos = HEADER_SIZE + 2
+        i = first
+        while i < len(names):
+            name = names[i].encode()
+            if pos + len(name) + 1 > limit:
+                break
+            tx[pos:pos + len(name)] = name
+            pos += len(name)
+            tx[pos] = 0
+            pos += 1
+            i += 1
+        tx[HEADER_SIZE] = first
+        tx[HEADER_SIZE + 1] = len(names)
+        self._send(NAMES, seq, pos - HEADER_SIZE)
@@ -1,53 +1,112 @@
 from machine import Pin, PWM
 from time import sleep
+import tanks
 
-# Duty cycle ranges
-max_duty_heater = 5000
-min_duty_heater = 2900
-
-max_duty_cooler = 5500
-min_duty_cooler = 2900
-
-max_duty_utama = 4600
-min_duty_utama = 1400
-
-# Setup servo pins and PWM
-pin_servo_heater = Pin(12, Pin.OUT)
-pin_servo_cooler = Pin(13, Pin.OUT)
-pin_servo_utama = Pin(14, Pin.OUT)
-
-servo_heater = PWM(pin_servo_heater)
-servo_cooler = PWM(pin_servo_cooler)
-servo_utama = PWM(pin_servo_utama)
-
-servo_heater.freq(50)
-servo_cooler.freq(50)
-servo_utama.freq(50)
-
-servo_states = {
-    "heater": False,
-    "cooler": False,
-    "utama": False
-}
-def percentage_to_duty(percentage, device):
-    # Clamp percentage between 0 and 100
-    if percentage < 0:
-        percentage = 0
-    elif percentage > 100:
-        percentage = 100
-
-    if device == "heater":
-        duty = max_duty_heater - (percentage / 100) * (max_duty_heater - min_duty_heater)
-    elif device == "cooler":
-        duty = min_duty_cooler + (percentage / 100) * (max_duty_cooler - min_duty_cooler)
-    elif device == "utama":
-        duty = max_duty_utama - (percentage / 100) * (max_duty_utama - min_duty_utama)
-    else:
-        duty = 0
-    return int(duty)
+# Default deadband and slew limit of the servo channels, in duty_u16 counts.
+# At 50 Hz one count is about 0.3 usec of pulse width, so the deadband stays
+# below what a hobby servo resolves; moves smaller than it are skipped. A
+# slew of 0 means no limit.
+DEADBAND = 8
+SLEW = 0
 
-def initialize_servos():
-    servo_heater.duty_u16(percentage_to_duty(0, "heater"))
-    servo_cooler.duty_u16(percentage_to_duty(0, "cooler"))
-    servo_utama.duty_u16(percentage_to_duty(0, "utama"))
+class ServoChannel:
+    """
+    One servo valve. Positions are given in hundredths of a percent open
+    (0-10000) and turned into duties with an integer slope and offset. The
+    last written duty is kept, so unchanged writes are skipped, as are moves
+    within deadband counts; slew limits the duty change per write.
+    Endpoint moves (open(), close()) skip both and are written at once.
+    """
+
+    def __init__(self, name, pwm, duty_closed, duty_open, deadband=DEADBAND, slew=SLEW):
+        self.name = name
+        self.pwm = pwm
+        self.duty_closed = duty_closed
+        self.duty_open = duty_open
+        self.span = duty_open - duty_closed
+        self.deadband = deadband
+        self.slew = slew
+        self.duty = -1       # Last duty written, -1 if unknown
+        self.writes = 0
+
+    def duty_at(self, position):
+        # Duty for a position in hundredths of a percent, clamped
+        if position <= 0:
+            return self.duty_closed
+        if position >= 10000:
+            return self.duty_open
+        return self.duty_closed + self.span * position // 10000
+
+    def write(self, duty, immediate=False):
+        """
+        Writes duty unless it is the current one. Unless immediate, moves
+        within the deadband are skipped (ones onto an endpoint excepted) and
+        the step is limited to slew. Returns True if the PWM was written.
+        """
+        last = self.duty
+        if duty == last:
+            return False
+        if last >= 0 and not immediate:
+            step = duty - last if duty > last else last - duty
+            if (step <= self.deadband and duty != self.duty_closed and
+                    duty != self.duty_open):
+                return False
+            if self.slew and step > self.slew:
+                duty = last + self.slew if duty > last else last - self.slew
+        self.pwm.duty_u16(duty)
+        self.duty = duty
+        self.writes += 1
+        return True
+
+    def set(self, position):
+        # Moves to a position in hundredths of a percent open
+        return self.write(self.duty_at(position))
+
+    def set_percent(self, percentage):
+        return self.write(self.duty_at(int(percentage * 100)))
+
+    def open(self):
+        return self.write(self.duty_open, True)
+
+    def close(self):
+        return self.write(self.duty_closed, True)
 
+    def invalidate(self):
+        # Forget the last duty, e.g. after the PWM was written elsewhere
+        self.duty = -1
+
+# Outlet servo of every tank in the registry, None where a tank has none
+servos = []
+# Servo name -> channel
+channels = {}
+
+for tank in tanks.TANKS:
+    spec = tank.servo
+    if spec is None:
+        servos.append(None)
+        continue
+    pwm = PWM(Pin(spec.pin, Pin.OUT))
+    pwm.freq(50)
+    channel = ServoChannel(spec.name, pwm, spec.duty_closed, spec.duty_open)
+    servos.append(channel)
+    channels[spec.name] = channel
+
+def tank_servo(name):
+    # Outlet servo of the named tank, None if there is no such tank or it
+    # has no servo
+    i = tanks.find(name)
+    return None if i is None else servos[i]
+
+# The valves fuzzy control mixes with and the main tank's outlet, which the
+# manual screen also drives. Each is None if the registry lacks it.
+servo_heater = tank_servo("heater")
+servo_cooler = tank_servo("cooler")
+servo_utama = tank_servo("main")
+
+servo_states = {name: False for name in channels}
+
+def initialize_servos():
+    for servo in servos:
+        if servo is not None:
+            servo.invalidate()
+            servo.close()
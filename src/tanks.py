@@ -0,0 +1,83 @@
+# Tank registry. Every tank declares its DS18B20 bus pin, the ADS1115 chip
+# and channel of its LL (low) and LH (high) level probes, the pin of the
+# relay that fills it and the servo valve on its outlet. sensors.py,
+# adc_levels.py, relays.py, servo_control.py and interlocks.py build their
+# arrays from this table at import, in this order, so adding a tank is one
+# more entry here.
+
+# ADS1115 addresses on the level I2C bus; a probe's chip is an index here
+ADC_ADDRESSES = (0x48, 0x49)
+
+# GPIO each chip's ALERT/RDY output is wired to (open drain, pulled up on the
+# Pico), None where it isn't; the interlocks only run event-driven when every
+# chip in use has one
+ADC_ALERT_PINS = (20, 21)
+
+class Servo:
+    """
+    Outlet valve of a tank: PWM pin and the duty at 0 and 100 percent open.
+    feeds names the tank the valve empties into, None if it drains away.
+    """
+
+    def __init__(self, name, pin, duty_closed, duty_open, feeds=None):
+        self.name = name
+        self.pin = pin
+        self.duty_closed = duty_closed
+        self.duty_open = duty_open
+        self.feeds = feeds
+
+class Tank:
+    """
+    ll and lh are (chip, channel) of the level probes. label is the short
+    name shown on the LCD.
+    """
+
+    def __init__(self, name, label, sensor_pin, ll, lh, relay_pin=None, servo=None):
+        self.name = name
+        self.label = label
+        self.sensor_pin = sensor_pin
+        self.ll = ll
+        self.lh = lh
+        self.relay_pin = relay_pin
+        self.servo = servo
+
+TANKS = (
+    Tank("heater", "Htr ", 26, ll=(0, 1), lh=(0, 0), relay_pin=11,
+         servo=Servo("heater", 12, 5000, 2900, feeds="main")),
+    Tank("cooler", "Clr ", 27, ll=(0, 3), lh=(0, 2), relay_pin=10,
+         servo=Servo("cooler", 13, 2900, 5500, feeds="main")),
+    Tank("main", "Utma", 28, ll=(1, 1), lh=(1, 0),
+         servo=Servo("utama", 14, 4600, 1400)),
+)
+
+NAMES = tuple(tank.name for tank in TANKS)
+
+def index(name):
+    return NAMES.index(name)
+
+def find(name):
+    # Index of the named tank, None if the registry has no such tank
+    return NAMES.index(name) if name in NAMES else None
+
+# Level probe slots: raw level arrays hold the LL probe of tank i at 2*i and
+# its LH probe at 2*i + 1
+NUM_SLOTS = 2 * len(TANKS)
+
+def ll_slot(i):
+    return 2 * i
+
+def lh_slot(i):
+    return 2 * i + 1
+
+def probe(slot):
+    # (chip, channel) of a slot
+    tank = TANKS[slot >> 1]
+    return tank.lh if slot & 1 else tank.ll
+
+def inlets(i):
+    """
+    Indexes of the tanks whose outlet valves feed tank i.
+    """
+    name = TANKS[i].name
+    return tuple(j for j, tank in enumerate(TANKS)
+                 if tank.servo is not None and tank.servo.feeds == name)
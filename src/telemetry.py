@@ -0,0 +1,127 @@
+import sys
+import struct
+from mailbox import allocate_lock
+
+# Fixed-size binary control records in a preallocated ring, written out in
+# blocks. A block is a header followed by its records:
+#
+#   header: magic 0xA5 0x5A, version, record size, record count,
+#           block sequence number, records dropped since the last block
+#   record: ticks_ms, setpoint, temperature, error, delta_error, output,
+#           lock flags
+#
+# tools/telemetry_decode.py finds the blocks in a serial capture or a
+# telemetry file and turns them into NumPy arrays.
+#
+# log() and flush() may run on different cores: the control side logs, and
+# flush() belongs on core 0 with every other write to the serial port. They
+# only share the ring's indexes under a lock; the write itself runs outside
+# it, on records log() won't reach for another FLUSH_SLACK records.
+
+MAGIC = b'\xa5\x5a'
+VERSION = 1
+HEADER = "<2sBBHHH"
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD = "<IfffffB3x"
+RECORD_SIZE = struct.calcsize(RECORD)
+
+# Lock flag bits
+RELAY1_LOCKED = 0x01
+RELAY2_LOCKED = 0x02
+SERVO_LOCKED = 0x04
+CONTROL_ERROR = 0x08
+
+SINK_SERIAL = "serial"
+SINK_FILE = "file"
+
+FLUSH_SLACK = 16         # Ring slots a block being written leaves free
+
+class Telemetry:
+    """
+    Ring of capacity records. log() packs one record in place; flush() writes
+    everything logged since the last flush to the sink in one or two writes.
+    When the ring is full the oldest records are overwritten and counted as
+    dropped.
+    """
+
+    def __init__(self, capacity=256, sink=SINK_SERIAL, path="telemetry.bin"):
+        self.capacity = capacity
+        self.sink = sink
+        self.path = path
+        self.buf = bytearray(capacity * RECORD_SIZE)
+        self.view = memoryview(self.buf)
+        self.header = bytearray(HEADER_SIZE)
+        self.head = 0        # Next record slot to write
+        self.count = 0       # Records waiting to be flushed
+        self.dropped = 0
+        self.seq = 0
+        self.lock = allocate_lock()
+
+    def log(self, ticks, setpoint, temp, error, delta_error, output, flags):
+        with self.lock:
+            struct.pack_into(RECORD, self.buf, self.head * RECORD_SIZE,
+                             ticks, setpoint, temp, error, delta_error, output, flags)
+            self.head += 1
+            if self.head == self.capacity:
+                self.head = 0
+            if self.count < self.capacity:
+                self.count += 1
+            else:
+                self.dropped += 1
+
+    def flush(self):
+        """
+        Writes the pending records as one block. Returns the number written.
+        """
+        if self.sink is None:
+            return 0
+        with self.lock:
+            n = self.count
+            if not n:
+                return 0
+            # Drop the oldest records of a nearly full ring, so that logging
+            # during the write doesn't overwrite the block
+            limit = self.capacity - FLUSH_SLACK
+            dropped = self.dropped
+            if n > limit:
+                dropped += n - limit
+                n = limit
+            head = self.head
+            self.count = 0
+            self.dropped = 0
+        start = head - n
+        struct.pack_into(HEADER, self.header, 0, MAGIC, VERSION, RECORD_SIZE,
+                         n, self.seq & 0xFFFF, min(dropped, 0xFFFF))
+        if start >= 0:
+            parts = (self.view[start * RECORD_SIZE:head * RECORD_SIZE],)
+        else:
+            # Pending records wrap around the end of the ring
+            parts = (self.view[(start + self.capacity) * RECORD_SIZE:],
+                     self.view[:head * RECORD_SIZE])
+        self._write(parts)
+        self.seq += 1
+        return n
+
+    def _write(self, parts):
+        if self.sink == SINK_FILE:
+            with open(self.path, "ab") as f:
+                f.write(self.header)
+                for part in parts:
+                    f.write(part)
+        else:
+            out = sys.stdout.buffer
+            out.write(self.header)
+            for part in parts:
+                out.write(part)
+
+def lock_flags(relay1_locked, relay2_locked, servo_locked, control_error=False):
+    flags = 0
+    if relay1_locked:
+        flags |= RELAY1_LOCKED
+    if relay2_locked:
+        flags |= RELAY2_LOCKED
+    if servo_locked:
+        flags |= SERVO_LOCKED
+    if control_error:
+        flags |= CONTROL_ERROR
+    return flags
@@ -0,0 +1,390 @@
+"""
+Host side of the serial link (src/serial_link.py).
+
+    python tools/link_client.py /dev/ttyACM0 --list
+    python tools/link_client.py /dev/ttyACM0 --watch temp.main output --rate 10
+    python tools/link_client.py /dev/ttyACM0 --setpoint 30 --start
+    python tools/link_client.py --selftest      # against python -m sim --pty
+
+LinkClient is the asyncio library the command line is built on:
+
+    client = await LinkClient.open("/dev/ttyACM0")
+    print(await client.snapshot())
+    await client.subscribe(["temp.main", "output"], rate_hz=10)
+    async for sample in client.stream():
+        print(sample.values["temp.main"])
+
+Requests are retried on a timeout; a refused one raises LinkError. Stream
+frames wait in a bounded queue, and the ones lost on the way or dropped
+from a full queue are counted in client.lost. Bytes outside frames, the
+firmware's print() output and telemetry blocks, collect in client.text.
+"""
+
+import argparse
+import asyncio
+import collections
+import math
+import os
+import re
+import struct
+import subprocess
+import sys
+import time
+import tty
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import serial_link                          # noqa: E402  (src/, pure Python)
+from serial_link import HEADER_SIZE         # noqa: E402
+
+STATUS_NAMES = {
+    serial_link.OK: "ok",
+    serial_link.BAD_REQUEST: "bad request",
+    serial_link.OUT_OF_RANGE: "out of range",
+    serial_link.REFUSED: "refused",
+}
+
+TEXT_LIMIT = 1 << 16     # Bytes of non-frame output kept
+
+Sample = collections.namedtuple("Sample", "seq ticks_ms values")
+
+
+class LinkError(Exception):
+    """A request got no reply after its retries, or was refused (status)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class LinkClient:
+    def __init__(self, reader, writer, timeout=0.5, retries=3, queue=1024):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.retries = retries
+        self.parser = serial_link.Parser()
+        self.pending = {}
+        self.seq = 0
+        self.names = None
+        self.stream_mask = 0
+        self.samples = asyncio.Queue(queue)
+        self.last_stream_seq = None
+        self.received = 0
+        self.lost = 0
+        self.text = bytearray()
+        self._task = asyncio.ensure_future(self._read_loop())
+
+    @classmethod
+    async def open(cls, path, **kwargs):
+        """Opens a serial device or pty in raw mode."""
+        fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        tty.setraw(fd)
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+                                     os.fdopen(fd, "rb", buffering=0))
+        writer, _ = await loop.connect_write_pipe(asyncio.Protocol,
+                                                  os.fdopen(os.dup(fd), "wb", buffering=0))
+        return cls(reader, writer, **kwargs)
+
+    def close(self):
+        self._task.cancel()
+        self.writer.close()
+
+    # Receiving
+
+    async def _read_loop(self):
+        parser = self.parser
+        try:
+            while True:
+                data = await self.reader.read(4096)
+                if not data:
+                    break
+                for byte in data:
+                    while True:
+                        kind = parser.feed(byte)
+                        if kind > 0:
+                            end = HEADER_SIZE + parser.length()
+                            self._frame(kind, parser.seq(), bytes(parser.buf[HEADER_SIZE:end]))
+                        elif kind < 0:
+                            self.text.append(byte)
+                        if not parser.pending():
+                            break
+                        byte = parser.take()
+                if len(self.text) > TEXT_LIMIT:
+                    del self.text[:-TEXT_LIMIT]
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(LinkError("port closed"))
+
+    def _frame(self, kind, seq, payload):
+        if kind == serial_link.STREAM:
+            self.received += 1
+            if self.last_stream_seq is not None:
+                self.lost += (seq - self.last_stream_seq - 1) & 0xFF
+            self.last_stream_seq = seq
+            if self.names is None:
+                return
+            sample = Sample(seq, *self._decode(payload))
+            if self.samples.full():
+                self.samples.get_nowait()
+                self.lost += 1
+            self.samples.put_nowait(sample)
+            return
+        future = self.pending.get(seq)
+        if future is not None and not future.done():
+            future.set_result((kind, payload))
+
+    def _decode(self, payload):
+        # DATA and STREAM payloads: (ticks_ms, {name: value})
+        ticks, mask = struct.unpack_from("<II", payload)
+        indexes = [i for i in range(len(self.names)) if mask >> i & 1]
+        values = struct.unpack_from("<%df" % len(indexes), payload, 8)
+        return ticks, dict(zip((self.names[i] for i in indexes), values))
+
+    # Requests
+
+    async def request(self, kind, payload=b""):
+        """Sends a request until it is answered. Returns (type, payload)."""
+        loop = asyncio.get_running_loop()
+        for _ in range(self.retries + 1):
+            self.seq = self.seq % 255 + 1
+            seq = self.seq
+            future = loop.create_future()
+            self.pending[seq] = future
+            self.writer.write(serial_link.encode(kind, seq, payload))
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                self.pending.pop(seq, None)
+        raise LinkError("no reply to request 0x%02x" % kind)
+
+    async def _command(self, kind, payload=b""):
+        reply, body = await self.request(kind, payload)
+        if reply != serial_link.ACK or len(body) != 2 or body[0] != kind:
+            raise LinkError("unexpected reply 0x%02x" % reply)
+        if body[1] != serial_link.OK:
+            raise LinkError(STATUS_NAMES.get(body[1], "status %d" % body[1]), body[1])
+
+    async def ping(self):
+        """Returns the round trip time in seconds."""
+        start = time.perf_counter()
+        await self._command(serial_link.PING)
+        return time.perf_counter() - start
+
+    async def variables(self):
+        """Names of the variables, in index order; fetched once."""
+        if self.names is None:
+            names = []
+            total = None
+            while total is None or len(names) < total:
+                _, body = await self.request(serial_link.LIST, bytes((len(names),)))
+                first, total = body[0], body[1]
+                if first != len(names):
+                    raise LinkError("names out of order")
+                got = body[2:].split(b"\0")[:-1]
+                if not got and len(names) < total:
+                    raise LinkError("name list cut short")
+                names.extend(name.decode() for name in got)
+            self.names = names
+        return self.names
+
+    async def _mask(self, names):
+        all_names = await self.variables()
+        if names is None:
+            return (1 << len(all_names)) - 1
+        mask = 0
+        for name in names:
+            if name not in all_names:
+                raise LinkError("unknown variable %r" % name)
+            mask |= 1 << all_names.index(name)
+        return mask
+
+    async def snapshot(self, names=None):
+        """Returns (ticks_ms, {name: value}) of the named variables, or all."""
+        mask = await self._mask(names)
+        kind, body = await self.request(serial_link.SNAPSHOT, struct.pack("<I", mask))
+        if kind != serial_link.DATA:
+            raise LinkError("unexpected reply 0x%02x" % kind)
+        return self._decode(body)
+
+    async def subscribe(self, names=None, rate_hz=10.0):
+        """Starts the stream of the named variables, or all, at rate_hz."""
+        mask = await self._mask(names)
+        period = max(1, int(round(1000.0 / rate_hz)))
+        self.stream_mask = mask
+        self.last_stream_seq = None
+        await self._command(serial_link.SUBSCRIBE, struct.pack("<HI", period, mask))
+
+    async def unsubscribe(self):
+        await self._command(serial_link.SUBSCRIBE, struct.pack("<HI", 0, 0))
+
+    async def stream(self):
+        """Yields the stream's Samples as they arrive."""
+        while True:
+            yield await self.samples.get()
+
+    async def set_setpoint(self, celsius):
+        await self._command(serial_link.SETPOINT, struct.pack("<f", celsius))
+
+    async def start(self):
+        """Starts fuzzy control; refused without a setpoint or main sensor, or off the menu."""
+        await self._command(serial_link.MODE, b"\x01")
+
+    async def stop(self):
+        await self._command(serial_link.MODE, b"\x00")
+
+
+# Command line
+
+def format_values(values):
+    return "  ".join("%s=%s" % (name, "-" if math.isnan(v) else "%.4g" % v)
+                     for name, v in values.items())
+
+
+async def run(args):
+    client = await LinkClient.open(args.port, timeout=args.timeout)
+    try:
+        if args.list:
+            for i, name in enumerate(await client.variables()):
+                print("%2d %s" % (i, name))
+        if args.setpoint is not None:
+            await client.set_setpoint(args.setpoint)
+            print("setpoint", args.setpoint)
+        if args.start:
+            await client.start()
+            print("fuzzy control started")
+        if args.stop:
+            await client.stop()
+            print("fuzzy control stopped")
+        if args.snapshot:
+            ticks, values = await client.snapshot(args.watch or None)
+            print("%d ms  %s" % (ticks, format_values(values)))
+        if args.watch:
+            await client.subscribe(args.watch, args.rate)
+            end = None if args.seconds is None else time.monotonic() + args.seconds
+            try:
+                async for sample in client.stream():
+                    print("%d ms  %s" % (sample.ticks_ms, format_values(sample.values)))
+                    if end is not None and time.monotonic() >= end:
+                        break
+            finally:
+                await client.unsubscribe()
+            print("%d samples, %d lost" % (client.received, client.lost), file=sys.stderr)
+    finally:
+        client.close()
+
+
+async def selftest(seconds):
+    """
+    Runs the firmware in the simulator on a pty and exercises every request
+    against it. Returns the number of failed checks.
+    """
+    sim = subprocess.Popen([sys.executable, "-m", "sim", "--pty", "--quiet",
+                            "--seconds", str(seconds)],
+                           cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    failures = 0
+
+    def check(name, ok, detail=""):
+        nonlocal failures
+        failures += not ok
+        print("%-34s %s  %s" % (name, "ok" if ok else "FAIL", detail))
+
+    try:
+        line = sim.stderr.readline().decode()
+        match = re.search(r"serial port on (\S+)", line)
+        if not match:
+            raise SystemExit("simulator gave no pty: " + line.strip())
+        client = await LinkClient.open(match.group(1))
+        try:
+            rtt = await client.ping()
+            check("ping", True, "%.1f ms round trip" % (rtt * 1e3))
+            names = await client.variables()
+            check("variables", "temp.main" in names, "%d names" % len(names))
+            ticks, values = await client.snapshot()
+            check("snapshot", set(values) == set(names), "%d values at %d ms" % (len(values), ticks))
+            try:
+                await client.set_setpoint(55)
+                check("setpoint out of range refused", False)
+            except LinkError as e:
+                check("setpoint out of range refused", e.status == serial_link.OUT_OF_RANGE, str(e))
+            await client.set_setpoint(25)
+            check("setpoint 25", True)
+            for _ in range(20):
+                try:
+                    await client.start()
+                    check("start", True)
+                    break
+                except LinkError as e:
+                    if e.status != serial_link.REFUSED:
+                        raise
+                    # Main sensor not found yet
+                    await asyncio.sleep(0.25)
+            else:
+                check("start", False, "refused")
+
+            await client.subscribe(None, 10)
+            samples = []
+            start = time.monotonic()
+            async for sample in client.stream():
+                samples.append(sample)
+                if time.monotonic() - start >= 3:
+                    break
+            await client.unsubscribe()
+            rate = len(samples) / (time.monotonic() - start)
+            check("subscribe all at 10 Hz", 8 <= rate <= 12 and client.lost == 0,
+                  "%.1f Hz, %d lost" % (rate, client.lost))
+            last = samples[-1].values
+            check("stream reflects commands", last["active"] == 1 and last["setpoint"] == 25,
+                  "active %g, setpoint %g" % (last["active"], last["setpoint"]))
+            await client.stop()
+            _, values = await client.snapshot(["active"])
+            check("stop", values["active"] == 0)
+            check("no bad frames", client.parser.errors == 0,
+                  "%d bytes of other output skipped" % len(client.text))
+        finally:
+            client.close()
+    finally:
+        sim.terminate()
+        sim.wait()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("port", nargs="?", help="serial device, or the pty of python -m sim --pty")
+    parser.add_argument("--list", action="store_true", help="list the variables")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="print the --watch variables (default: all) once")
+    parser.add_argument("--watch", nargs="+", metavar="NAME", help="subscribe to these variables")
+    parser.add_argument("--rate", type=float, default=10.0, help="--watch rate, Hz")
+    parser.add_argument("--seconds", type=float, help="stop watching after this long")
+    parser.add_argument("--setpoint", type=float, help="set the main tank setpoint, C")
+    parser.add_argument("--start", action="store_true", help="start fuzzy control")
+    parser.add_argument("--stop", action="store_true", help="stop fuzzy control")
+    parser.add_argument("--timeout", type=float, default=0.5, help="s per request attempt")
+    parser.add_argument("--selftest", action="store_true",
+                        help="check the client against the firmware in the simulator")
+    args = parser.parse_args(argv)
+
+    if args.selftest:
+        return 1 if asyncio.run(selftest(seconds=60)) else 0
+    if not args.port:
+        parser.error("a port is needed")
+    try:
+        asyncio.run(run(args))
+    except LinkError as e:
+        print("error:", e, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Decodes control telemetry written by src/telemetry.py.
+
+    python tools/telemetry_decode.py capture.bin              # summary
+    python tools/telemetry_decode.py capture.bin -o run.npz   # NumPy arrays
+    python tools/telemetry_decode.py capture.bin --csv run.csv
+
+The input is a raw serial capture (text from print() between the blocks is
+skipped) or a telemetry.bin file copied off the Pico.
+"""
+
+import argparse
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b'\xa5\x5a'
+VERSION = 1
+HEADER = struct.Struct("<2sBBHHH")
+RECORD = struct.Struct("<IfffffB3x")
+
+# Same layout as telemetry.RECORD
+RECORD_DTYPE = np.dtype([
+    ("ticks_ms", "<u4"),
+    ("setpoint", "<f4"),
+    ("temp", "<f4"),
+    ("error", "<f4"),
+    ("delta_error", "<f4"),
+    ("output", "<f4"),
+    ("flags", "u1"),
+    ("_pad", "V3"),
+])
+
+TICKS_PERIOD = 1 << 30   # ticks_ms() wraps at 2**30 on the Pico
+
+RELAY1_LOCKED = 0x01
+RELAY2_LOCKED = 0x02
+SERVO_LOCKED = 0x04
+CONTROL_ERROR = 0x08
+
+
+def read_blocks(data):
+    """
+    Finds the telemetry blocks in data. Returns the records of all blocks
+    as one bytes object and a list of (seq, count, dropped) per block.
+    """
+    records = []
+    blocks = []
+    pos = 0
+    while True:
+        pos = data.find(MAGIC, pos)
+        if pos < 0 or pos + HEADER.size > len(data):
+            break
+        _, version, size, count, seq, dropped = HEADER.unpack_from(data, pos)
+        end = pos + HEADER.size + count * size
+        if version != VERSION or size != RECORD.size or end > len(data):
+            # Not a block header, just the magic bytes inside other output
+            pos += 1
+            continue
+        records.append(data[pos + HEADER.size:end])
+        blocks.append((seq, count, dropped))
+        pos = end
+    return b"".join(records), blocks
+
+
+def unwrap_ticks(ticks):
+    """Turns wrapping ticks_ms() values into seconds from the first record."""
+    ticks = ticks.astype(np.int64)
+    steps = np.diff(ticks)
+    steps[steps < -TICKS_PERIOD // 2] += TICKS_PERIOD
+    return np.concatenate(([0], np.cumsum(steps))) / 1000.0
+
+
+def decode(data):
+    """
+    Returns a dict of NumPy arrays, one per field, plus time_s, the lock
+    flags split into booleans, and the per-block sequence, count and drop
+    counters.
+    """
+    raw, blocks = read_blocks(data)
+    rec = np.frombuffer(raw, dtype=RECORD_DTYPE)
+    out = {name: rec[name].copy() for name in RECORD_DTYPE.names if not name.startswith("_")}
+    out["time_s"] = unwrap_ticks(rec["ticks_ms"]) if len(rec) else np.zeros(0)
+    flags = rec["flags"]
+    out["relay1_locked"] = (flags & RELAY1_LOCKED) != 0
+    out["relay2_locked"] = (flags & RELAY2_LOCKED) != 0
+    out["servo_locked"] = (flags & SERVO_LOCKED) != 0
+    out["control_error"] = (flags & CONTROL_ERROR) != 0
+    block_info = np.array(blocks, dtype=np.int64).reshape(-1, 3)
+    out["block_seq"] = block_info[:, 0]
+    out["block_count"] = block_info[:, 1]
+    out["block_dropped"] = block_info[:, 2]
+    return out
+
+
+def lost_blocks(seq):
+    """Number of blocks missing from a capture, from gaps in the sequence."""
+    if len(seq) < 2:
+        return 0
+    gaps = (np.diff(seq) - 1) % 0x10000
+    return int(gaps.sum())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input", help="serial capture or telemetry.bin")
+    parser.add_argument("-o", "--npz", help="save the arrays to a .npz file")
+    parser.add_argument("--csv", help="save the records as CSV")
+    args = parser.parse_args(argv)
+
+    with open(args.input, "rb") as f:
+        data = f.read()
+    t = decode(data)
+    n = len(t["time_s"])
+    print("%d records in %d blocks, %d dropped in the ring, %d blocks lost" % (
+        n, len(t["block_seq"]), int(t["block_dropped"].sum()), lost_blocks(t["block_seq"])))
+    if n:
+        print("%.1f s, temperature %.2f-%.2f C, output %.1f-%.1f %%" % (
+            t["time_s"][-1], t["temp"].min(), t["temp"].max(),
+            t["output"].min() * 100, t["output"].max() * 100))
+
+    if args.npz:
+        np.savez(args.npz, **t)
+    if args.csv:
+        fields = ("time_s", "setpoint", "temp", "error", "delta_error", "output",
+                  "relay1_locked", "relay2_locked", "servo_locked")
+        columns = np.column_stack([t[name].astype(np.float64) for name in fields])
+        np.savetxt(args.csv, columns, delimiter=",", header=",".join(fields),
+                   comments="", fmt="%.6g")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,555 @@
+"""
+Tunes the fuzzy controller's rule base offline.
+
+    python tools/tune.py                            # evolve from src/fuzzy_rules.json
+    python tools/tune.py --method grid --levels 3   # grid around it instead
+    python tools/tune.py -o tuned.json --top 10
+    python tools/tune.py --check                    # firmware's fixed point vs float
+
+The free parameters are the MF breakpoints and output singletons of the
+base rule base (see Layout); its labels and rule matrix are kept. Every
+candidate is run in closed loop against a vectorised copy of the
+simulator's tank model, for several setpoint steps at once, with the
+firmware's sensing (adaptive DS18B20 resolution, alpha-beta estimate) in
+the loop, and ranked by settling time, overshoot, mean error and valve
+travel. Batches of candidates go to a process pool. The best rule base is written in the fuzzy_rules.json
+format: copy it to the Pico's flash as fuzzy_rules.json, or check it
+first with python -m sim --flash DIR.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, "src"))
+
+import fuzzy_control                        # noqa: E402  (src/, pure Python)
+from sim import plant                       # noqa: E402
+
+RULES_PATH = os.path.join(ROOT, "src", fuzzy_control.RULES_FILE)
+
+# Tanks and heat sources as set up by sim.plant.Plant
+HEATER_L, HEATER_C, HEATER_CAPACITY = 5.0, 50.0, 10.0
+COOLER_L, COOLER_C, COOLER_CAPACITY = 5.0, 12.0, 10.0
+MAIN_CAPACITY = 20.0
+HEATER_TARGET_C, COOLER_TARGET_C, HEAT_RATE = 60.0, 8.0, 0.01
+
+# Sensing and control as the firmware does them. src/main.py and sensors.py
+# need the Pico's modules, so their settings are repeated here: keep them in
+# step. Control runs every CONTROL_PERIOD on an alpha-beta estimate
+# (estimator.py) of the main tank temperature, fed with DS18B20 samples
+# whose resolution follows the control error (sensors.resolution_for()).
+CONTROL_PERIOD = 0.1             # s, main.CONTROL_PERIOD
+ESTIMATOR_TAU = 1.5              # s, main.ESTIMATOR_TAU_MS
+ESTIMATOR_HORIZON = 3.0          # s, main.ESTIMATOR_HORIZON_MS
+ADAPTIVE_RESOLUTION = True       # main.ADAPTIVE_RESOLUTION
+CONVERSION_S = (0.094, 0.188, 0.375, 0.75)      # sensors.CONVERSION_MS, 9..12 bits
+RESOLUTION_STEPS = ((4.0, 9), (2.0, 10), (1.0, 11))
+RESOLUTION_HYSTERESIS = 0.25
+DEFAULT_BITS = 12
+PLANT_DT = 0.1                   # s, integration step
+
+SETPOINTS = (22.0, 25.0, 30.0, 35.0)
+MAIN_VOLUMES = (6.0, 12.0)
+
+# --check: the (step, limit) grids of inputs the fixed-point inference is
+# compared on, the whole domain (every MF out to +/-100) and more finely the
+# range the controller works in, and the largest deviation it may have, %
+CHECK_GRIDS = ((0.5, 105.0), (0.05, 12.0))
+CHECK_LIMIT = 0.1
+
+
+def _magnitudes(mfs):
+    # Distinct breakpoint magnitudes, without 0 and the outer limit
+    values = {abs(v) for mf in mfs for v in mf[1:]}
+    return sorted(values - {0, max(values)})
+
+
+class Layout:
+    """
+    The tunable parameters of a rule base. The distinct breakpoint
+    magnitudes of each input, leaving out 0 and the outer limit that only
+    closes the end MFs, and the distances of the output singletons from the
+    middle of their range are free. Every breakpoint and singleton follows
+    the parameter of its magnitude and keeps its sign, so a symmetric rule
+    base stays symmetric, and keeping each group sorted keeps the MFs valid.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.n_e = len(spec["error"])
+        self.n_de = len(spec["delta_error"])
+        values = [o[1] for o in spec["outputs"]]
+        self.mid = (min(values) + max(values)) / 2
+        self.half = (max(values) - min(values)) / 2
+        self.groups = []
+        offset = 0
+        for mfs in (spec["error"], spec["delta_error"]):
+            mags = _magnitudes(mfs)
+            limit = max(abs(v) for mf in mfs for v in mf[1:])
+            rows = np.array([mf[1:] for mf in mfs], dtype=float)
+            self.groups.append((offset, mags, rows, limit))
+            offset += len(mags)
+        self.out_values = np.array(values, dtype=float)
+        self.out_mags = sorted({abs(v - self.mid) for v in values} - {0})
+        self.out_offset = offset
+        self.size = offset + len(self.out_mags)
+        self.rules = np.array(fuzzy_control.FuzzyController(spec).rules,
+                              dtype=np.int64).reshape(self.n_e, self.n_de)
+
+    def base(self):
+        mags = [g[1] for g in self.groups] + [self.out_mags]
+        return np.array([m for group in mags for m in group], dtype=float)
+
+    def names(self):
+        names = ["e%d" % i for i in range(len(self.groups[0][1]))]
+        names += ["de%d" % i for i in range(len(self.groups[1][1]))]
+        return names + ["out%d" % i for i in range(len(self.out_mags))]
+
+    def clip(self, params):
+        """Sorts each group and keeps it inside its range."""
+        params = np.array(params, dtype=float, ndmin=2)
+        for offset, mags, _, limit in self.groups:
+            group = params[:, offset:offset + len(mags)]
+            group[:] = np.sort(np.clip(group, 0.05, 0.95 * limit), axis=1)
+        group = params[:, self.out_offset:]
+        group[:] = np.sort(np.clip(group, 0.5, self.half), axis=1)
+        return params
+
+    def _place(self, params, values, mags, offset, center=0.0):
+        # values with every magnitude in mags replaced by its parameter
+        out = np.broadcast_to(values, (len(params),) + values.shape).copy()
+        for k, mag in enumerate(mags):
+            hit = np.isclose(np.abs(values - center), mag)
+            sign = np.sign(values - center)
+            out[:, hit] = center + sign[hit] * params[:, offset + k, None]
+        return out
+
+    def arrays(self, params):
+        """
+        MF breakpoints (C, n, 3) of both inputs and output singletons
+        (C, n_out) of C candidates.
+        """
+        params = self.clip(params)
+        bounds = [self._place(params, rows, mags, offset)
+                  for offset, mags, rows, _ in self.groups]
+        out = self._place(params, self.out_values, self.out_mags, self.out_offset, self.mid)
+        return bounds[0], bounds[1], out
+
+    def spec_for(self, params, name="tuned"):
+        """The rule base of one candidate, in the fuzzy_rules.json format."""
+        e_bounds, de_bounds, out = self.arrays(params)
+        spec = {"name": name}
+        for key, bounds in (("error", e_bounds[0]), ("delta_error", de_bounds[0])):
+            spec[key] = [[mf[0]] + [_number(v) for v in row]
+                         for mf, row in zip(self.spec[key], bounds)]
+        spec["outputs"] = [[o[0], _number(v)] for o, v in zip(self.spec["outputs"], out[0])]
+        spec["rules"] = [list(row) for row in self.spec["rules"]]
+        return spec
+
+
+def _number(v):
+    v = round(float(v), 2)
+    return int(v) if v == int(v) else v
+
+
+def format_rule_base(spec):
+    """JSON text laid out like src/fuzzy_rules.json, one row per line."""
+    lines = ["{", '  "name": %s,' % json.dumps(spec.get("name", ""))]
+    keys = ("error", "delta_error", "outputs", "rules")
+    for n, key in enumerate(keys):
+        rows = ["    " + json.dumps(row, ensure_ascii=False) for row in spec[key]]
+        lines.append('  "%s": [' % key)
+        lines.append(",\n".join(rows))
+        lines.append("  ]" + ("," if n < len(keys) - 1 else ""))
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+# Inference
+
+def memberships(x, bounds):
+    """
+    triangle_mf() of x (any shape) in every MF of bounds (..., n, 3), which
+    broadcasts against x. Returns (..., n).
+    """
+    x = np.asarray(x, dtype=float)[..., None]
+    a, b, c = bounds[..., 0], bounds[..., 1], bounds[..., 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rising = (x - a) / (b - a)
+        falling = (c - x) / (c - b)
+    mu = np.where(x < b, rising, falling)
+    return np.where((x <= a) | (x >= c), 0.0, mu)
+
+
+def sugeno(error, delta_error, e_bounds, de_bounds, out, rules):
+    """
+    fuzzy_sugeno() over whole arrays of error and delta_error. The MFs and
+    output singletons broadcast against the inputs, so each element can
+    have its own; rules is the (n_e, n_de) matrix of output indexes, -1
+    where there is no rule. Returns percent, 0 where no rule fires.
+    """
+    mu_e = memberships(error, e_bounds)
+    mu_de = memberships(delta_error, de_bounds)
+    w = np.minimum(mu_e[..., :, None], mu_de[..., None, :])
+    w = np.where(rules >= 0, w, 0.0)
+    z = np.take(out, np.maximum(rules, 0), axis=-1)
+    num = (w * z).sum(axis=(-2, -1))
+    den = w.sum(axis=(-2, -1))
+    return np.where(den > 0, num / np.where(den > 0, den, 1.0), 0.0)
+
+
+def check(spec, grids=CHECK_GRIDS):
+    """
+    Largest difference, in percent, of the firmware's fixed-point
+    FuzzyController and of sugeno() from the firmware's float
+    fuzzy_sugeno(), all on spec, over every (step, limit) grid of inputs.
+    Returns (deviation, error, delta_error) of the worst point.
+    """
+    layout = Layout(spec)
+    e_bounds, de_bounds, out = layout.arrays(layout.base())
+    controller = fuzzy_control.FuzzyController(spec)
+    worst = (0.0, 0.0, 0.0)
+    for step, limit in grids:
+        axis = np.arange(-limit, limit + step / 2, step)
+        error, delta_error = np.meshgrid(axis, axis, indexing="ij")
+        ours = sugeno(error, delta_error, e_bounds[0], de_bounds[0], out[0], layout.rules)
+        ref = np.array([[fuzzy_control.fuzzy_sugeno(e, de, spec) for de in axis] for e in axis])
+        fixed = np.array([[controller.evaluate(e, de) for de in axis] for e in axis])
+        dev = np.maximum(np.abs(fixed - ref), np.abs(ours - ref))
+        i, j = np.unravel_index(np.argmax(dev), dev.shape)
+        if dev[i, j] > worst[0]:
+            worst = (dev[i, j], axis[i], axis[j])
+    return worst
+
+
+# Closed loop
+
+def _bits_for(error):
+    # sensors._bits_for() on arrays
+    error = np.abs(error)
+    bits = np.full(error.shape, DEFAULT_BITS)
+    for limit, b in reversed(RESOLUTION_STEPS):
+        bits[error >= limit] = b
+    return bits
+
+
+def resolution_for(error, bits):
+    """sensors.resolution_for() on arrays."""
+    want = _bits_for(error)
+    finer = np.maximum(_bits_for(np.abs(error) + RESOLUTION_HYSTERESIS), bits)
+    return np.where(want < bits, want, finer)
+
+
+def at_resolution(temp, bits):
+    """A DS18B20 reading of temp at bits, as sensors.at_resolution() leaves it."""
+    scale = 2.0 ** (12 - bits)
+    return np.floor(np.round(temp * 16) / scale) * scale / 16
+
+
+def _add(volume, temp, litres, temp_in, capacity):
+    # Tank.add() on arrays
+    total = volume + litres
+    mixed = (temp * volume + temp_in * litres) / np.where(total > 0, total, 1.0)
+    temp = np.where(litres > 0, mixed, temp)
+    return np.minimum(total, capacity), temp
+
+
+def _slew(opening, command, dt):
+    step = np.clip(command - opening, -plant.SERVO_SLEW * dt, plant.SERVO_SLEW * dt)
+    return opening + step, np.abs(step)
+
+
+def simulate(e_bounds, de_bounds, out, rules, setpoints=SETPOINTS, volumes=MAIN_VOLUMES,
+             duration=900.0, band=0.5, period=CONTROL_PERIOD, dt=PLANT_DT,
+             adaptive=ADAPTIVE_RESOLUTION):
+    """
+    Runs C candidates against every (setpoint, initial main volume)
+    scenario at once, from the plant's start state. The control step is the
+    firmware's: a sample that has come in since the last step updates the
+    estimate and picks the resolution of the conversion after next, the
+    rules get the estimated error at this moment and minus the estimated
+    rate, the heater valve follows the output and the cooler valve its
+    complement, and both close while the main tank's interlock has it
+    draining, when the estimate is left alone. A conversion's sample
+    arrives with the first plant step after its conversion time. Returns
+    settling time (s), overshoot (C), mean absolute error (C) and heater
+    plus cooler valve travel (full strokes), each (C, S).
+    """
+    n = len(e_bounds)
+    sp = np.array([s for s in setpoints for _ in volumes], dtype=float)
+    shape = (n, len(sp))
+    sp = np.broadcast_to(sp, shape)
+    vm = np.broadcast_to(np.array([v for _ in setpoints for v in volumes], dtype=float),
+                         shape).copy()
+    tm = np.full(shape, plant.AMBIENT_C)
+    vh, th = np.full(shape, HEATER_L), np.full(shape, HEATER_C)
+    vc, tc = np.full(shape, COOLER_L), np.full(shape, COOLER_C)
+    oh, oc, ou = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    ch, cc = np.zeros(shape), np.zeros(shape)
+    fill_h = np.zeros(shape, dtype=bool)
+    fill_c = np.zeros(shape, dtype=bool)
+    draining = np.zeros(shape, dtype=bool)
+
+    # The main tank sensor: resolution of the running conversion and of the
+    # next one, plant step its sample arrives at
+    bits = np.full(shape, DEFAULT_BITS)
+    wanted = np.full(shape, DEFAULT_BITS)
+    conversion = np.ceil(np.array(CONVERSION_S) / dt - 1e-9).astype(int)
+    ready = np.full(shape, conversion[DEFAULT_BITS - 9])
+    # TempSampler.latest(): the last sample and its time
+    never = -1e9
+    latest, latest_t = np.zeros(shape), np.full(shape, 2 * never)
+    # AlphaBeta: value, rate (C/s) and time of the last sample, never before one
+    value, rate = np.zeros(shape), np.zeros(shape)
+    stamp = np.full(shape, never)
+
+    eb, deb, ob = e_bounds[:, None], de_bounds[:, None], out[:, None]
+    direction = np.sign(sp - tm)
+    settle = np.zeros(shape)
+    overshoot = np.zeros(shape)
+    abs_error = np.zeros(shape)
+    travel = np.zeros(shape)
+
+    every = max(1, int(round(period / dt)))
+    feed, drain, fill = plant.FEED_LPS * dt, plant.DRAIN_LPS * dt, plant.FILL_LPS * dt
+    heat = min(1.0, HEAT_RATE * dt)
+    loss = plant.LOSS_PER_S * dt
+    for k in range(int(duration / dt)):
+        t = k * dt
+
+        # Interlocks: refill the heater and cooler tanks between their
+        # probes; drain the main tank from LH to LL with the feeds closed
+        for frac, filling in ((vh / HEATER_CAPACITY, fill_h), (vc / COOLER_CAPACITY, fill_c)):
+            filling[frac < plant.LL_FRACTION] = True
+            filling[frac >= plant.LH_FRACTION] = False
+        frac = vm / MAIN_CAPACITY
+        draining[frac >= plant.LH_FRACTION] = True
+        draining[frac < plant.LL_FRACTION] = False
+
+        # TempSampler.poll(): collect the sample, start the next conversion
+        done = ready <= k
+        latest = np.where(done, at_resolution(tm, bits), latest)
+        latest_t = np.where(done, t, latest_t)
+        bits = np.where(done, wanted, bits)
+        ready = np.where(done, k + conversion[bits - 9], ready)
+
+        if k % every == 0:
+            run = ~draining
+            fresh = run & (latest_t > stamp)
+            # AlphaBeta.update(); a gap past the horizon starts afresh
+            gap = latest_t - stamp
+            restart = fresh & (gap > ESTIMATOR_HORIZON)
+            step = fresh & ~restart
+            gap = np.minimum(gap, ESTIMATOR_HORIZON)
+            alpha = gap / (gap + ESTIMATOR_TAU)
+            beta = alpha * alpha / (2 - alpha)
+            residual = latest - (value + rate * gap)
+            value = np.where(step, value + rate * gap + alpha * residual, value)
+            rate = np.where(step, rate + beta * residual / np.maximum(gap, dt), rate)
+            value = np.where(restart, latest, value)
+            rate = np.where(restart, 0.0, rate)
+            stamp = np.where(fresh, latest_t, stamp)
+            if adaptive:
+                wanted = np.where(fresh, resolution_for(sp - latest, wanted), wanted)
+
+            # AlphaBeta.fresh(): no sample yet, or none for the horizon,
+            # closes the valves
+            run &= t - stamp <= ESTIMATOR_HORIZON
+            e = sp - (value + rate * (t - stamp))
+            u = sugeno(np.where(run, e, 0.0), -rate, eb, deb, ob, rules) / 100
+            ch = np.where(run, u, 0.0)
+            cc = np.where(run, 1.0 - u, 0.0)
+
+            err = tm - sp
+            settle = np.where(np.abs(err) > band, t + period, settle)
+            overshoot = np.maximum(overshoot, err * direction)
+            abs_error += np.abs(err)
+        else:
+            ch = np.where(draining, 0.0, ch)
+            cc = np.where(draining, 0.0, cc)
+
+        # Plant.step()
+        oh, moved = _slew(oh, ch, dt)
+        travel += moved
+        oc, moved = _slew(oc, cc, dt)
+        travel += moved
+        ou, _ = _slew(ou, draining.astype(float), dt)
+        vh, th = _add(vh, th, np.where(fill_h, fill, 0.0), plant.SUPPLY_C, HEATER_CAPACITY)
+        vc, tc = _add(vc, tc, np.where(fill_c, fill, 0.0), plant.SUPPLY_C, COOLER_CAPACITY)
+        hot = np.minimum(feed * oh, vh)
+        vh -= hot
+        vm, tm = _add(vm, tm, hot, th, MAIN_CAPACITY)
+        cold = np.minimum(feed * oc, vc)
+        vc -= cold
+        vm, tm = _add(vm, tm, cold, tc, MAIN_CAPACITY)
+        vm -= np.minimum(drain * ou, vm)
+        th = np.where(vh > 0.1, th + (HEATER_TARGET_C - th) * heat, th)
+        tc = np.where(vc > 0.1, tc + (COOLER_TARGET_C - tc) * heat, tc)
+        th += (plant.AMBIENT_C - th) * loss
+        tc += (plant.AMBIENT_C - tc) * loss
+        tm += (plant.AMBIENT_C - tm) * loss
+    samples = (int(duration / dt) + every - 1) // every
+    return settle, np.maximum(overshoot, 0.0), abs_error / samples, travel
+
+
+# Search
+
+_job = None
+
+
+def _init(job):
+    global _job
+    _job = job
+
+
+def _evaluate(params):
+    # One batch in a worker: mean metrics over the scenarios, (C, 4)
+    layout, options = _job
+    e_bounds, de_bounds, out = layout.arrays(params)
+    metrics = simulate(e_bounds, de_bounds, out, layout.rules, **options)
+    return np.stack([m.mean(axis=1) for m in metrics], axis=1)
+
+
+class Tuner:
+    """Evaluates candidate parameter sets in batches across a process pool."""
+
+    def __init__(self, layout, options, weights, jobs=None, batch=64):
+        self.layout = layout
+        self.weights = np.array(weights, dtype=float)
+        self.batch = batch
+        self.pool = multiprocessing.Pool(jobs, _init, ((layout, options),))
+        self.evaluated = 0
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def evaluate(self, params):
+        """Returns the candidates, sorted and clipped, their metrics and costs."""
+        params = self.layout.clip(params)
+        chunks = [params[i:i + self.batch] for i in range(0, len(params), self.batch)]
+        metrics = np.concatenate(self.pool.map(_evaluate, chunks))
+        self.evaluated += len(params)
+        return params, metrics, metrics @ self.weights
+
+    def grid(self, levels=3, span=2.0):
+        """Every combination of levels factors from 1/span to span on each parameter."""
+        factors = np.geomspace(1 / span, span, levels)
+        combos = np.array(list(itertools.product(factors, repeat=self.layout.size)))
+        return self.evaluate(self.layout.base() * combos)
+
+    def evolve(self, population=200, generations=15, sigma=0.3, elite=0.2, seed=1, log=print):
+        """
+        A simple evolution strategy: each generation keeps the best elite
+        fraction and fills the rest with log-normal mutations of them, with
+        the mutation size shrinking as it goes.
+        """
+        rng = np.random.default_rng(seed)
+        base = self.layout.base()
+        params = base * np.exp(rng.normal(0, sigma, (population, len(base))))
+        params[0] = base
+        keep = max(1, int(population * elite))
+        seen = ([], [], [])
+        elites = None
+        for gen in range(generations):
+            params, metrics, cost = self.evaluate(params)
+            for acc, value in zip(seen, (params, metrics, cost)):
+                acc.append(value)
+            if elites is not None:
+                # Parents carry over with the metrics they already have
+                params, metrics, cost = (np.concatenate(pair) for pair in
+                                         zip(elites, (params, metrics, cost)))
+            order = np.argsort(cost)[:keep]
+            elites = (params[order], metrics[order], cost[order])
+            log("generation %2d: best cost %.3f, median %.3f" % (
+                gen, cost[order[0]], np.median(cost)))
+            parents = elites[0][rng.integers(0, keep, population - keep)]
+            params = parents * np.exp(rng.normal(0, sigma, parents.shape))
+            sigma *= 0.85
+        return tuple(np.concatenate(acc) for acc in seen)
+
+
+def _row(names, params, metrics, cost):
+    values = " ".join("%s=%.2f" % (n, p) for n, p in zip(names, params))
+    return "cost %6.3f  settle %5.0f s  overshoot %4.2f C  error %4.2f C  travel %5.2f  %s" % (
+        cost, metrics[0], metrics[1], metrics[2], metrics[3], values)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rules", default=RULES_PATH, help="base rule base (default: %(default)s)")
+    parser.add_argument("-o", "--output", help="write the best rule base here")
+    parser.add_argument("--method", choices=("evolve", "grid"), default="evolve")
+    parser.add_argument("--levels", type=int, default=3, help="grid: values per parameter")
+    parser.add_argument("--span", type=float, default=2.0, help="grid: largest factor from the base")
+    parser.add_argument("--population", type=int, default=200)
+    parser.add_argument("--generations", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--setpoints", type=float, nargs="+", default=SETPOINTS)
+    parser.add_argument("--volumes", type=float, nargs="+", default=MAIN_VOLUMES,
+                        help="initial main tank volumes, L")
+    parser.add_argument("--duration", type=float, default=900.0, help="s per scenario")
+    parser.add_argument("--band", type=float, default=0.5, help="settling band, C")
+    parser.add_argument("--weights", type=float, nargs=4, default=(1 / 60, 2.0, 4.0, 0.05),
+                        metavar=("SETTLE", "OVERSHOOT", "ERROR", "TRAVEL"),
+                        help="cost per s of settling time, per C of overshoot and of mean "
+                             "error, and per full valve stroke (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--batch", type=int, default=64, help="candidates per worker task")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--check", action="store_true",
+                        help="only compare the firmware's fixed-point inference with the "
+                             "float one; fails if they differ by more than %g %%" % CHECK_LIMIT)
+    args = parser.parse_args(argv)
+
+    spec = fuzzy_control.load_rule_base(args.rules)
+    if args.check:
+        dev, error, delta_error = check(spec)
+        print("max deviation %.3f %% at error %.2f, delta_error %.2f" % (dev, error, delta_error))
+        return 0 if dev <= CHECK_LIMIT else 1
+
+    layout = Layout(spec)
+    options = dict(setpoints=args.setpoints, volumes=args.volumes,
+                   duration=args.duration, band=args.band)
+    tuner = Tuner(layout, options, args.weights, args.jobs, args.batch)
+    start = time.time()
+    try:
+        _, base_metrics, base_cost = tuner.evaluate(layout.base())
+        if args.method == "grid":
+            params, metrics, cost = tuner.grid(args.levels, args.span)
+        else:
+            params, metrics, cost = tuner.evolve(args.population, args.generations,
+                                                 seed=args.seed)
+    finally:
+        tuner.close()
+    elapsed = time.time() - start
+
+    names = layout.names()
+    print("%d candidates x %d scenarios in %.1f s" % (
+        tuner.evaluated, len(args.setpoints) * len(args.volumes), elapsed))
+    print("base  " + _row(names, layout.base(), base_metrics[0], base_cost[0]))
+    for rank, i in enumerate(np.argsort(cost)[:args.top], 1):
+        print("%-5d " % rank + _row(names, params[i], metrics[i], cost[i]))
+
+    best = layout.spec_for(params[np.argmin(cost)])
+    fuzzy_control.FuzzyController(best)      # Must compile on the Pico
+    text = format_rule_base(best)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text, end="")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())